@@ -0,0 +1,108 @@
+"""
+Время импорта модулей функций Lambda (фаза инициализации холодного старта).
+
+Для каждой функции запускает новый интерпретатор с python -X importtime,
+импортирует lambda_function так же, как среда Lambda при холодном старте,
+и печатает общее время импорта, самые дорогие пакеты (собственное время
+импорта всех модулей пакета, без вложенных импортов других пакетов) и
+какие тяжелые зависимости загружены.
+Каждая функция импортируется в отдельном процессе: у lambda_collect и
+lambda_summarize одинаковые имена модулей.
+
+Запуск:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --repeat 10 --top 15
+    python benchmarks/bench_cold_start.py --function lambda_collect --env REDDIT_FETCHER=json
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FUNCTIONS = ("lambda_collect", "lambda_summarize")
+HEAVY_MODULES = ("boto3", "botocore", "praw", "openai", "numpy", "requests", "tenacity", "tiktoken")
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+LOADED_MARKER = "LOADED:"
+TOTAL = "<total>"
+
+
+def measure_imports(function: str, env: dict[str, str]) -> tuple[dict[str, int], list[str]]:
+    """
+    Импортирует lambda_function функции в новом интерпретаторе.
+
+    Args:
+        function: Каталог функции (lambda_collect или lambda_summarize)
+        env: Дополнительные переменные окружения
+
+    Returns:
+        tuple: (пакет -> собственное время импорта его модулей в мкс и TOTAL ->
+            общее время импорта lambda_function; загруженные тяжелые зависимости)
+    """
+    code = (
+        "import sys, lambda_function; "
+        f"print({LOADED_MARKER!r}, ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.join(ROOT, function),
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    costs = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        if name == "lambda_function":
+            costs[TOTAL] = int(match.group(2))
+        package = name.split(".")[0]
+        costs[package] = costs.get(package, 0) + int(match.group(1))
+
+    loaded = []
+    for line in result.stdout.splitlines():
+        if line.startswith(LOADED_MARKER):
+            loaded = [name for name in line[len(LOADED_MARKER):].strip().split(",") if name]
+    return costs, loaded
+
+
+def report(function: str, env: dict[str, str], repeat: int, top: int) -> None:
+    """Печатает медиану времени импорта функции и самые дорогие пакеты."""
+    runs = [measure_imports(function, env) for _ in range(repeat)]
+    packages = {name for costs, _ in runs for name in costs}
+    medians = {
+        name: statistics.median(costs.get(name, 0) for costs, _ in runs)
+        for name in packages
+    }
+    total = medians.pop(TOTAL, 0)
+
+    print(f"{function}: импорт lambda_function {total / 1000:8.1f} мс (медиана из {repeat})")
+    for name, microseconds in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:<30} {microseconds / 1000:8.1f} мс")
+    print(f"  загружены при импорте: {', '.join(runs[-1][1]) or 'нет тяжелых зависимостей'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--function", choices=FUNCTIONS, action="append", help="Функция (по умолчанию все)")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество запусков интерпретатора")
+    parser.add_argument("--top", type=int, default=10, help="Сколько самых дорогих пакетов показать")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Переменная окружения для импорта (например, REDDIT_FETCHER=json)")
+    args = parser.parse_args()
+
+    env = dict(item.split("=", 1) for item in args.env)
+    for function in args.function or FUNCTIONS:
+        report(function, env, args.repeat, args.top)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Сравнение прежнего пословного фильтра и FilterEngine на многодневном корпусе.
+
+Генерирует синтетические посты нескольких сабреддитов с разными
+распределениями score и измеряет время числовых условий и полной
+фильтрации (с проверкой на мемы) для обеих реализаций.
+
+Запуск:
+    python benchmarks/bench_filter_engine.py
+    python benchmarks/bench_filter_engine.py --posts 500000 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_collect"))
+
+from filter_engine import FilterEngine, FilterRule  # noqa: E402
+from utils import get_meme_pattern, is_meme_post  # noqa: E402
+
+# Масштаб score сабреддита: у крупных сабреддитов популярные посты набирают больше
+SUBREDDIT_SCALES = {
+    "ChatGPT": 40,
+    "OpenAI": 15,
+    "ClaudeAI": 10,
+    "Bard": 3,
+    "GeminiAI": 4,
+    "DeepSeek": 6,
+    "grok": 2,
+}
+
+
+def make_corpus(total_posts: int) -> list[dict]:
+    """Формирует синтетический корпус постов с распределением Парето."""
+    subreddits = list(SUBREDDIT_SCALES)
+    corpus = []
+    for index in range(total_posts):
+        subreddit = random.choice(subreddits)
+        scale = SUBREDDIT_SCALES[subreddit]
+        corpus.append({
+            "id": f"x{index:07d}",
+            "subreddit": subreddit,
+            "created_utc": 1_700_000_000 + index,
+            "score": int(random.paretovariate(1.2) * scale) - scale,
+            "num_comments": int(random.paretovariate(1.4) * scale / 2),
+            "title": "Synthetic post about model context windows",
+            "selftext": "Lorem ipsum dolor sit amet " * random.randint(0, 10),
+            "link_flair_text": None,
+            "post_hint": None,
+            "url": "https://example.com",
+        })
+    return corpus
+
+
+def legacy_popular(posts: list[dict], min_score: int = 30, min_comments: int = 30) -> list[dict]:
+    """Прежние числовые условия: проверка каждого словаря в цикле Python."""
+    return [
+        post for post in posts
+        if post.get("score", 0) >= min_score or post.get("num_comments", 0) >= min_comments
+    ]
+
+
+def legacy_filter(posts: list[dict]) -> list[dict]:
+    """Прежняя полная фильтрация с проверкой на мемы."""
+    meme_pattern = get_meme_pattern()
+    return [post for post in legacy_popular(posts) if not is_meme_post(post, meme_pattern)]
+
+
+def measure(label: str, func, repeat: int) -> list:
+    """Запускает функцию repeat раз и печатает лучшее время."""
+    best = float("inf")
+    result = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<28} {best * 1000:8.1f} мс   постов: {len(result)}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=300_000, help="Количество синтетических постов")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов")
+    args = parser.parse_args()
+
+    random.seed(42)
+    corpus = make_corpus(args.posts)
+    engine = FilterEngine()
+    percentile_engine = FilterEngine(default_rule=FilterRule(
+        min_score=None, min_comments=None, top_score_percent=5, top_comments_percent=5
+    ))
+
+    print(f"Фильтрация {args.posts} постов, лучший из {args.repeat}:")
+    legacy = measure("legacy: числовые условия", lambda: legacy_popular(corpus), args.repeat)
+    mask = measure("engine: числовые условия", lambda: engine.popularity_mask(corpus).nonzero()[0], args.repeat)
+    assert len(legacy) == len(mask)
+
+    measure("legacy: полная фильтрация", lambda: legacy_filter(corpus), args.repeat)
+    measure("engine: полная фильтрация", lambda: engine.filter(corpus), args.repeat)
+    measure("engine: top 5% сабреддита", lambda: percentile_engine.filter(corpus), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
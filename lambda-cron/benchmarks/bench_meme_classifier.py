@@ -0,0 +1,125 @@
+"""
+Сравнение прежнего классификатора мемов (подстроки) и скомпилированного выражения.
+
+Генерирует синтетический корпус постов и измеряет время is_meme_post на
+весь корпус для обеих реализаций, а также считает посты, которые прежняя
+версия ошибочно отбрасывала из-за совпадений внутри слов ("lollipop", "controlling").
+
+Запуск:
+    python benchmarks/bench_meme_classifier.py
+    python benchmarks/bench_meme_classifier.py --posts 200000 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_collect"))
+
+from utils import get_meme_pattern, is_meme_post  # noqa: E402
+
+LEGACY_MEME_KEYWORDS = [
+    "meme", "joke", "funny", "lol", "lmao", "rofl", "humor", "humour",
+    "shitpost", "shit post", "memeing", "jk", "just kidding", "trolling",
+]
+
+WORDS = (
+    "model context window prompt token latency api release update protocol "
+    "benchmark reasoning agent tool openai claude gemini grok deepseek code "
+    "python developer paper research dataset training inference gpu price "
+    "subscription plan limit feature voice image video search memory"
+).split()
+MEME_WORDS = ["meme", "lol", "funny", "joke", "lmao", "jk"]
+# Обычные слова, внутри которых встречаются ключевые слова мемов
+INNER_MATCH_WORDS = ["controlling", "lollipop", "memento", "rjk"]
+FLAIRS = [None, None, None, "Discussion", "News", "Funny", "Use cases", "Educational Purpose Only"]
+
+
+def legacy_is_meme_post(post: dict) -> bool:
+    """Прежняя реализация: отдельный поиск подстроки для каждого ключевого слова."""
+    title_lower = (post.get("title") or "").lower()
+    selftext_lower = (post.get("selftext") or "").lower()
+    link_flair_text = (post.get("link_flair_text") or "").lower()
+
+    for keyword in LEGACY_MEME_KEYWORDS:
+        if keyword in title_lower or keyword in selftext_lower:
+            return True
+
+    if "meme" in link_flair_text or "humor" in link_flair_text or "funny" in link_flair_text:
+        return True
+
+    if post.get("post_hint") == "image":
+        if any(ext in post.get("url", "").lower() for ext in [".gif", ".jpg", ".jpeg", ".png"]):
+            if len(selftext_lower) < 100:
+                return True
+
+    return False
+
+
+def make_text(words: int) -> str:
+    """Формирует текст из случайных слов, изредка добавляя слово-мем."""
+    tokens = random.choices(WORDS, k=words)
+    if tokens and random.random() < 0.05:
+        tokens[random.randrange(len(tokens))] = random.choice(MEME_WORDS)
+    if tokens and random.random() < 0.02:
+        tokens[random.randrange(len(tokens))] = random.choice(INNER_MATCH_WORDS)
+    return " ".join(tokens)
+
+
+def make_corpus(total_posts: int) -> list[dict]:
+    """Формирует синтетический корпус постов."""
+    corpus = []
+    for index in range(total_posts):
+        post_hint = random.choice([None, "self", "image", "link"])
+        corpus.append({
+            "id": f"x{index:06d}",
+            "title": make_text(random.randint(4, 16)),
+            "selftext": make_text(random.choice([0, 0, 20, 80, 300])),
+            "link_flair_text": random.choice(FLAIRS),
+            "post_hint": post_hint,
+            "url": f"https://i.redd.it/x{index}.png" if post_hint == "image" else f"https://example.com/{index}",
+        })
+    return corpus
+
+
+def measure(label: str, func, corpus: list[dict], repeat: int) -> list[bool]:
+    """Прогоняет классификатор по корпусу repeat раз и печатает лучшее время."""
+    best = float("inf")
+    result = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = [func(post) for post in corpus]
+        best = min(best, time.perf_counter() - start)
+
+    print(f"{label:<10} {best * 1000:8.1f} мс   {best / len(corpus) * 1e6:6.2f} мкс/пост   "
+          f"мемов: {sum(result)}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=100_000, help="Количество синтетических постов")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов")
+    args = parser.parse_args()
+
+    random.seed(42)
+    corpus = make_corpus(args.posts)
+    meme_pattern = get_meme_pattern()
+
+    print(f"Классификация {args.posts} постов, лучший из {args.repeat}:")
+    legacy = measure("legacy", legacy_is_meme_post, corpus, args.repeat)
+    compiled = measure("compiled", lambda post: is_meme_post(post, meme_pattern), corpus, args.repeat)
+
+    false_positives = sum(1 for old, new in zip(legacy, compiled) if old and not new)
+    print(f"\nПостов, которые прежняя версия отбрасывала из-за совпадений внутри слов: {false_positives}")
+
+    # Обычные посты - худший случай: текст просматривается целиком
+    regular = [post for post, old in zip(corpus, legacy) if not old]
+    print(f"\nТолько посты без совпадений ({len(regular)}):")
+    measure("legacy", legacy_is_meme_post, regular, args.repeat)
+    measure("compiled", lambda post: is_meme_post(post, meme_pattern), regular, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
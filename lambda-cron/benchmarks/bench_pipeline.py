@@ -0,0 +1,525 @@
+"""
+Сквозной бенчмарк конвейера на локальных заменах Reddit, OpenAI и S3.
+
+Запускает collect_posts -> filter_collected_posts -> generate_digest -> маршруты
+веб-интерфейса на синтетических корпусах 1x, 10x и 100x от дневного объема
+(DAILY_VOLUME - посты сабреддитов по умолчанию за день; корпус растет
+количеством сабреддитов, потому что листинг Reddit отдает не больше 1000
+постов). Reddit и OpenAI заменяются HTTP-серверами в этом процессе
+(REDDIT_API_BASE_URL/REDDIT_TOKEN_URL с REDDIT_FETCHER=json и OPENAI_BASE_URL),
+хранилище - локальный каталог (STORAGE_BACKEND=local) или эмулятор S3
+(--storage s3 --s3-endpoint, например moto_server или MinIO).
+
+Каждый этап выполняется в отдельном процессе: у функций одинаковые имена
+модулей (utils, storage, posts_storage), а пиковый RSS процесса - это
+пиковая память этапа. Для этапов печатаются wall time, пиковый RSS,
+количество запросов к Reddit, OpenAI и хранилищу. Результаты сохраняются
+в JSON (--output) и сравниваются с результатами другого коммита (--compare).
+
+Лимит запросов к Reddit отключен (REDDIT_REQUESTS_PER_MINUTE), кэш ответов
+модели выключен: измеряется код конвейера, а не квота Reddit и не кэш.
+
+Запуск:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --scales 1 10 --openai-latency 0.5
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --compare before.json
+    python benchmarks/bench_pipeline.py --storage s3 --s3-endpoint http://127.0.0.1:5000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+WEB_ROOT = os.path.join(ROOT, "..", "lambda-web")
+
+# Постов в день у сабреддитов по умолчанию (REDDIT_SUBREDDITS) - масштаб 1x
+DAILY_VOLUME = {
+    "ChatGPT": 900,
+    "OpenAI": 250,
+    "ClaudeAI": 300,
+    "Bard": 40,
+    "GeminiAI": 150,
+    "DeepSeek": 120,
+    "grok": 100,
+}
+STAGES = ("collect", "filter", "summarize", "web")
+STORAGE_METHODS = (
+    "get", "get_range", "stream", "put", "head", "list_keys", "list_objects", "delete",
+    "create_multipart_upload", "upload_part", "complete_multipart_upload", "abort_multipart_upload",
+)
+RESULT_MARKER = "BENCH_RESULT:"
+
+WORDS = (
+    "the model context window prompt token latency api release update claude gpt gemini "
+    "grok deepseek reasoning agent code python benchmark users feature image voice memory "
+    "subscription plan limit pricing open source weights fine tuning inference hallucination"
+).split()
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def get_subreddits(scale: int) -> dict[str, int]:
+    """
+    Возвращает сабреддиты корпуса и количество их постов за день.
+
+    Args:
+        scale: Масштаб корпуса относительно DAILY_VOLUME
+
+    Returns:
+        dict: Название сабреддита -> постов за день
+    """
+    subreddits = {}
+    for copy in range(scale):
+        for name, posts in DAILY_VOLUME.items():
+            subreddits[name if copy == 0 else f"{name}{copy}"] = posts
+    return subreddits
+
+
+def get_yesterday_window() -> tuple[int, int]:
+    """Возвращает вчерашний день по берлинскому времени (окно сбора) в UTC timestamp."""
+    now = datetime.now(ZoneInfo("Europe/Berlin"))
+    start = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(start.timestamp()), int(start.replace(hour=23, minute=59, second=59).timestamp())
+
+
+class Counters:
+    """Потокобезопасные счетчики запросов к заменам API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values: dict[str, int] = {}
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.values)
+
+
+class FakeRedditHandler(BaseHTTPRequestHandler):
+    """
+    Листинги /r/{subreddit}/new, /api/info и OAuth токен.
+
+    Посты генерируются детерминированно по названию сабреддита и номеру,
+    поэтому корпус 100x не хранится в памяти сервера.
+    """
+
+    server: "FakeServer"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def send_json(self, data: dict) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.counters.add("reddit.token")
+        self.send_json({"access_token": "bench", "token_type": "bearer", "expires_in": 3600})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        match = re.fullmatch(r"/r/([^/]+)/new", url.path)
+        if match:
+            self.server.counters.add("reddit.listing")
+            after = query.get("after", [None])[0]
+            self.send_json(self.listing(match.group(1), after, int(query.get("limit", [100])[0])))
+        elif url.path == "/api/info":
+            self.server.counters.add("reddit.info")
+            self.send_json({"kind": "Listing", "data": {"after": None, "children": []}})
+        else:
+            self.send_error(404)
+
+    def listing(self, subreddit: str, after: str | None, limit: int) -> dict:
+        subreddits = self.server.corpus["subreddits"]
+        if subreddit not in subreddits:
+            return {"kind": "Listing", "data": {"after": None, "children": []}}
+
+        total = subreddits[subreddit]
+        position = list(subreddits).index(subreddit)
+        first = int(after[-6:]) + 1 if after else 0
+        children = [
+            {"kind": "t3", "data": self.make_post(subreddit, position, index, total)}
+            for index in range(first, min(first + limit, total))
+        ]
+        next_after = children[-1]["data"]["name"] if children and first + limit < total else None
+        return {"kind": "Listing", "data": {"after": next_after, "before": None, "children": children}}
+
+    def make_post(self, subreddit: str, position: int, index: int, total: int) -> dict:
+        """Формирует пост листинга: от новых к старым, равномерно по окну сбора."""
+        start_ts, end_ts = self.server.corpus["window"]
+        rnd = random.Random(f"{subreddit}:{index}")
+        # id из букв и цифр, как у Reddit: по нему ищутся кросс-посты
+        post_id = f"b{position:04d}x{index:06d}"
+        # Частые слова вперемешку со случайными, чтобы заголовки разных постов не
+        # считались почти одинаковыми при поиске дубликатов
+        words = [
+            rnd.choice(WORDS) if rnd.random() < 0.5 else "".join(rnd.choices(LETTERS, k=rnd.randint(3, 9)))
+            for _ in range(rnd.randint(5, 14))
+        ]
+        return {
+            "id": post_id,
+            "name": f"t3_{post_id}",
+            "created_utc": end_ts - (index + 1) * (end_ts - start_ts) // (total + 1),
+            "title": " ".join(words).capitalize(),
+            "selftext": " ".join(rnd.choice(WORDS) for _ in range(rnd.choice([0, 0, 30, 80, 200]))),
+            "score": int(rnd.paretovariate(0.8)) - 1,
+            "num_comments": int(rnd.paretovariate(1.0)) - 1,
+            "permalink": f"/r/{subreddit}/comments/{post_id}/synthetic_post/",
+            "author": f"user_{rnd.randint(0, 50000)}",
+            "link_flair_text": rnd.choice([None, "Discussion", "News", "Funny"]),
+            "url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+            "post_hint": rnd.choice([None, "self", "link"]),
+        }
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    POST /v1/chat/completions с настраиваемой задержкой ответа.
+
+    На запрос описаний (response_format json_object) возвращает описание для
+    каждого id из промпта, на остальные - короткий Markdown.
+    """
+
+    server: "FakeServer"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        prompt = "".join(message["content"] for message in request["messages"])
+        self.server.counters.add("openai.chat")
+        self.server.counters.add("openai.prompt_chars", len(prompt))
+        time.sleep(self.server.corpus["openai_latency"])
+
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            ids = re.findall(r'"id":"([^"]+)"', prompt)
+            content = json.dumps({post_id: "Синтетическое описание поста." for post_id in ids}, ensure_ascii=False)
+        else:
+            content = "## Тренды\n\n" + "\n".join(f"{index}. **Тренд {index}** - описание." for index in range(1, 6))
+
+        body = json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeServer(ThreadingHTTPServer):
+    """HTTP-сервер замены API в фоновом потоке."""
+
+    daemon_threads = True
+
+    def __init__(self, handler: type, corpus: dict, counters: Counters):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.corpus = corpus
+        self.counters = counters
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def count_storage_calls(storage_module) -> dict[str, int]:
+    """
+    Считает вызовы методов хранилища в процессе этапа.
+
+    Args:
+        storage_module: Модуль storage функции
+
+    Returns:
+        dict: Метод -> количество вызовов (заполняется по мере работы этапа)
+    """
+    counts = {}
+    lock = threading.Lock()
+    backend_class = type(storage_module.get_storage())
+
+    def wrap(name: str, method):
+        def counted(self, *args, **kwargs):
+            with lock:
+                counts[name] = counts.get(name, 0) + 1
+            return method(self, *args, **kwargs)
+        return counted
+
+    for name in STORAGE_METHODS:
+        setattr(backend_class, name, wrap(name, getattr(backend_class, name)))
+    return counts
+
+
+def run_stage(stage: str) -> dict:
+    """
+    Выполняет этап в текущем процессе (режим --worker).
+
+    Параметры предыдущих этапов (дата, ключи) передаются через BENCH_* переменные окружения.
+
+    Args:
+        stage: Этап
+
+    Returns:
+        dict: Результат этапа
+    """
+    if stage == "web":
+        sys.path.insert(0, WEB_ROOT)
+        from fastapi.testclient import TestClient
+        from src import storage
+        from src.web_app import app
+
+        storage_calls = count_storage_calls(storage)
+        started = time.perf_counter()
+        client = TestClient(app)
+        date = os.environ["BENCH_DATE"]
+        routes = {}
+        for path in ("/", f"/digest/{date}", "/api/digests", f"/api/digest/{date}", "/archive"):
+            route_started = time.perf_counter()
+            response = client.get(path)
+            if response.status_code != 200:
+                raise Exception(f"{path} вернул {response.status_code}")
+            routes[path] = round(time.perf_counter() - route_started, 4)
+        return {"wall_s": time.perf_counter() - started, "storage_calls": storage_calls, "routes": routes}
+
+    directory = "lambda_summarize" if stage == "summarize" else "lambda_collect"
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    import storage
+
+    storage_calls = count_storage_calls(storage)
+    started = time.perf_counter()
+    if stage == "collect":
+        from fetch_posts import collect_posts
+
+        result = collect_posts()
+        items = result["total_posts"]
+    elif stage == "filter":
+        from filter_posts import filter_collected_posts
+
+        result = filter_collected_posts(os.environ["BENCH_DATE"])
+        items = result["total_filtered"]
+    else:
+        from summarize import generate_digest
+
+        result = generate_digest(
+            os.environ["BENCH_DATE"],
+            os.environ["BENCH_FILTERED_KEY"],
+            os.environ["BENCH_ALL_KEY"],
+            force=True,
+        )
+        items = result["total_all_posts"]
+    return {
+        "wall_s": time.perf_counter() - started,
+        "storage_calls": storage_calls,
+        "items": items,
+        "result": result,
+    }
+
+
+def run_worker(stage: str) -> None:
+    """Выполняет этап и печатает результат с пиковым RSS процесса."""
+    result = run_stage(stage)
+    # ru_maxrss в Linux - в килобайтах
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(RESULT_MARKER + json.dumps(result, ensure_ascii=False, default=str))
+
+
+def run_scale(scale: int, args: argparse.Namespace) -> dict[str, dict]:
+    """
+    Прогоняет конвейер на корпусе одного масштаба.
+
+    Args:
+        scale: Масштаб корпуса
+        args: Аргументы командной строки
+
+    Returns:
+        dict: Этап -> метрики
+    """
+    subreddits = get_subreddits(scale)
+    corpus = {"subreddits": subreddits, "window": get_yesterday_window(), "openai_latency": args.openai_latency}
+    counters = Counters()
+    reddit = FakeServer(FakeRedditHandler, corpus, counters)
+    openai = FakeServer(FakeOpenAIHandler, corpus, counters)
+    storage_dir = tempfile.mkdtemp(prefix=f"bench_pipeline_{scale}x_")
+
+    env = {
+        **os.environ,
+        "REDDIT_FETCHER": "json",
+        "REDDIT_API_BASE_URL": reddit.url,
+        "REDDIT_TOKEN_URL": f"{reddit.url}/api/v1/access_token",
+        "REDDIT_CLIENT_ID": "bench",
+        "REDDIT_CLIENT_SECRET": "bench",
+        "REDDIT_USER_AGENT": "bench",
+        "REDDIT_SUBREDDITS": ",".join(subreddits),
+        "REDDIT_REQUESTS_PER_MINUTE": "1000000",
+        "REDDIT_MAX_WORKERS": str(args.reddit_workers),
+        "INCREMENTAL_COLLECTION": "false",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai.url}/v1",
+        "LLM_CACHE_ENABLED": "false",
+    }
+    if args.storage == "s3":
+        import boto3
+
+        bucket_name = f"bench-pipeline-{scale}x-{int(time.time())}"
+        boto3.client("s3", endpoint_url=args.s3_endpoint).create_bucket(Bucket=bucket_name)
+        env.update(STORAGE_BACKEND="s3", AWS_ENDPOINT_URL_S3=args.s3_endpoint, S3_BUCKET_NAME=bucket_name)
+    else:
+        env.update(STORAGE_BACKEND="local", LOCAL_STORAGE_DIR=storage_dir)
+
+    print(f"\nМасштаб {scale}x: {len(subreddits)} сабреддитов, {sum(subreddits.values())} постов"
+          f" ({'S3 ' + args.s3_endpoint if args.storage == 's3' else storage_dir})")
+    results = {}
+    try:
+        for stage in STAGES:
+            before = counters.snapshot()
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", stage],
+                # Веб-приложение находит шаблоны и статику относительно каталога lambda-web
+                cwd=WEB_ROOT if stage == "web" else ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if args.verbose or process.returncode != 0:
+                print(process.stdout[-20000:], process.stderr[-20000:], sep="\n")
+            if process.returncode != 0:
+                raise SystemExit(f"Этап {stage} завершился ошибкой (код {process.returncode})")
+
+            line = next(line for line in process.stdout.splitlines() if line.startswith(RESULT_MARKER))
+            result = json.loads(line[len(RESULT_MARKER):])
+            after = counters.snapshot()
+            calls = {name: value - before.get(name, 0) for name, value in after.items()}
+            results[stage] = {
+                "wall_s": round(result["wall_s"], 3),
+                "peak_rss_mb": round(result["peak_rss_mb"], 1),
+                "items": result.get("items"),
+                "reddit_requests": sum(value for name, value in calls.items() if name.startswith("reddit.")),
+                "openai_requests": calls.get("openai.chat", 0),
+                "openai_prompt_chars": calls.get("openai.prompt_chars", 0),
+                "storage_calls": result["storage_calls"],
+                **({"routes": result["routes"]} if "routes" in result else {}),
+            }
+
+            stage_result = result.get("result") or {}
+            if stage == "collect":
+                env["BENCH_DATE"] = stage_result["date"]
+                env["BENCH_FILTERED_KEY"] = stage_result["filter_result"]["filtered_posts_s3_key"]
+                env["BENCH_ALL_KEY"] = stage_result["s3_key"]
+    finally:
+        reddit.shutdown()
+        openai.shutdown()
+        if not args.keep:
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print_results(results)
+    return results
+
+
+def print_results(results: dict[str, dict]) -> None:
+    """Печатает таблицу метрик этапов."""
+    print(f"  {'этап':<10} {'wall, с':>9} {'RSS, МБ':>9} {'постов':>8} {'Reddit':>7} {'OpenAI':>7} {'хранилище':>10}")
+    for stage, metrics in results.items():
+        print(f"  {stage:<10} {metrics['wall_s']:9.2f} {metrics['peak_rss_mb']:9.1f} "
+              f"{metrics['items'] if metrics['items'] is not None else '-':>8} "
+              f"{metrics['reddit_requests']:>7} {metrics['openai_requests']:>7} "
+              f"{sum(metrics['storage_calls'].values()):>10}")
+        for path, seconds in metrics.get("routes", {}).items():
+            print(f"    {path:<28} {seconds * 1000:8.1f} мс")
+
+
+def print_comparison(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    """Печатает изменение wall time и пикового RSS относительно сохраненных результатов."""
+    print("\nСравнение с базовыми результатами (изменение wall time / RSS):")
+    for scale, stages in results.items():
+        for stage, metrics in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if not base:
+                continue
+            wall = (metrics["wall_s"] / base["wall_s"] - 1) * 100 if base["wall_s"] else 0.0
+            rss = (metrics["peak_rss_mb"] / base["peak_rss_mb"] - 1) * 100 if base["peak_rss_mb"] else 0.0
+            print(f"  {scale + 'x':>5} {stage:<10} {base['wall_s']:8.2f} -> {metrics['wall_s']:8.2f} с ({wall:+6.1f}%)"
+                  f"   {base['peak_rss_mb']:7.1f} -> {metrics['peak_rss_mb']:7.1f} МБ ({rss:+6.1f}%)")
+
+
+def get_commit() -> str | None:
+    """Возвращает текущий коммит репозитория (для сохраненных результатов)."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100],
+                        help="Масштабы корпуса относительно дневного объема")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Задержка ответа замены OpenAI, с")
+    parser.add_argument("--reddit-workers", type=int, default=1, help="REDDIT_MAX_WORKERS")
+    parser.add_argument("--storage", choices=("local", "s3"), default="local", help="Хранилище")
+    parser.add_argument("--s3-endpoint", help="Адрес эмулятора S3 для --storage s3")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="Сравнить с результатами из JSON (--output другого коммита)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять каталог хранилища после прогона")
+    parser.add_argument("--verbose", action="store_true", help="Печатать вывод этапов")
+    parser.add_argument("--worker", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+    if args.storage == "s3" and not args.s3_endpoint:
+        parser.error("для --storage s3 нужен --s3-endpoint")
+
+    results = {str(scale): run_scale(scale, args) for scale in args.scales}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"commit": get_commit(), "args": vars(args), "results": results}, f, ensure_ascii=False, indent=2
+            )
+        print(f"\nРезультаты сохранены в {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print_comparison(results, baseline["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Сравнение форматов хранения постов: размер объектов и время разбора.
+
+Генерирует синтетические дни постов (по умолчанию месяц по 5000 постов)
+и для каждого формата измеряет суммарный размер объектов, время записи и
+время полного разбора. Разбор NDJSON выполняется тем же кодом, что и
+чтение из S3 (posts_storage.iter_ndjson_lines), частями по 1 МБ.
+
+Запуск:
+    python benchmarks/bench_posts_storage.py
+    python benchmarks/bench_posts_storage.py --days 7 --posts-per-day 20000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_collect"))
+
+from posts_storage import (  # noqa: E402
+    FOOTER_FIELD,
+    FORMAT_VERSION,
+    FORMAT_VERSION_FIELD,
+    GZIP_LEVEL,
+    HEADER_FIELD,
+    encode_ndjson_line,
+    iter_ndjson_lines,
+)
+
+CHUNK_SIZE = 1024 * 1024
+SUBREDDITS = ["ChatGPT", "OpenAI", "ClaudeAI", "Bard", "GeminiAI", "DeepSeek", "grok"]
+WORDS = (
+    "the model context window prompt token latency api release update claude gpt gemini "
+    "grok deepseek reasoning agent code python benchmark users feature image voice memory "
+    "subscription plan limit pricing open source weights fine tuning inference hallucination "
+    "это модель ответ запрос"
+).split()
+# Случайные слова, чтобы текст не сжимался лучше настоящего
+_words_random = random.Random(0)
+RANDOM_WORDS = [
+    "".join(_words_random.choices("abcdefghijklmnopqrstuvwxyz", k=_words_random.randint(2, 10)))
+    for _ in range(5000)
+]
+
+
+def make_text(words: int) -> str:
+    """Формирует текст из частых и случайных слов."""
+    return " ".join(
+        random.choice(WORDS) if random.random() < 0.5 else random.choice(RANDOM_WORDS)
+        for _ in range(words)
+    )
+
+
+def make_post(index: int, created_utc: int) -> dict:
+    """Формирует пост в формате all_posts с текстом реалистичной длины."""
+    post_id = f"{index:07x}"
+    subreddit = random.choice(SUBREDDITS)
+    selftext_words = random.choice([0, 0, 0, 30, 80, 200, 600])
+    return {
+        "id": post_id,
+        "created_utc": created_utc,
+        "title": make_text(random.randint(5, 18)).capitalize(),
+        "selftext": make_text(selftext_words),
+        "score": int(random.paretovariate(1.2)) - 1,
+        "num_comments": int(random.paretovariate(1.4)) - 1,
+        "permalink": f"https://reddit.com/r/{subreddit}/comments/{post_id}/synthetic_post/",
+        "author": f"user_{random.randint(0, 50000)}",
+        "link_flair_text": random.choice([None, "Discussion", "News", "Use cases", "Other"]),
+        "subreddit": subreddit,
+        "url": random.choice([
+            f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/synthetic_post/",
+            f"https://i.redd.it/{post_id}.png",
+            f"https://example.com/articles/{post_id}",
+        ]),
+        "post_hint": random.choice([None, "self", "image", "link"]),
+    }
+
+
+def make_day(day: int, posts_per_day: int) -> dict:
+    """Формирует документ all_posts за один день."""
+    start = 1_704_067_200 + day * 86400
+    posts = [make_post(day * posts_per_day + index, start + index % 86400) for index in range(posts_per_day)]
+    return {
+        "date": time.strftime("%Y-%m-%d", time.gmtime(start)),
+        "start_time": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(start)),
+        "end_time": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(start + 86399)),
+        "total_posts": len(posts),
+        "posts": posts,
+    }
+
+
+def encode_json(document: dict) -> bytes:
+    """Прежний формат: JSON документ с отступами (utils.upload_to_s3)."""
+    return json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def encode_ndjson(document: dict) -> bytes:
+    """NDJSON: заголовок, по посту в строке, итоговая строка."""
+    header = {
+        FORMAT_VERSION_FIELD: FORMAT_VERSION,
+        "date": document["date"],
+        "start_time": document["start_time"],
+        "end_time": document["end_time"],
+    }
+    lines = [encode_ndjson_line({HEADER_FIELD: header})]
+    lines.extend(encode_ndjson_line(post) for post in document["posts"])
+    lines.append(encode_ndjson_line({FOOTER_FIELD: {"total_posts": document["total_posts"]}}))
+    return b"".join(lines)
+
+
+def parse_json(data: bytes) -> int:
+    return len(json.loads(data.decode("utf-8"))["posts"])
+
+
+def parse_ndjson(data: bytes, gzipped: bool) -> int:
+    chunks = (data[offset:offset + CHUNK_SIZE] for offset in range(0, len(data), CHUNK_SIZE))
+    return sum(
+        1 for record in iter_ndjson_lines(chunks, gzipped)
+        if HEADER_FIELD not in record and FOOTER_FIELD not in record
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=30, help="Количество дней")
+    parser.add_argument("--posts-per-day", type=int, default=5000, help="Постов в день")
+    args = parser.parse_args()
+
+    random.seed(42)
+    days = [make_day(day, args.posts_per_day) for day in range(args.days)]
+    total_posts = args.days * args.posts_per_day
+
+    formats = {
+        "json (indent=2)": (encode_json, parse_json),
+        "ndjson": (encode_ndjson, lambda data: parse_ndjson(data, False)),
+        "ndjson.gz": (
+            lambda document: gzip.compress(encode_ndjson(document), compresslevel=GZIP_LEVEL),
+            lambda data: parse_ndjson(data, True),
+        ),
+    }
+
+    print(f"{args.days} дней по {args.posts_per_day} постов ({total_posts} постов):")
+    print(f"{'формат':<18} {'размер, МБ':>11} {'запись, с':>10} {'разбор, с':>10} {'мкс/пост':>9}")
+    baseline_size = None
+    for label, (encode, parse) in formats.items():
+        start = time.perf_counter()
+        objects = [encode(document) for document in days]
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed = sum(parse(data) for data in objects)
+        parse_time = time.perf_counter() - start
+        assert parsed == total_posts
+
+        size = sum(len(data) for data in objects)
+        baseline_size = baseline_size or size
+        print(f"{label:<18} {size / 1024 / 1024:>11.1f} {encode_time:>10.2f} {parse_time:>10.2f} "
+              f"{parse_time / total_posts * 1e6:>9.1f}   ({size / baseline_size:.0%} от json)")
+
+
+if __name__ == "__main__":
+    main()
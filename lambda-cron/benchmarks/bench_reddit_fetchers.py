@@ -0,0 +1,214 @@
+"""
+Сравнение PRAW и легковесного JSON-клиента при разборе листингов Reddit.
+
+Офлайн-режим (по умолчанию) разбирает синтетические страницы листинга,
+по структуре совпадающие с ответом /r/{subreddit}/new, и измеряет CPU и
+wall time на 1000 постов для обоих путей. Режим --live дополнительно
+загружает реальные страницы (нужны REDDIT_CLIENT_ID и REDDIT_CLIENT_SECRET).
+
+Запуск:
+    python benchmarks/bench_reddit_fetchers.py
+    python benchmarks/bench_reddit_fetchers.py --posts 5000 --live ChatGPT
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_collect"))
+
+import praw  # noqa: E402
+
+from fetch_posts import (  # noqa: E402
+    LISTING_PAGE_SIZE,
+    _submission_to_post,
+    fetch_listing_page,
+)
+from reddit_json import RedditJSONClient, listing_item_to_post  # noqa: E402
+
+
+def make_listing_item(index: int, subreddit_name: str) -> dict:
+    """Формирует элемент листинга с набором полей, близким к реальному ответу Reddit."""
+    post_id = f"x{index:06d}"
+    data = {
+        "id": post_id,
+        "name": f"t3_{post_id}",
+        "subreddit": subreddit_name,
+        "subreddit_id": "t5_abcdef",
+        "subreddit_name_prefixed": f"r/{subreddit_name}",
+        "title": f"Synthetic post {index} about model context windows",
+        "selftext": "Lorem ipsum dolor sit amet. " * random.randint(0, 40),
+        "selftext_html": None,
+        "author": f"user_{index % 500}",
+        "author_fullname": f"t2_{index % 500:05d}",
+        "created": 1_700_000_000 - index * 30,
+        "created_utc": 1_700_000_000 - index * 30,
+        "score": random.randint(0, 2000),
+        "ups": random.randint(0, 2000),
+        "downs": 0,
+        "upvote_ratio": 0.95,
+        "num_comments": random.randint(0, 500),
+        "permalink": f"/r/{subreddit_name}/comments/{post_id}/synthetic_post/",
+        "url": f"https://www.reddit.com/r/{subreddit_name}/comments/{post_id}/",
+        "domain": f"self.{subreddit_name}",
+        "link_flair_text": random.choice([None, "Discussion", "News", "Funny"]),
+        "link_flair_richtext": [],
+        "link_flair_css_class": None,
+        "author_flair_richtext": [],
+        "post_hint": random.choice([None, "self", "image", "link"]),
+        "is_self": True,
+        "is_video": False,
+        "over_18": False,
+        "spoiler": False,
+        "locked": False,
+        "stickied": False,
+        "archived": False,
+        "pinned": False,
+        "gilded": 0,
+        "total_awards_received": 0,
+        "all_awardings": [],
+        "awarders": [],
+        "treatment_tags": [],
+        "user_reports": [],
+        "mod_reports": [],
+        "thumbnail": "self",
+        "thumbnail_height": None,
+        "thumbnail_width": None,
+        "preview": {
+            "images": [
+                {
+                    "source": {"url": "https://preview.redd.it/x.jpg", "width": 1024, "height": 768},
+                    "resolutions": [
+                        {"url": "https://preview.redd.it/x.jpg?w=108", "width": 108, "height": 81},
+                        {"url": "https://preview.redd.it/x.jpg?w=216", "width": 216, "height": 162},
+                    ],
+                    "variants": {},
+                    "id": "abc",
+                }
+            ],
+            "enabled": False,
+        },
+        "media": None,
+        "secure_media": None,
+        "media_embed": {},
+        "secure_media_embed": {},
+        "num_crossposts": 0,
+        "send_replies": True,
+        "contest_mode": False,
+        "wls": 6,
+        "pwls": 6,
+        "whitelist_status": "all_ads",
+        "parent_whitelist_status": "all_ads",
+    }
+    return {"kind": "t3", "data": data}
+
+
+def make_listing_pages(total_posts: int, subreddit_name: str) -> list[str]:
+    """Формирует сериализованные страницы листинга по 100 постов."""
+    pages = []
+    for start in range(0, total_posts, LISTING_PAGE_SIZE):
+        children = [
+            make_listing_item(index, subreddit_name)
+            for index in range(start, min(start + LISTING_PAGE_SIZE, total_posts))
+        ]
+        listing = {
+            "kind": "Listing",
+            "data": {"after": children[-1]["data"]["name"], "before": None, "children": children},
+        }
+        pages.append(json.dumps(listing))
+    return pages
+
+
+def parse_with_praw(reddit: praw.Reddit, pages: list[str], subreddit_name: str) -> int:
+    """Путь PRAW: JSON -> Listing[Submission] -> словари постов."""
+    count = 0
+    for page in pages:
+        listing = reddit._objector.objectify(json.loads(page))
+        for submission in listing:
+            _submission_to_post(submission, subreddit_name)
+            count += 1
+    return count
+
+
+def parse_with_json(pages: list[str], subreddit_name: str) -> int:
+    """Путь RedditJSONClient: JSON -> словари постов."""
+    count = 0
+    for page in pages:
+        listing = json.loads(page)["data"]
+        for child in listing["children"]:
+            listing_item_to_post(child["data"], subreddit_name)
+            count += 1
+    return count
+
+
+def measure(label: str, func, posts: int, repeat: int) -> None:
+    """Запускает функцию repeat раз и печатает лучшее время на 1000 постов."""
+    best_wall = best_cpu = float("inf")
+    for _ in range(repeat):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        func()
+        best_cpu = min(best_cpu, time.process_time() - cpu_start)
+        best_wall = min(best_wall, time.perf_counter() - wall_start)
+
+    scale = 1000 / posts
+    print(f"{label:<10} CPU: {best_cpu * scale * 1000:8.2f} мс / 1000 постов   "
+          f"wall: {best_wall * scale * 1000:8.2f} мс / 1000 постов")
+
+
+def run_live(subreddit_name: str, pages: int) -> None:
+    """Загружает реальные страницы листинга обоими клиентами."""
+    client_id = os.environ.get("REDDIT_CLIENT_ID")
+    client_secret = os.environ.get("REDDIT_CLIENT_SECRET")
+    user_agent = os.environ.get("REDDIT_USER_AGENT", "digest-script/0.1")
+    if not client_id or not client_secret:
+        raise SystemExit("Для --live нужны REDDIT_CLIENT_ID и REDDIT_CLIENT_SECRET")
+
+    clients = {
+        "praw": praw.Reddit(client_id=client_id, client_secret=client_secret, user_agent=user_agent),
+        "json": RedditJSONClient(client_id, client_secret, user_agent),
+    }
+
+    for label, client in clients.items():
+        after = None
+        total = 0
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for _ in range(pages):
+            posts, after = fetch_listing_page(client, subreddit_name, after)
+            total += len(posts)
+            if after is None:
+                break
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        scale = 1000 / max(total, 1)
+        print(f"live {label:<5} {total} постов   CPU: {cpu * scale * 1000:8.2f} мс / 1000 постов   "
+              f"wall: {wall * scale:6.2f} с / 1000 постов")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=1000, help="Количество синтетических постов")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов")
+    parser.add_argument("--live", metavar="SUBREDDIT", help="Дополнительно измерить загрузку из Reddit")
+    parser.add_argument("--live-pages", type=int, default=10, help="Сколько страниц загрузить в режиме --live")
+    args = parser.parse_args()
+
+    random.seed(42)
+    subreddit_name = "ChatGPT"
+    pages = make_listing_pages(args.posts, subreddit_name)
+    reddit = praw.Reddit(client_id="bench", client_secret="bench", user_agent="bench")
+
+    print(f"Разбор {args.posts} синтетических постов ({len(pages)} страниц), лучший из {args.repeat}:")
+    measure("praw", lambda: parse_with_praw(reddit, pages, subreddit_name), args.posts, args.repeat)
+    measure("json", lambda: parse_with_json(pages, subreddit_name), args.posts, args.repeat)
+
+    if args.live:
+        print()
+        run_live(args.live, args.live_pages)
+
+
+if __name__ == "__main__":
+    main()
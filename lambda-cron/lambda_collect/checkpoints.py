@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+from typing import Any
+
+from utils import check_s3_key_exists, download_from_s3, upload_to_s3
+
+CHECKPOINTS_S3_KEY = "state/checkpoints.json"
+
+
+def load_checkpoints(s3_key: str = CHECKPOINTS_S3_KEY) -> dict[str, dict[str, Any]]:
+    """
+    Загружает контрольные точки инкрементального сбора из S3.
+
+    Args:
+        s3_key: Ключ в S3 с контрольными точками
+
+    Returns:
+        dict: Контрольные точки по сабреддитам
+            ({subreddit: {"created_utc": int, "fullname": str}})
+    """
+    if not check_s3_key_exists(s3_key):
+        return {}
+
+    data = download_from_s3(s3_key)
+    return data.get("subreddits", {})
+
+
+def save_checkpoints(
+    checkpoints: dict[str, dict[str, Any]], s3_key: str = CHECKPOINTS_S3_KEY
+) -> bool:
+    """
+    Сохраняет контрольные точки инкрементального сбора в S3.
+
+    Args:
+        checkpoints: Контрольные точки по сабреддитам
+        s3_key: Ключ в S3 для сохранения
+
+    Returns:
+        bool: True если успешно
+    """
+    data = {
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "subreddits": checkpoints,
+    }
+    return upload_to_s3(data, s3_key)
+
+
+def make_checkpoint(post: dict[str, Any]) -> dict[str, Any]:
+    """
+    Формирует контрольную точку из самого нового сохраненного поста.
+
+    Args:
+        post: Пост в формате all_posts
+
+    Returns:
+        dict: Контрольная точка с created_utc и fullname поста
+    """
+    return {
+        "created_utc": post["created_utc"],
+        "fullname": f"t3_{post['id']}",
+    }
+
+
+def is_known_post(
+    fullname: str, created_utc: int, checkpoint: dict[str, Any] | None
+) -> bool:
+    """
+    Проверяет, дошел ли листинг (от новых к старым) до уже сохраненных постов.
+
+    Args:
+        fullname: Fullname поста (t3_...)
+        created_utc: Время создания поста
+        checkpoint: Контрольная точка сабреддита (None - сбор с нуля)
+
+    Returns:
+        bool: True если пост и все последующие в листинге уже сохранены
+    """
+    if not checkpoint:
+        return False
+    return fullname == checkpoint["fullname"] or created_utc < checkpoint["created_utc"]
@@ -0,0 +1,482 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Callable
+
+from fetch_posts import get_subreddits, iter_subreddit_posts
+from filter_engine import FilterEngine
+from filter_posts import build_filter_result
+from posts_storage import (
+    PostsIndexWriter,
+    get_posts_index_s3_key,
+    get_posts_s3_key,
+    open_posts_document,
+    open_posts_sink,
+)
+from rate_limit import RateLimiter
+from reddit_client import create_reddit_client, get_reddit_credentials
+from storage import get_storage
+from tracing import add_counters, span, traced
+from utils import get_berlin_date_string, get_yesterday_berlin
+
+# Событие, по которому функция сбора выполняется как воркер шарда
+SHARD_ACTION = "collect_shard"
+SHARDS_S3_PREFIX = "data/shards/"
+
+DEFAULT_SHARD_SIZE = 10
+DEFAULT_MAX_CONCURRENCY = 10
+# Время ожидания отчета шарда, после которого шард считается упавшим
+DEFAULT_SHARD_TIMEOUT = 120
+# Время координатора на объединение партиций шардов после их отчетов
+MERGE_RESERVE_SECONDS = 45
+POLL_INTERVAL_SECONDS = 5
+
+
+def split_shards(subreddits: list[str], shard_size: int) -> list[list[str]]:
+    """
+    Разбивает сабреддиты на шарды с сохранением порядка.
+
+    Args:
+        subreddits: Список сабреддитов
+        shard_size: Количество сабреддитов в шарде
+
+    Returns:
+        list: Шарды
+    """
+    shard_size = max(1, shard_size)
+    return [subreddits[index:index + shard_size] for index in range(0, len(subreddits), shard_size)]
+
+
+def get_shard_s3_key(date_str: str, shard_index: int) -> str:
+    """
+    Возвращает ключ частичной партиции шарда в формате основного файла дня.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+        shard_index: Номер шарда
+
+    Returns:
+        str: Ключ в S3
+    """
+    extension = get_posts_s3_key("all_posts", date_str)[len(f"data/all_posts_{date_str}"):]
+    return f"{SHARDS_S3_PREFIX}{date_str}/all_posts_{shard_index:03d}{extension}"
+
+
+def get_shard_report_s3_key(date_str: str, shard_index: int) -> str:
+    """Возвращает ключ отчета шарда."""
+    return f"{SHARDS_S3_PREFIX}{date_str}/report_{shard_index:03d}.json"
+
+
+def get_shard_timeout() -> int:
+    """Возвращает время ожидания отчета шарда в секундах (FANOUT_SHARD_TIMEOUT)."""
+    return int(os.environ.get("FANOUT_SHARD_TIMEOUT", DEFAULT_SHARD_TIMEOUT))
+
+
+def load_shard_report(event: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    Возвращает сохраненный отчет шарда, если он относится к этому событию.
+
+    Отчет предыдущего запуска с другим окном сбора или другим составом
+    шарда не подходит.
+
+    Args:
+        event: Событие воркера
+
+    Returns:
+        dict | None: Отчет шарда или None, если отчета нет
+    """
+    content = get_storage().get(get_shard_report_s3_key(event["date"], event["shard"]))
+    if content is None:
+        return None
+    report = json.loads(content)
+    if report.get("start_time") != event["start_time"] or report.get("subreddits") != event["subreddits"]:
+        return None
+    return report
+
+
+def run_shard(event: dict[str, Any]) -> dict[str, Any]:
+    """
+    Выполняет шард и сохраняет его отчет рядом с частичной партицией.
+
+    Ошибка сбора не пробрасывается, а записывается в отчет: координатор
+    узнает о ней из отчета и сам решает, повторять ли шард, а асинхронный
+    вызов Lambda не повторяется автоматически.
+
+    Args:
+        event: Событие воркера
+
+    Returns:
+        dict: Отчет шарда (status success или error)
+    """
+    try:
+        report = collect_shard(event)
+    except Exception as e:
+        print(f"❌ Шард {event['shard']} завершился ошибкой: {e}")
+        report = {
+            "status": "error",
+            "shard": event["shard"],
+            "subreddits": event["subreddits"],
+            "error": str(e),
+        }
+    report["start_time"] = event["start_time"]
+
+    get_storage().put(
+        get_shard_report_s3_key(event["date"], event["shard"]),
+        json.dumps(report, ensure_ascii=False).encode("utf-8"),
+    )
+    return report
+
+
+@traced("collect_shard")
+def collect_shard(event: dict[str, Any]) -> dict[str, Any]:
+    """
+    Собирает посты сабреддитов одного шарда в частичную партицию дня.
+
+    Дата и период передаются координатором, поэтому все шарды собирают
+    одно и то же окно, даже если воркер запустился после полуночи.
+    Статистика не обновляется: в режиме fan-out все посты только что
+    загружены.
+
+    Args:
+        event: Событие воркера (date, start_time, end_time, shard, subreddits,
+            requests_per_minute)
+
+    Returns:
+        dict: Отчет шарда с ключом частичной партиции и количеством постов
+    """
+    date_str = event["date"]
+    shard_index = event["shard"]
+    subreddits = event["subreddits"]
+    start_time = datetime.fromisoformat(event["start_time"])
+    end_time = datetime.fromisoformat(event["end_time"])
+
+    client_id, client_secret, user_agent = get_reddit_credentials()
+    reddit = create_reddit_client(client_id, client_secret, user_agent)
+    rate_limiter = RateLimiter(event["requests_per_minute"])
+    max_workers = max(1, int(os.environ.get("REDDIT_MAX_WORKERS", "1")))
+
+    print(f"Шард {shard_index}: {', '.join(subreddits)}")
+
+    s3_key = get_shard_s3_key(date_str, shard_index)
+    sink = open_posts_sink(s3_key, {
+        "date": date_str,
+        "start_time": event["start_time"],
+        "end_time": event["end_time"],
+        "shard": shard_index,
+    })
+    try:
+        for _, posts in iter_subreddit_posts(
+            reddit, subreddits, start_time, end_time, rate_limiter, {}, max_workers
+        ):
+            sink.write_many(posts)
+    except Exception:
+        sink.abort()
+        raise
+
+    total_posts = sink.records_written
+    sink.close({"total_posts": total_posts})
+    add_counters(items=total_posts)
+
+    return {
+        "status": "success",
+        "shard": shard_index,
+        "subreddits": subreddits,
+        "s3_key": s3_key,
+        "total_posts": total_posts,
+    }
+
+
+class LocalShardExecutor:
+    """Выполняет шарды в текущем процессе (локальный запуск и тесты без AWS)."""
+
+    # Шарды выполняются в потоках координатора, время ожидания не ограничено
+    needs_time_budget = False
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+
+    def run(self, events: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Выполняет шарды параллельно в потоках.
+
+        Args:
+            events: События воркеров
+
+        Returns:
+            list: Отчеты шардов в порядке событий
+        """
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(events)),
+            thread_name_prefix="collect-shard",
+        ) as executor:
+            return list(executor.map(run_shard, events))
+
+
+class LambdaShardExecutor:
+    """
+    Выполняет шарды асинхронными вызовами функции Lambda.
+
+    Координатор не держит соединение на время работы воркера: воркеры
+    вызываются с InvocationType=Event и сохраняют отчеты в хранилище, а
+    координатор опрашивает отчеты. Шард без отчета за FANOUT_SHARD_TIMEOUT
+    считается упавшим. Частичная партиция и отчет шарда перезаписываются
+    целиком, поэтому повторный запуск шарда не дублирует посты.
+    """
+
+    needs_time_budget = True
+
+    def __init__(
+        self,
+        function_name: str,
+        max_workers: int = DEFAULT_MAX_CONCURRENCY,
+        shard_timeout: int = None,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+    ):
+        # boto3 нужен только координатору в Lambda, воркеры и локальный запуск его не загружают
+        import boto3
+
+        self.function_name = function_name
+        self.max_workers = max_workers
+        self.shard_timeout = shard_timeout or get_shard_timeout()
+        self.poll_interval = poll_interval
+        self.client = boto3.client("lambda")
+
+    def invoke(self, event: dict[str, Any]) -> None:
+        """
+        Запускает воркер шарда без ожидания результата.
+
+        Отчет предыдущей попытки удаляется, чтобы опрос не принял его за
+        результат нового запуска.
+
+        Args:
+            event: Событие воркера
+        """
+        get_storage().delete(get_shard_report_s3_key(event["date"], event["shard"]))
+        self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps(event),
+        )
+
+    def run(self, events: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Запускает воркеры шардов (не более max_workers одновременно) и ждет их отчеты.
+
+        Args:
+            events: События воркеров
+
+        Returns:
+            list: Отчеты шардов в порядке событий
+        """
+        pending = list(events)
+        running: dict[int, tuple[dict[str, Any], float]] = {}
+        reports: dict[int, dict[str, Any]] = {}
+
+        while pending or running:
+            while pending and len(running) < self.max_workers:
+                event = pending.pop(0)
+                self.invoke(event)
+                running[event["shard"]] = (event, time.monotonic())
+
+            time.sleep(self.poll_interval)
+            for shard_index, (event, started) in list(running.items()):
+                report = load_shard_report(event)
+                if report is None and time.monotonic() - started > self.shard_timeout:
+                    report = {
+                        "status": "error",
+                        "shard": shard_index,
+                        "subreddits": event["subreddits"],
+                        "error": f"нет отчета за {self.shard_timeout} с",
+                    }
+                if report is not None:
+                    reports[shard_index] = report
+                    del running[shard_index]
+
+        return [reports[event["shard"]] for event in events]
+
+
+def get_shard_executor(max_workers: int) -> LocalShardExecutor | LambdaShardExecutor:
+    """
+    Создает исполнителя шардов по переменной окружения FANOUT_EXECUTOR.
+
+    По умолчанию в Lambda шарды выполняются вызовами этой же функции
+    (AWS_LAMBDA_FUNCTION_NAME), вне Lambda - в текущем процессе.
+
+    Args:
+        max_workers: Количество одновременно выполняемых шардов
+
+    Returns:
+        Исполнитель с методом run(events)
+    """
+    function_name = os.environ.get("FANOUT_FUNCTION_NAME") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+    executor = os.environ.get("FANOUT_EXECUTOR", "lambda" if function_name else "local").lower()
+
+    if executor == "local":
+        return LocalShardExecutor(max_workers)
+    if executor == "lambda":
+        if not function_name:
+            raise ValueError("Для FANOUT_EXECUTOR=lambda нужен FANOUT_FUNCTION_NAME")
+        return LambdaShardExecutor(function_name, max_workers)
+    raise ValueError(f"Неизвестный исполнитель шардов FANOUT_EXECUTOR: {executor}")
+
+
+def check_time_budget(get_remaining_ms: Callable[[], int] | None, shard_timeout: int) -> None:
+    """
+    Проверяет, что координатор дождется шардов и успеет объединить партиции.
+
+    Args:
+        get_remaining_ms: Оставшееся время координатора (context.get_remaining_time_in_millis)
+        shard_timeout: Время ожидания отчета шарда в секундах
+
+    Raises:
+        Exception: Оставшегося времени меньше времени ожидания шарда и объединения
+    """
+    if get_remaining_ms is None:
+        return
+    remaining = get_remaining_ms() / 1000
+    if remaining < shard_timeout + MERGE_RESERVE_SECONDS:
+        raise Exception(
+            f"Координатору осталось {remaining:.0f} с, а ожидание шардов и объединение занимают до "
+            f"{shard_timeout + MERGE_RESERVE_SECONDS} с: уменьшите FANOUT_SHARD_TIMEOUT или увеличьте "
+            f"таймаут функции. Отчеты собранных шардов сохранены, следующий запуск их использует"
+        )
+
+
+@traced("collect")
+def collect_posts_fanout(
+    executor: LocalShardExecutor | LambdaShardExecutor = None,
+    get_remaining_ms: Callable[[], int] = None,
+) -> dict[str, Any]:
+    """
+    Собирает посты за вчерашний день, распределяя сабреддиты по шардам.
+
+    Координатор делит REDDIT_SUBREDDITS на шарды по FANOUT_SHARD_SIZE,
+    воркеры шардов (не более FANOUT_MAX_CONCURRENCY одновременно) пишут
+    частичные партиции и отчеты в data/shards/{date}/, после отчетов всех
+    шардов координатор потоково объединяет их в файл дня и индекс
+    отфильтрованных постов и удаляет частичные партиции. Лимит
+    REDDIT_REQUESTS_PER_MINUTE общий для приложения Reddit, поэтому он
+    делится между одновременно работающими шардами.
+
+    Упавший шард повторяется один раз. Шарды, собранные предыдущим
+    запуском за тот же день (например, если координатор не дождался
+    остальных), не собираются заново.
+
+    Args:
+        executor: Исполнитель шардов (по умолчанию get_shard_executor)
+        get_remaining_ms: Оставшееся время координатора в Lambda
+
+    Returns:
+        dict: Результат в том же формате, что и у collect_posts
+    """
+    subreddits = get_subreddits()
+    shards = split_shards(subreddits, int(os.environ.get("FANOUT_SHARD_SIZE", DEFAULT_SHARD_SIZE)))
+    max_concurrency = max(1, int(os.environ.get("FANOUT_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)))
+    concurrent_shards = min(max_concurrency, len(shards))
+    requests_per_minute = int(os.environ.get("REDDIT_REQUESTS_PER_MINUTE", "90"))
+    executor = executor or get_shard_executor(max_concurrency)
+
+    start_time, end_time = get_yesterday_berlin()
+    date_str = get_berlin_date_string()
+    header = {
+        "date": date_str,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+    }
+
+    print(f"Сбор постов за {date_str} в режиме fan-out: {len(subreddits)} сабреддитов, "
+          f"{len(shards)} шардов, до {concurrent_shards} одновременно")
+
+    events = [
+        {
+            "action": SHARD_ACTION,
+            **header,
+            "shard": index,
+            "subreddits": shard,
+            "requests_per_minute": max(1, requests_per_minute // concurrent_shards),
+        }
+        for index, shard in enumerate(shards)
+    ]
+    reports = {}
+    for event in events:
+        report = load_shard_report(event)
+        if report is not None and report["status"] == "success":
+            reports[event["shard"]] = report
+    if reports:
+        print(f"Шардов, собранных предыдущим запуском: {len(reports)}")
+
+    pending = [event for event in events if event["shard"] not in reports]
+    for attempt in range(1, 3):
+        if not pending:
+            break
+        if attempt > 1:
+            print(f"⚠️  Повтор упавших шардов: {', '.join(str(event['shard']) for event in pending)}")
+        if executor.needs_time_budget:
+            check_time_budget(get_remaining_ms, executor.shard_timeout)
+        with span("collect.shards", shards=len(pending), attempt=attempt):
+            for event, report in zip(pending, executor.run(pending)):
+                reports[event["shard"]] = report
+        pending = [event for event in pending if reports[event["shard"]]["status"] != "success"]
+
+    if pending:
+        raise Exception("Не удалось собрать шарды: " + "; ".join(
+            f"{event['shard']}: {reports[event['shard']].get('error')}" for event in pending
+        ))
+    reports = [reports[event["shard"]] for event in events]
+
+    s3_key = get_posts_s3_key("all_posts", date_str)
+    filtered_posts_key = get_posts_index_s3_key(date_str)
+    filter_engine = FilterEngine.from_env()
+
+    # Шарды объединяются в порядке REDDIT_SUBREDDITS, посты сабреддита в
+    # частичной партиции идут подряд, поэтому в памяти находится один сабреддит
+    raw_sink = open_posts_sink(s3_key, header)
+    filtered_sink = PostsIndexWriter(filtered_posts_key, s3_key, header, filter_engine.describe())
+    try:
+        for report in reports:
+            _, posts = open_posts_document(report["s3_key"])
+            for _, group in groupby(posts, key=lambda post: post["subreddit"]):
+                subreddit_posts = list(group)
+                raw_sink.write_many(subreddit_posts)
+                with span("filter.subreddit", log=False) as filter_span:
+                    filtered = filter_engine.filter(subreddit_posts)
+                    filter_span.add(items=len(subreddit_posts))
+                filtered_sink.write_many(filtered)
+    except Exception:
+        raw_sink.abort()
+        filtered_sink.abort()
+        raise
+
+    total_posts = raw_sink.records_written
+    total_filtered = filtered_sink.records_written
+    add_counters(items=total_posts)
+    raw_sink.close({"total_posts": total_posts})
+    filtered_sink.close({
+        "total_posts_collected": total_posts,
+        "total_posts_filtered": total_filtered,
+    })
+
+    storage = get_storage()
+    for report in reports:
+        storage.delete(report["s3_key"])
+        storage.delete(get_shard_report_s3_key(date_str, report["shard"]))
+
+    print(f"\nВсего собрано постов: {total_posts} из {len(shards)} шардов")
+
+    return {
+        "status": "success",
+        "date": date_str,
+        "total_posts": total_posts,
+        "new_posts": total_posts,
+        "changed_posts": 0,
+        "updated": True,
+        "s3_key": s3_key,
+        "subreddits": subreddits,
+        "shards": len(shards),
+        "filter_result": build_filter_result(
+            date_str, s3_key, filtered_posts_key, total_posts, total_filtered
+        ),
+    }
@@ -1,46 +1,196 @@
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterator
 
-import praw
 import requests
 from tenacity import (
+    RetryError,
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     stop_after_attempt,
     wait_exponential,
 )
 
+from checkpoints import (
+    is_known_post,
+    load_checkpoints,
+    make_checkpoint,
+    save_checkpoints,
+)
+from filter_engine import FilterEngine
+from filter_posts import build_filter_result
+from posts_storage import (
+    PostsIndexWriter,
+    get_posts_index_s3_key,
+    get_posts_s3_key,
+    load_posts_document,
+    open_posts_sink,
+)
+from rate_limit import RateLimiter
+from reddit_client import (
+    RedditClient,
+    create_reddit_client,
+    get_reddit_credentials,
+    get_thread_reddit_client,
+    is_retryable_reddit_error,
+)
+from reddit_json import RedditJSONClient
+from refresh_posts import refresh_post_stats
+from tracing import add_counters, record_retry, span, traced
 from utils import (
+    check_s3_key_exists,
     get_berlin_date_string,
     get_yesterday_berlin,
-    upload_to_s3,
 )
 
+# Размер страницы листинга Reddit: один HTTP-запрос на каждые 100 постов
+LISTING_PAGE_SIZE = 100
+# Reddit отдает не более 1000 постов одного листинга
+MAX_LISTING_POSTS = 1000
+
+def _submission_to_post(submission: Any, subreddit_name: str) -> dict[str, Any]:
+    """
+    Преобразует объект Submission PRAW в словарь поста.
+
+    Args:
+        submission: Пост PRAW
+        subreddit_name: Название сабреддита
+
+    Returns:
+        dict: Пост с необходимыми полями
+    """
+    return {
+        "id": submission.id,
+        "created_utc": int(submission.created_utc),
+        "title": submission.title,
+        "selftext": submission.selftext,
+        "score": submission.score,
+        "num_comments": submission.num_comments,
+        "permalink": f"https://reddit.com{submission.permalink}",
+        "author": str(submission.author) if submission.author else "[deleted]",
+        "link_flair_text": submission.link_flair_text,
+        "subreddit": subreddit_name,
+        "url": submission.url,
+        "post_hint": getattr(submission, "post_hint", None),
+    }
+
 
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type(praw.exceptions.APIException)
-    | retry_if_exception_type(requests.exceptions.RequestException),
+    retry=retry_if_exception(is_retryable_reddit_error),
+    before_sleep=record_retry,
 )
+def fetch_listing_page(
+    reddit: RedditClient,
+    subreddit_name: str,
+    after: str | None = None,
+    rate_limiter: RateLimiter | None = None,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Загружает одну страницу листинга /new начиная с курсора after.
+
+    Повторные попытки выполняются для одной страницы, поэтому сбой на
+    середине листинга не заставляет перечитывать уже загруженные страницы.
+
+    Args:
+        reddit: Клиент Reddit API (PRAW или RedditJSONClient)
+        subreddit_name: Название сабреддита
+        after: Fullname последнего поста предыдущей страницы (None - первая страница)
+        rate_limiter: Общий ограничитель частоты запросов к Reddit API
+
+    Returns:
+        tuple: (посты страницы, курсор следующей страницы или None, если страница последняя)
+    """
+    if rate_limiter is not None:
+        with span("reddit.rate_limit_wait", log=False):
+            rate_limiter.acquire()
+
+    with span("reddit.page", log=False) as page_span:
+        posts, next_after = _fetch_listing_page(reddit, subreddit_name, after)
+        page_span.add(items=len(posts))
+    return posts, next_after
+
+
+def _fetch_listing_page(
+    reddit: RedditClient,
+    subreddit_name: str,
+    after: str | None,
+) -> tuple[list[dict[str, Any]], str | None]:
+    if isinstance(reddit, RedditJSONClient):
+        try:
+            return reddit.fetch_new_page(subreddit_name, after, LISTING_PAGE_SIZE)
+        except requests.exceptions.RequestException as e:
+            print(
+                f"Ошибка API при получении страницы r/{subreddit_name} (after={after}): {e}. "
+                "Повторная попытка..."
+            )
+            raise
+
+    params = {"after": after} if after else None
+
+    try:
+        submissions = list(
+            reddit.subreddit(subreddit_name).new(limit=LISTING_PAGE_SIZE, params=params)
+        )
+    except Exception as e:
+        if is_retryable_reddit_error(e):
+            print(
+                f"Ошибка API при получении страницы r/{subreddit_name} (after={after}): {e}. "
+                "Повторная попытка..."
+            )
+        raise  # tenacity перехватит и повторит только эту страницу
+
+    posts = [_submission_to_post(submission, subreddit_name) for submission in submissions]
+    next_after = submissions[-1].fullname if len(submissions) == LISTING_PAGE_SIZE else None
+    return posts, next_after
+
+
 def fetch_subreddit_posts(
-    reddit: praw.Reddit, subreddit_name: str, start_time: datetime, end_time: datetime
+    reddit: RedditClient,
+    subreddit_name: str,
+    start_time: datetime,
+    end_time: datetime,
+    rate_limiter: RateLimiter | None = None,
+    checkpoint: dict[str, Any] | None = None,
 ) -> list[dict[str, Any]]:
     """
     Получает посты из указанного сабреддита за определенный период.
 
+    Листинг читается постранично: уже загруженные страницы сохраняются,
+    а при временной ошибке повторяется только страница с текущим курсором.
+    Если передана контрольная точка, обход листинга останавливается на первом
+    уже сохраненном посте, и возвращаются только новые посты.
+
     Args:
-        reddit: Объект PRAW Reddit
+        reddit: Клиент Reddit API (PRAW или RedditJSONClient)
         subreddit_name: Название сабреддита
         start_time: Начало периода (UTC)
         end_time: Конец периода (UTC)
+        rate_limiter: Общий ограничитель частоты запросов к Reddit API
+        checkpoint: Контрольная точка сабреддита из предыдущего запуска
 
     Returns:
         List: Список постов с необходимыми полями
     """
-    subreddit = reddit.subreddit(subreddit_name)
+    with span("reddit.subreddit", subreddit=subreddit_name) as subreddit_span:
+        posts = _fetch_subreddit_posts(
+            reddit, subreddit_name, start_time, end_time, rate_limiter, checkpoint
+        )
+        subreddit_span.add(items=len(posts))
+    return posts
+
+
+def _fetch_subreddit_posts(
+    reddit: RedditClient,
+    subreddit_name: str,
+    start_time: datetime,
+    end_time: datetime,
+    rate_limiter: RateLimiter | None,
+    checkpoint: dict[str, Any] | None,
+) -> list[dict[str, Any]]:
     posts = []
 
     start_timestamp = int(start_time.timestamp())
@@ -48,40 +198,38 @@ def fetch_subreddit_posts(
 
     try:
         processed_count = 0
-        for submission in subreddit.new(limit=1000):  # Ограничиваем до 1000 постов
-            processed_count += 1
-            if processed_count % 100 == 0:
-                print(f"  Обработано {processed_count} постов...")
-
-            created_utc = int(submission.created_utc)
-
-            if created_utc < start_timestamp:
-                break
-
-            if start_timestamp <= created_utc <= end_timestamp:
-                post_data = {
-                    "id": submission.id,
-                    "created_utc": created_utc,
-                    "title": submission.title,
-                    "selftext": submission.selftext,
-                    "score": submission.score,
-                    "num_comments": submission.num_comments,
-                    "permalink": f"https://reddit.com{submission.permalink}",
-                    "author": str(submission.author)
-                    if submission.author
-                    else "[deleted]",
-                    "link_flair_text": submission.link_flair_text,
-                    "subreddit": subreddit_name,
-                    "url": submission.url,
-                    "post_hint": getattr(submission, "post_hint", None),
-                }
-                posts.append(post_data)
-
-    except (praw.exceptions.APIException, requests.exceptions.RequestException) as e:
-        print(
-            f"Ошибка API при получении постов из r/{subreddit_name}: {e}. Повторная попытка..."
-        )
-        raise  # tenacity перехватит и повторит
+        after = None
+        reached_end = False
+
+        while not reached_end and processed_count < MAX_LISTING_POSTS:
+            page, after = fetch_listing_page(reddit, subreddit_name, after, rate_limiter)
+            add_counters(pages=1)
+
+            for post in page:
+                processed_count += 1
+                created_utc = post["created_utc"]
+
+                if created_utc < start_timestamp:
+                    reached_end = True
+                    break
+
+                if is_known_post(f"t3_{post['id']}", created_utc, checkpoint):
+                    print(f"  r/{subreddit_name}: дошли до уже собранных постов")
+                    reached_end = True
+                    break
+
+                if created_utc <= end_timestamp:
+                    posts.append(post)
+
+            if after is None:
+                reached_end = True
+
+            if not reached_end:
+                print(f"  r/{subreddit_name}: обработано {processed_count} постов...")
+
+    except RetryError as e:
+        print(f"Не удалось получить страницу r/{subreddit_name} после повторных попыток: {e}")
+        raise
     except Exception as e:
         print(f"Неизвестная ошибка при получении постов из r/{subreddit_name}: {e}")
         return []
@@ -89,32 +237,127 @@ def fetch_subreddit_posts(
     return posts
 
 
-def collect_posts() -> dict[str, Any]:
+def iter_subreddit_posts(
+    reddit: RedditClient,
+    subreddits: list[str],
+    start_time: datetime,
+    end_time: datetime,
+    rate_limiter: RateLimiter | None,
+    checkpoints: dict[str, dict[str, Any]],
+    max_workers: int,
+) -> Iterator[tuple[str, list[dict[str, Any]]]]:
     """
-    Основная функция для сбора постов за вчерашний день.
-    
-    Returns:
-        dict: Результат выполнения с информацией о собранных постах
+    Собирает посты сабреддитов и отдает их по мере готовности.
+
+    Порядок результатов всегда совпадает с порядком REDDIT_SUBREDDITS, а не с
+    порядком завершения воркеров, поэтому итоговые файлы не зависят от
+    планировщика потоков.
+
+    Args:
+        reddit: Клиент Reddit API для последовательного сбора
+        subreddits: Список сабреддитов
+        start_time: Начало периода (UTC)
+        end_time: Конец периода (UTC)
+        rate_limiter: Общий ограничитель частоты запросов к Reddit API
+        checkpoints: Контрольные точки инкрементального сбора
+        max_workers: Количество параллельных воркеров
+
+    Yields:
+        tuple: (название сабреддита, новые посты сабреддита)
     """
-    # Получаем переменные окружения
-    client_id = os.environ.get("REDDIT_CLIENT_ID")
-    client_secret = os.environ.get("REDDIT_CLIENT_SECRET")
-    user_agent = os.environ.get("REDDIT_USER_AGENT", "digest-script/0.1")
-    subreddits_str = os.environ.get("REDDIT_SUBREDDITS")
+    if max_workers == 1:
+        for subreddit_name in subreddits:
+            print(f"\nСбор постов из r/{subreddit_name}...")
+            posts = fetch_subreddit_posts(
+                reddit,
+                subreddit_name,
+                start_time,
+                end_time,
+                rate_limiter,
+                checkpoints.get(subreddit_name),
+            )
+            print(f"Найдено {len(posts)} постов")
+            yield subreddit_name, posts
+        return
+
+    # PRAW не потокобезопасен: каждый воркер создает собственный клиент
+    client_id, client_secret, user_agent = get_reddit_credentials()
+
+    def fetch_in_worker(subreddit_name: str) -> list[dict[str, Any]]:
+        print(f"Сбор постов из r/{subreddit_name}...")
+        worker_reddit = get_thread_reddit_client(client_id, client_secret, user_agent)
+        return fetch_subreddit_posts(
+            worker_reddit,
+            subreddit_name,
+            start_time,
+            end_time,
+            rate_limiter,
+            checkpoints.get(subreddit_name),
+        )
 
-    if not client_id or not client_secret:
-        raise ValueError("REDDIT_CLIENT_ID или REDDIT_CLIENT_SECRET не найдены")
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(subreddits)),
+        thread_name_prefix="reddit-collect",
+    ) as executor:
+        futures = {
+            subreddit_name: executor.submit(fetch_in_worker, subreddit_name)
+            for subreddit_name in subreddits
+        }
+
+        for subreddit_name in subreddits:
+            posts = futures[subreddit_name].result()
+            print(f"r/{subreddit_name}: найдено {len(posts)} постов")
+            yield subreddit_name, posts
+
+
+def get_subreddits() -> list[str]:
+    """
+    Возвращает список сабреддитов из переменной окружения REDDIT_SUBREDDITS.
+
+    Returns:
+        list: Названия сабреддитов
+
+    Raises:
+        ValueError: Список сабреддитов пуст
+    """
+    subreddits_str = os.environ.get("REDDIT_SUBREDDITS", "")
 
     # Парсим список сабреддитов из строки
     subreddits = [sub.strip() for sub in subreddits_str.split(",") if sub.strip()]
     if not subreddits:
         raise ValueError("Список сабреддитов пуст")
+    return subreddits
+
+
+@traced("collect")
+def collect_posts() -> dict[str, Any]:
+    """
+    Основная функция для сбора постов за вчерашний день.
+
+    Посты каждого сабреддита сразу после загрузки проходят обновление
+    статистики и фильтрацию и сразу записываются в документы all_posts и
+    posts, поэтому оба файла создаются за один проход, без повторного
+    чтения all_posts из S3.
+    
+    Returns:
+        dict: Результат выполнения с информацией о собранных и отфильтрованных постах
+    """
+    # Получаем переменные окружения
+    client_id, client_secret, user_agent = get_reddit_credentials()
+    subreddits = get_subreddits()
+
+    incremental = os.environ.get("INCREMENTAL_COLLECTION", "false").lower() == "true"
+    refresh_stats = os.environ.get("REFRESH_POST_STATS", "true").lower() == "true"
+    max_workers = max(1, int(os.environ.get("REDDIT_MAX_WORKERS", "1")))
+    requests_per_minute = int(os.environ.get("REDDIT_REQUESTS_PER_MINUTE", "90"))
+    # Один клиент PRAW сам соблюдает лимит Reddit по заголовкам ответов, поэтому
+    # при последовательном сборе общий ограничитель нужен только клиенту json
+    praw_sequential = max_workers == 1 and os.environ.get("REDDIT_FETCHER", "praw").lower() != "json"
+    rate_limiter = None if praw_sequential else RateLimiter(requests_per_minute)
+    filter_engine = FilterEngine.from_env()
 
     try:
-        reddit = praw.Reddit(
-            client_id=client_id, client_secret=client_secret, user_agent=user_agent
-        )
-        reddit.read_only = True
+        reddit = create_reddit_client(client_id, client_secret, user_agent)
 
         print("Успешно подключено к Reddit API")
 
@@ -128,36 +371,124 @@ def collect_posts() -> dict[str, Any]:
     print(f"Период: {start_time} - {end_time} UTC")
     print(f"Мониторим сабреддиты: {', '.join(subreddits)}")
 
-    all_posts = []
+    if rate_limiter is None:
+        print("Последовательный сбор, лимит запросов соблюдает PRAW")
+    else:
+        print(f"Параллельных воркеров: {max_workers}, лимит: {requests_per_minute} запросов/мин")
+
+    s3_key = get_posts_s3_key("all_posts", date_str)
+    filtered_posts_key = get_posts_index_s3_key(date_str)
 
-    for subreddit_name in subreddits:
-        print(f"\nСбор постов из r/{subreddit_name}...")
-        posts = fetch_subreddit_posts(reddit, subreddit_name, start_time, end_time)
-        print(f"Найдено {len(posts)} постов")
-        all_posts.extend(posts)
+    # В инкрементальном режиме дописываем новые посты к уже собранным за день.
+    # Контрольные точки используем только при наличии партиции дня, иначе
+    # (например, после ручного удаления файла) собираем день заново.
+    existing_posts = []
+    checkpoints = {}
+    if incremental and check_s3_key_exists(s3_key):
+        existing_posts = load_posts_document(s3_key)["posts"]
+        checkpoints = load_checkpoints()
+        print(f"Инкрементальный сбор: уже собрано {len(existing_posts)} постов")
 
-    print(f"\nВсего собрано постов: {len(all_posts)}")
+    known_ids = {post["id"] for post in existing_posts}
+    existing_by_subreddit = {}
+    for post in existing_posts:
+        existing_by_subreddit.setdefault(post["subreddit"], []).append(post)
+    del existing_posts
 
-    # Подготавливаем данные для сохранения
-    data_to_save = {
+    header = {
         "date": date_str,
         "start_time": start_time.isoformat(),
         "end_time": end_time.isoformat(),
-        "total_posts": len(all_posts),
-        "posts": all_posts,
     }
+    had_existing_posts = bool(known_ids)
+    new_posts_count = 0
+    changed_posts_count = 0
 
-    # Сохраняем в S3
-    s3_key = f"data/all_posts_{date_str}.json"
-    success = upload_to_s3(data_to_save, s3_key)
-    
-    if not success:
-        raise Exception(f"Не удалось загрузить данные в S3: {s3_key}")
+    # Посты каждого сабреддита сразу пишутся в документ дня, а id прошедших
+    # фильтр - в индекс. В формате NDJSON это потоковая multipart загрузка,
+    # и в памяти не накапливается весь день; JSON документ по-прежнему
+    # загружается целиком при закрытии.
+    raw_sink = open_posts_sink(s3_key, header)
+    filtered_sink = PostsIndexWriter(filtered_posts_key, s3_key, header, filter_engine.describe())
+
+    def process_subreddit(new_posts: list[dict[str, Any]], carried_posts: list[dict[str, Any]]) -> None:
+        nonlocal changed_posts_count
+
+        # Только что загруженные посты уже актуальны, обновлять статистику
+        # нужно лишь у постов, собранных предыдущими запусками
+        if refresh_stats and carried_posts:
+            changed_posts_count += refresh_post_stats(reddit, carried_posts, rate_limiter)
+
+        subreddit_posts = new_posts + carried_posts
+        raw_sink.write_many(subreddit_posts)
+        with span("filter.subreddit", log=False) as filter_span:
+            filtered = filter_engine.filter(subreddit_posts)
+            filter_span.add(items=len(subreddit_posts))
+        filtered_sink.write_many(filtered)
+
+    try:
+        for subreddit_name, fetched_posts in iter_subreddit_posts(
+            reddit, subreddits, start_time, end_time, rate_limiter, checkpoints, max_workers
+        ):
+            # Листинг идет от новых постов к старым, поэтому новые посты сабреддита
+            # ставим перед уже собранными. Посты с уже известным id отбрасываем.
+            new_posts = [post for post in fetched_posts if post["id"] not in known_ids]
+            new_posts_count += len(new_posts)
+            process_subreddit(new_posts, existing_by_subreddit.pop(subreddit_name, []))
+
+            if new_posts:
+                checkpoints[subreddit_name] = make_checkpoint(
+                    max(new_posts, key=lambda post: post["created_utc"])
+                )
+
+        # Посты сабреддитов, исключенных из REDDIT_SUBREDDITS в течение дня
+        for carried_posts in existing_by_subreddit.values():
+            process_subreddit([], carried_posts)
+    except Exception:
+        raw_sink.abort()
+        filtered_sink.abort()
+        raise
+
+    total_posts = raw_sink.records_written
+    total_filtered = filtered_sink.records_written
+    add_counters(items=total_posts)
+
+    print(f"\nНовых постов: {new_posts_count}")
+    print(f"Всего собрано постов: {total_posts}")
+    if changed_posts_count:
+        print(f"Обновлена статистика {changed_posts_count} ранее собранных постов")
+
+    # Если в инкрементальном режиме нет ни новых постов, ни изменений
+    # статистики, партиция дня не изменилась и перезаписывать ее не нужно
+    updated = bool(new_posts_count or changed_posts_count or not had_existing_posts)
+
+    filter_result = None
+    if updated:
+        raw_sink.close({"total_posts": total_posts})
+        filtered_sink.close({
+            "total_posts_collected": total_posts,
+            "total_posts_filtered": total_filtered,
+        })
+        filter_result = build_filter_result(
+            date_str, s3_key, filtered_posts_key, total_posts, total_filtered
+        )
+    else:
+        raw_sink.abort()
+        filtered_sink.abort()
+
+    # Контрольные точки сдвигаем только после успешной записи партиции,
+    # иначе следующий запуск пропустил бы несохраненные посты
+    if incremental and new_posts_count and not save_checkpoints(checkpoints):
+        print("⚠️  Не удалось сохранить контрольные точки, следующий запуск пройдет листинг заново")
 
     return {
         "status": "success",
         "date": date_str,
-        "total_posts": len(all_posts),
+        "total_posts": total_posts,
+        "new_posts": new_posts_count,
+        "changed_posts": changed_posts_count,
+        "updated": updated,
         "s3_key": s3_key,
-        "subreddits": subreddits
-    }
\ No newline at end of file
+        "subreddits": subreddits,
+        "filter_result": filter_result,
+    }
@@ -0,0 +1,244 @@
+import json
+import os
+from dataclasses import asdict, dataclass, fields, replace
+from operator import itemgetter
+from typing import Any
+
+import numpy as np
+
+from utils import get_meme_pattern, is_meme_post
+
+DEFAULT_RULE_KEY = "default"
+
+
+@dataclass(frozen=True)
+class FilterRule:
+    """
+    Правило фильтрации постов сабреддита за день.
+
+    Пост проходит, если его score или количество комментариев не меньше
+    соответствующего порога. Порог score - наибольшее из min_score и
+    значения, отсекающего top_score_percent процентов лучших постов
+    сабреддита (аналогично для комментариев). Критерий, у которого не задано
+    ни одно значение, не используется; если не задан ни один - проходят все.
+    """
+
+    min_score: int | None = 30
+    min_comments: int | None = 30
+    top_score_percent: float | None = None
+    top_comments_percent: float | None = None
+    exclude_memes: bool = True
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], base: "FilterRule" = None) -> "FilterRule":
+        """
+        Создает правило из словаря конфигурации.
+
+        Args:
+            data: Значения полей правила
+            base: Правило, из которого берутся незаданные поля
+
+        Returns:
+            FilterRule: Правило фильтрации
+
+        Raises:
+            ValueError: Неизвестные поля или некорректный процент
+        """
+        known_fields = {field.name for field in fields(cls)}
+        unknown_fields = set(data) - known_fields
+        if unknown_fields:
+            raise ValueError(f"Неизвестные поля правила фильтрации: {', '.join(sorted(unknown_fields))}")
+
+        rule = replace(base or cls(), **data)
+        for percent in (rule.top_score_percent, rule.top_comments_percent):
+            if percent is not None and not 0 < percent <= 100:
+                raise ValueError(f"Процент лучших постов должен быть в диапазоне (0, 100]: {percent}")
+        return rule
+
+
+def _threshold(values: np.ndarray, minimum: int | None, top_percent: float | None) -> float | None:
+    """
+    Вычисляет порог для одного числового критерия.
+
+    Args:
+        values: Значения критерия у постов сабреддита
+        minimum: Абсолютный минимум
+        top_percent: Процент лучших постов
+
+    Returns:
+        float | None: Порог или None, если критерий не задан
+    """
+    thresholds = []
+    if minimum is not None:
+        thresholds.append(minimum)
+    if top_percent is not None and values.size:
+        # method="higher" дает значение реального поста, поэтому при равных
+        # значениях проходят все посты с пороговым score
+        thresholds.append(np.percentile(values, 100 - top_percent, method="higher"))
+    return max(thresholds) if thresholds else None
+
+
+class FilterEngine:
+    """
+    Фильтр постов с правилами по сабреддитам.
+
+    Числовые условия (score, num_comments, created_utc) вычисляются над
+    столбцами NumPy для всех постов сразу; проверка на мемы выполняется
+    только для постов, прошедших числовые условия. Процентили считаются
+    внутри каждого сабреддита по переданным постам, поэтому на вход
+    подаются все посты дня (или все посты сабреддита за день).
+    """
+
+    def __init__(self, rules: dict[str, FilterRule] = None, default_rule: FilterRule = None):
+        self.default_rule = default_rule or FilterRule()
+        # Названия сабреддитов в Reddit нечувствительны к регистру
+        self.rules = {name.lower(): rule for name, rule in (rules or {}).items()}
+
+    @classmethod
+    def from_env(cls) -> "FilterEngine":
+        """
+        Создает фильтр из переменной окружения FILTER_RULES.
+
+        FILTER_RULES - JSON объект: ключ "default" задает правило по умолчанию,
+        остальные ключи - названия сабреддитов. Незаданные поля правила
+        сабреддита берутся из правила по умолчанию, например:
+        {"default": {"min_score": 30}, "ChatGPT": {"top_score_percent": 5}}
+
+        Returns:
+            FilterEngine: Фильтр
+
+        Raises:
+            ValueError: Некорректный JSON или правило
+        """
+        rules_str = os.environ.get("FILTER_RULES", "").strip()
+        if not rules_str:
+            return cls()
+
+        try:
+            config = json.loads(rules_str)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"FILTER_RULES содержит некорректный JSON: {e}")
+
+        default_rule = FilterRule.from_dict(config.pop(DEFAULT_RULE_KEY, {}))
+        rules = {
+            subreddit: FilterRule.from_dict(rule_config, default_rule)
+            for subreddit, rule_config in config.items()
+        }
+        return cls(rules, default_rule)
+
+    def describe(self) -> dict[str, dict[str, Any]]:
+        """
+        Возвращает правила фильтрации в виде словаря для сохранения вместе с результатом.
+
+        Returns:
+            dict: Правило по умолчанию и правила сабреддитов
+        """
+        return {
+            DEFAULT_RULE_KEY: asdict(self.default_rule),
+            **{subreddit: asdict(rule) for subreddit, rule in self.rules.items()},
+        }
+
+    def get_rule(self, subreddit: str) -> FilterRule:
+        """
+        Возвращает правило для сабреддита.
+
+        Args:
+            subreddit: Название сабреддита
+
+        Returns:
+            FilterRule: Правило сабреддита или правило по умолчанию
+        """
+        return self.rules.get(subreddit.lower(), self.default_rule)
+
+    def popularity_mask(
+        self,
+        posts: list[dict[str, Any]],
+        start_utc: int = None,
+        end_utc: int = None,
+    ) -> np.ndarray:
+        """
+        Вычисляет числовые условия фильтрации для списка постов.
+
+        Args:
+            posts: Посты одного или нескольких сабреддитов
+            start_utc: Начало окна по created_utc (включительно)
+            end_utc: Конец окна по created_utc (включительно)
+
+        Returns:
+            np.ndarray: Булев массив, True для постов, прошедших условия
+        """
+        count = len(posts)
+        scores = np.fromiter(map(itemgetter("score"), posts), dtype=np.int64, count=count)
+        comments = np.fromiter(map(itemgetter("num_comments"), posts), dtype=np.int64, count=count)
+        subreddits = list(map(itemgetter("subreddit"), posts))
+
+        # Посты одного сабреддита (основной случай при сборе) не нужно группировать
+        names = list(dict.fromkeys(subreddits))
+        if len(names) == 1:
+            mask = self._subreddit_mask(scores, comments, self.get_rule(names[0]))
+        else:
+            name_codes = {name: code for code, name in enumerate(names)}
+            codes = np.fromiter(map(name_codes.__getitem__, subreddits), dtype=np.int32, count=count)
+            mask = np.zeros(count, dtype=bool)
+            for code, name in enumerate(names):
+                indices = np.flatnonzero(codes == code)
+                mask[indices] = self._subreddit_mask(scores[indices], comments[indices], self.get_rule(name))
+
+        if start_utc is not None or end_utc is not None:
+            created = np.fromiter(map(itemgetter("created_utc"), posts), dtype=np.int64, count=count)
+            if start_utc is not None:
+                mask &= created >= start_utc
+            if end_utc is not None:
+                mask &= created <= end_utc
+
+        return mask
+
+    def _subreddit_mask(self, scores: np.ndarray, comments: np.ndarray, rule: FilterRule) -> np.ndarray:
+        score_threshold = _threshold(scores, rule.min_score, rule.top_score_percent)
+        comments_threshold = _threshold(comments, rule.min_comments, rule.top_comments_percent)
+
+        if score_threshold is None and comments_threshold is None:
+            return np.ones(scores.size, dtype=bool)
+
+        mask = np.zeros(scores.size, dtype=bool)
+        if score_threshold is not None:
+            mask |= scores >= score_threshold
+        if comments_threshold is not None:
+            mask |= comments >= comments_threshold
+        return mask
+
+    def filter(
+        self,
+        posts: list[dict[str, Any]],
+        start_utc: int = None,
+        end_utc: int = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Фильтрует посты по правилам сабреддитов и исключает мемы.
+
+        Args:
+            posts: Посты одного или нескольких сабреддитов
+            start_utc: Начало окна по created_utc (включительно)
+            end_utc: Конец окна по created_utc (включительно)
+
+        Returns:
+            list: Отфильтрованные посты в исходном порядке
+        """
+        if not posts:
+            return []
+
+        mask = self.popularity_mask(posts, start_utc, end_utc)
+        meme_pattern = get_meme_pattern()
+        exclude_memes = {}
+
+        filtered = []
+        for index in np.flatnonzero(mask).tolist():
+            post = posts[index]
+            subreddit = post["subreddit"]
+            if subreddit not in exclude_memes:
+                exclude_memes[subreddit] = self.get_rule(subreddit).exclude_memes
+            if exclude_memes[subreddit] and is_meme_post(post, meme_pattern):
+                continue
+            filtered.append(post)
+
+        return filtered
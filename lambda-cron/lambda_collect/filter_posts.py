@@ -1,56 +1,103 @@
+from datetime import datetime
+from itertools import groupby
 from typing import Any
 
-from utils import download_from_s3, filter_posts, upload_to_s3
+from filter_engine import FilterEngine
+from posts_storage import (
+    PostsIndexWriter,
+    find_posts_s3_key,
+    get_posts_index_s3_key,
+    open_posts_document,
+)
+from tracing import add_counters, traced
 
 
+@traced("filter")
 def filter_collected_posts(date_str: str) -> dict[str, Any]:
     """
-    Фильтрует собранные посты по критериям популярности.
-    
+    Фильтрует уже сохраненные в S3 посты по критериям популярности.
+
+    Основной конвейер фильтрует посты прямо во время сбора (см. collect_posts),
+    эта функция нужна для повторной фильтрации сохраненного дня (например,
+    после изменения FILTER_RULES). Результат сохраняется как индекс id по
+    файлу всех постов. Посты читаются потоково: в памяти одновременно
+    находятся посты только одного сабреддита, этого достаточно для
+    процентильных порогов.
+
     Args:
         date_str: Дата в формате YYYY-MM-DD
-        
+
     Returns:
         dict: Результат выполнения фильтрации
     """
-    # Скачиваем все посты из S3
-    all_posts_key = f"data/all_posts_{date_str}.json"
-    
+    all_posts_key = find_posts_s3_key(date_str)
+    filtered_posts_key = get_posts_index_s3_key(date_str)
+
     try:
-        data = download_from_s3(all_posts_key)
-        all_posts = data["posts"]
-        print(f"Загружено {len(all_posts)} постов из S3")
+        metadata, posts = open_posts_document(all_posts_key)
     except Exception as e:
         raise Exception(f"Не удалось загрузить данные из S3: {e}")
 
-    # Фильтруем посты
-    filtered_posts = filter_posts(all_posts)
-    
-    print(f"После фильтрации: {len(filtered_posts)} постов")
-    print(f"Исключено мемов и неподходящего контента: {len(all_posts) - len(filtered_posts)} постов")
-
-    # Подготавливаем данные для сохранения
-    filtered_data = {
+    header = {
         "date": date_str,
-        "start_time": data["start_time"],
-        "end_time": data["end_time"],
-        "total_posts_collected": len(all_posts),
-        "total_posts_filtered": len(filtered_posts),
-        "posts": filtered_posts,
+        "start_time": metadata["start_time"],
+        "end_time": metadata["end_time"],
     }
 
-    # Сохраняем отфильтрованные данные в S3
-    filtered_posts_key = f"data/posts_{date_str}.json"
-    success = upload_to_s3(filtered_data, filtered_posts_key)
-    
-    if not success:
-        raise Exception(f"Не удалось загрузить отфильтрованные данные в S3: {filtered_posts_key}")
+    filter_engine = FilterEngine.from_env()
+    start_utc = int(datetime.fromisoformat(metadata["start_time"]).timestamp())
+    end_utc = int(datetime.fromisoformat(metadata["end_time"]).timestamp())
+
+    total_collected = 0
+    with PostsIndexWriter(
+        filtered_posts_key, all_posts_key, header, filter_engine.describe()
+    ) as filtered_sink:
+        # collect_posts записывает посты сабреддита подряд
+        for _, group in groupby(posts, key=lambda post: post.get("subreddit")):
+            subreddit_posts = list(group)
+            total_collected += len(subreddit_posts)
+            filtered_sink.write_many(filter_engine.filter(subreddit_posts, start_utc, end_utc))
+
+        filter_result = build_filter_result(
+            date_str, all_posts_key, filtered_posts_key, total_collected, filtered_sink.records_written
+        )
+        filtered_sink.close({
+            "total_posts_collected": total_collected,
+            "total_posts_filtered": filtered_sink.records_written,
+        })
+
+    add_counters(items=total_collected)
+    return filter_result
+
+
+def build_filter_result(
+    date_str: str,
+    all_posts_key: str,
+    filtered_posts_key: str,
+    total_collected: int,
+    total_filtered: int,
+) -> dict[str, Any]:
+    """
+    Формирует результат фильтрации и выводит статистику.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+        all_posts_key: Ключ S3 со всеми постами
+        filtered_posts_key: Ключ S3 с отфильтрованными постами
+        total_collected: Количество собранных постов
+        total_filtered: Количество постов после фильтрации
+
+    Returns:
+        dict: Результат выполнения фильтрации
+    """
+    print(f"После фильтрации: {total_filtered} постов")
+    print(f"Исключено мемов и неподходящего контента: {total_collected - total_filtered} постов")
 
     return {
         "status": "success",
         "date": date_str,
-        "total_collected": len(all_posts),
-        "total_filtered": len(filtered_posts),
+        "total_collected": total_collected,
+        "total_filtered": total_filtered,
         "filtered_posts_s3_key": filtered_posts_key,
         "all_posts_s3_key": all_posts_key
-    }
\ No newline at end of file
+    }
@@ -2,20 +2,65 @@ import json
 import os
 from typing import Any, Dict
 
-import boto3
-
-from fetch_posts import collect_posts
+from fanout import SHARD_ACTION, collect_posts_fanout, run_shard
+from fetch_posts import collect_posts, get_subreddits
+from filter_engine import FilterEngine
 from filter_posts import filter_collected_posts
+from refresh_posts import refresh_collected_posts
+from stages import DEFAULT_LEASE_SECONDS, StageRunner
+from tracing import finish_trace, start_trace
 from utils import get_berlin_date_string
 
+# Клиент Lambda создается при первом запуске суммаризации и переиспользуется
+# теплыми вызовами функции
+_lambda_client = None
+
+
+def get_lambda_client():
+    """
+    Возвращает общий клиент AWS Lambda модуля.
+
+    boto3 импортируется при первом обращении: воркеры шардов и пропущенные
+    запуски его не загружают.
+
+    Returns:
+        botocore.client.Lambda: Клиент Lambda
+    """
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+
+        _lambda_client = boto3.client("lambda")
+    return _lambda_client
+
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda handler для сбора и фильтрации постов Reddit.
+
+    В конце вызова печатается отчет о времени этапов (tracing.py).
+
+    Args:
+        event: Событие Lambda (от EventBridge или координатора fan-out)
+        context: Контекст Lambda
+
+    Returns:
+        Dict: Результат выполнения
+    """
+    start_trace()
+    try:
+        return process_event(event, context)
+    finally:
+        finish_trace()
+
+
+def process_event(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """
+    Выполняет сбор и фильтрацию постов Reddit или шард сбора.
     
     Args:
         event: Событие Lambda (от EventBridge)
-        context: Контекст Lambda
+        context: Контекст Lambda (оставшееся время координатора fan-out)
         
     Returns:
         Dict: Результат выполнения
@@ -31,49 +76,106 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "body": {"status": "skipped", "reason": "Циклический вызов от Lambda"}
         }
     
+    # Вызов координатора fan-out: собрать один шард сабреддитов.
+    # Результат и ошибка записываются в отчет шарда, который опрашивает координатор
+    if event.get("action") == SHARD_ACTION:
+        return run_shard(event)
+
     try:
         # Получаем дату для обработки
         date_str = get_berlin_date_string()
         print(f"📅 Обработка данных за {date_str}")
         
-        # Проверяем, не обрабатывались ли уже посты за сегодня
-        from utils import check_s3_key_exists
-        all_posts_key = f"data/all_posts_{date_str}.json"
-        
-        if check_s3_key_exists(all_posts_key):
-            print(f"⚠️  Данные за {date_str} уже обработаны, пропускаем выполнение")
+        # Каждый этап отмечается выполненным в state/stages/{date}/. Повторный
+        # запуск (например, после сбоя Lambda между этапами) пропускает готовые
+        # этапы и выполняет только отсутствующие или устаревшие.
+        # В инкрементальном режиме сбор выполняется всегда и дописывает новые посты.
+        runner = StageRunner(date_str)
+        incremental = os.environ.get("INCREMENTAL_COLLECTION", "false").lower() == "true"
+        refresh_stats = os.environ.get("REFRESH_POST_STATS", "true").lower() == "true"
+        fanout = os.environ.get("COLLECT_MODE", "single").lower() == "fanout"
+        if fanout and incremental:
+            print("⚠️  Инкрементальный сбор выполняется одной функцией, COLLECT_MODE=fanout не используется")
+            fanout = False
+        collect_config = {"subreddits": get_subreddits()}
+        filter_config = {"filter_rules": FilterEngine.from_env().describe()}
+
+        # Этап 1: Сбор, обновление статистики и фильтрация постов за один проход
+        collect_result = None
+        if incremental or not runner.is_done("collect", **collect_config):
+            print("\n📥 Этап 1: Сбор и фильтрация постов из Reddit")
+            if fanout:
+                get_remaining_ms = context.get_remaining_time_in_millis if context else None
+                collect_result = collect_posts_fanout(get_remaining_ms=get_remaining_ms)
+            else:
+                collect_result = collect_posts()
+            print(f"✅ Сбор и фильтрация завершены: {collect_result}")
+
+            # Без изменений партиции отметки остаются прежними, и следующие
+            # этапы не повторяются
+            if collect_result["updated"] or runner.get_marker("collect") is None:
+                runner.mark_done("collect", collect_result, **collect_config)
+            if collect_result["updated"]:
+                runner.mark_done("refresh", {"status": "success", "one_pass": True}, enabled=refresh_stats)
+                runner.mark_done("filter", collect_result["filter_result"], **filter_config)
+
+        # Этапы, не завершенные предыдущим запуском или устаревшие
+        # (например, после изменения FILTER_RULES)
+        refresh_result = runner.run(
+            "refresh",
+            lambda: refresh_collected_posts(date_str) if refresh_stats else {"status": "skipped"},
+            enabled=refresh_stats,
+        )
+        filter_result = runner.run("filter", lambda: filter_collected_posts(date_str), **filter_config)
+
+        # Дайджест генерирует другая Lambda: если ее вызов потерялся или
+        # завершился ошибкой, отметок нет, и суммаризация запускается снова
+        if runner.is_upstream_done("summarize") and runner.is_upstream_done("render"):
+            print(f"⚠️  Дайджест за {date_str} актуален, суммаризация не требуется")
             return {
                 "statusCode": 200,
                 "body": {
-                    "status": "skipped", 
-                    "reason": f"Данные за {date_str} уже существуют",
-                    "date": date_str
+                    "status": "skipped",
+                    "reason": f"Данные за {date_str} не изменились",
+                    "date": date_str,
+                    "collect_result": collect_result,
+                    "refresh_result": refresh_result,
+                    "filter_result": filter_result,
                 }
             }
-        
-        # Этап 1: Сбор постов
-        print("\n📥 Этап 1: Сбор постов из Reddit")
-        collect_result = collect_posts()
-        print(f"✅ Сбор завершен: {collect_result}")
-        
-        # Этап 2: Фильтрация постов
-        print("\n🔍 Этап 2: Фильтрация постов")
-        filter_result = filter_collected_posts(date_str)
-        print(f"✅ Фильтрация завершена: {filter_result}")
-        
-        # Этап 3: Запуск Lambda функции суммаризации
-        print("\n📊 Этап 3: Запуск суммаризации")
+
+        # Этап 2: Запуск Lambda функции суммаризации
+        print("\n📊 Этап 2: Запуск суммаризации")
         summarize_function_name = os.environ.get("SUMMARIZE_FUNCTION_NAME")
         
         if summarize_function_name:
+            # Суммаризация, запущенная предыдущим вызовом (по расписанию или
+            # инкрементальным сбором), еще выполняется: новые данные обработает
+            # следующий запуск после ее завершения
+            lease_seconds = int(os.environ.get("SUMMARIZE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+            lease = runner.acquire_lease("summarize", lease_seconds)
+            if lease is None:
+                return {
+                    "statusCode": 200,
+                    "body": {
+                        "status": "skipped",
+                        "reason": f"Суммаризация за {date_str} уже выполняется",
+                        "date": date_str,
+                        "collect_result": collect_result,
+                        "refresh_result": refresh_result,
+                        "filter_result": filter_result,
+                    }
+                }
+
             try:
-                lambda_client = boto3.client("lambda")
+                lambda_client = get_lambda_client()
                 
                 # Подготавливаем payload для функции суммаризации
                 summarize_payload = {
                     "date": date_str,
                     "filtered_posts_s3_key": filter_result["filtered_posts_s3_key"],
-                    "all_posts_s3_key": filter_result["all_posts_s3_key"]
+                    "all_posts_s3_key": filter_result["all_posts_s3_key"],
+                    "lease_id": lease["lease_id"],
                 }
                 
                 # Асинхронный вызов функции суммаризации
@@ -88,6 +190,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
             except Exception as e:
                 print(f"⚠️  Ошибка при запуске функции суммаризации: {e}")
+                # Суммаризация не запущена: следующий вызов запустит ее снова
+                runner.release_lease("summarize", lease["lease_id"])
                 # Не прерываем выполнение, так как основная задача выполнена
         else:
             print("⚠️  SUMMARIZE_FUNCTION_NAME не настроен, пропускаем запуск суммаризации")
@@ -100,6 +204,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 "message": "Сбор и фильтрация постов завершены успешно",
                 "date": date_str,
                 "collect_result": collect_result,
+                "refresh_result": refresh_result,
                 "filter_result": filter_result,
                 "summarize_triggered": bool(summarize_function_name)
             }
@@ -0,0 +1,558 @@
+import json
+import os
+import time
+import zlib
+from typing import Any, Iterable, Iterator
+
+from storage import get_storage, iter_ndjson_lines
+from tracing import record as record_span, span
+from utils import download_from_s3, upload_to_s3
+
+# Минимальный размер части multipart upload в S3 (кроме последней)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# Уровень сжатия gzip: выше 6 размер почти не уменьшается, а запись заметно замедляется
+GZIP_LEVEL = 6
+
+HEADER_FIELD = "_header"
+FOOTER_FIELD = "_footer"
+
+# Версия формата NDJSON в заголовке объекта. Увеличивается при несовместимых
+# изменениях, чтобы старый код не прочитал новый объект неправильно
+FORMAT_VERSION = 1
+FORMAT_VERSION_FIELD = "format_version"
+
+# Поле индекса отфильтрованных постов со списком id
+POST_IDS_FIELD = "post_ids"
+
+
+def get_posts_s3_key(name: str, date_str: str) -> str:
+    """
+    Возвращает ключ S3 файла постов за день с учетом формата хранения.
+
+    Формат задается переменными окружения POSTS_FORMAT (ndjson по умолчанию
+    или прежний json) и POSTS_GZIP (сжатие NDJSON, выключено по умолчанию:
+    gzip уменьшает файлы втрое, но разбор становится примерно вдвое медленнее).
+
+    Args:
+        name: Тип файла: all_posts или posts
+        date_str: Дата в формате YYYY-MM-DD
+
+    Returns:
+        str: Ключ в S3
+    """
+    if os.environ.get("POSTS_FORMAT", "ndjson").lower() == "ndjson":
+        gzip_enabled = os.environ.get("POSTS_GZIP", "false").lower() == "true"
+        extension = ".ndjson.gz" if gzip_enabled else ".ndjson"
+    else:
+        extension = ".json"
+    return f"data/{name}_{date_str}{extension}"
+
+
+def get_posts_index_s3_key(date_str: str) -> str:
+    """
+    Возвращает ключ S3 индекса отфильтрованных постов за день.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+
+    Returns:
+        str: Ключ в S3
+    """
+    return f"data/posts_{date_str}.json"
+
+
+def find_posts_s3_key(date_str: str, bucket_name: str = None) -> str:
+    """
+    Возвращает ключ сохраненного файла всех постов дня.
+
+    Ключ (а с ним и формат) файла записан в индексе отфильтрованных постов,
+    поэтому день, собранный до изменения POSTS_FORMAT или POSTS_GZIP,
+    читается без поиска по списку объектов. Без индекса ключ определяется
+    текущими настройками формата.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        str: Ключ в S3
+    """
+    content = get_storage(bucket_name).get(get_posts_index_s3_key(date_str))
+    if content is not None:
+        all_posts_s3_key = json.loads(content).get("all_posts_s3_key")
+        if all_posts_s3_key:
+            return all_posts_s3_key
+    return get_posts_s3_key("all_posts", date_str)
+
+
+def encode_ndjson_line(record: dict[str, Any]) -> bytes:
+    """
+    Кодирует запись в строку NDJSON без лишних пробелов.
+
+    Args:
+        record: Запись
+
+    Returns:
+        bytes: Строка UTF-8 с переводом строки
+    """
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def is_ndjson_key(s3_key: str) -> bool:
+    """
+    Проверяет, хранится ли объект в формате NDJSON (по расширению ключа).
+
+    Args:
+        s3_key: Ключ в S3
+
+    Returns:
+        bool: True для .ndjson и .ndjson.gz
+    """
+    return s3_key.endswith(".ndjson") or s3_key.endswith(".ndjson.gz")
+
+
+class NDJSONS3Writer:
+    """
+    Потоковая запись NDJSON в хранилище через multipart upload.
+
+    Записи кодируются (и при необходимости сжимаются gzip) по одной и
+    отправляются частями, поэтому в памяти одновременно находится не больше
+    одной части независимо от количества постов. Первая строка - заголовок
+    с метаданными и версией формата, последняя - итоговые счетчики.
+
+    Multipart upload создается только при заполнении первой части: небольшие
+    объекты загружаются одним put_object при закрытии.
+    """
+
+    def __init__(
+        self,
+        s3_key: str,
+        header: dict[str, Any] = None,
+        bucket_name: str = None,
+        gzip_enabled: bool = None,
+        part_size: int = DEFAULT_PART_SIZE,
+    ):
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.gzip_enabled = s3_key.endswith(".gz") if gzip_enabled is None else gzip_enabled
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.records_written = 0
+
+        self._storage = get_storage(bucket_name)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._closed = False
+        self._compressor = (
+            zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            if self.gzip_enabled
+            else None
+        )
+
+        self._write_line({HEADER_FIELD: {FORMAT_VERSION_FIELD: FORMAT_VERSION, **(header or {})}})
+
+    def __enter__(self) -> "NDJSONS3Writer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_line(self, record: dict[str, Any]) -> None:
+        line = encode_ndjson_line(record)
+        if self._compressor is not None:
+            line = self._compressor.compress(line)
+        self._buffer += line
+
+        if len(self._buffer) >= self.part_size:
+            self._flush_part()
+
+    def _flush_part(self) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._storage.create_multipart_upload(
+                self.s3_key, NDJSON_CONTENT_TYPE, self._content_encoding()
+            )
+
+        part_number = len(self._parts) + 1
+        with span("s3.upload_part", log=False) as s3_span:
+            part = self._storage.upload_part(self.s3_key, self._upload_id, part_number, bytes(self._buffer))
+            s3_span.add(bytes=len(self._buffer))
+        self._parts.append(part)
+        self._buffer.clear()
+
+    def _content_encoding(self) -> str | None:
+        return "gzip" if self.gzip_enabled else None
+
+    def write(self, record: dict[str, Any]) -> None:
+        """
+        Записывает одну запись.
+
+        Args:
+            record: Запись (словарь поста)
+        """
+        self._write_line(record)
+        self.records_written += 1
+
+    def write_many(self, records: list[dict[str, Any]]) -> None:
+        """
+        Записывает несколько записей.
+
+        Args:
+            records: Записи (словари постов)
+        """
+        for record in records:
+            self.write(record)
+
+    def close(self, footer: dict[str, Any] = None) -> None:
+        """
+        Дописывает итоговую строку и завершает загрузку объекта.
+
+        Args:
+            footer: Итоговые счетчики (по умолчанию - количество записей)
+        """
+        if self._closed:
+            return
+
+        self._write_line({FOOTER_FIELD: footer or {"total_records": self.records_written}})
+        if self._compressor is not None:
+            self._buffer += self._compressor.flush()
+
+        try:
+            if self._upload_id is None:
+                with span("s3.put", log=False) as s3_span:
+                    self._storage.put(
+                        self.s3_key, bytes(self._buffer), NDJSON_CONTENT_TYPE, self._content_encoding()
+                    )
+                    s3_span.add(bytes=len(self._buffer))
+            else:
+                self._flush_part()
+                with span("s3.complete_multipart_upload", log=False):
+                    self._storage.complete_multipart_upload(self.s3_key, self._upload_id, self._parts)
+        except Exception:
+            self.abort()
+            raise
+
+        self._closed = True
+        print(f"✅ Записано {self.records_written} записей в {self._storage.uri(self.s3_key)}")
+
+    def abort(self) -> None:
+        """
+        Отменяет загрузку: уже отправленные части удаляются, объект не создается.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._buffer.clear()
+        if self._upload_id is not None:
+            try:
+                self._storage.abort_multipart_upload(self.s3_key, self._upload_id)
+            except Exception as e:
+                print(f"❌ Ошибка отмены multipart upload {self.s3_key}: {e}")
+
+
+class JSONPostsSink:
+    """
+    Запись документа постов в прежнем формате JSON.
+
+    Имеет тот же интерфейс, что и NDJSONS3Writer, но накапливает посты
+    в памяти и загружает документ целиком при закрытии.
+    """
+
+    def __init__(self, s3_key: str, header: dict[str, Any] = None, bucket_name: str = None):
+        self.s3_key = s3_key
+        self.bucket_name = bucket_name
+        self.records_written = 0
+        self._header = header or {}
+        self._posts = []
+
+    def __enter__(self) -> "JSONPostsSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._posts.append(record)
+        self.records_written += 1
+
+    def write_many(self, records: list[dict[str, Any]]) -> None:
+        for record in records:
+            self.write(record)
+
+    def close(self, footer: dict[str, Any] = None) -> None:
+        if self._posts is None:
+            return
+
+        document = {**self._header, **(footer or {}), "posts": self._posts}
+        self._posts = None
+
+        if not upload_to_s3(document, self.s3_key, self.bucket_name):
+            raise Exception(f"Не удалось загрузить данные в S3: {self.s3_key}")
+
+    def abort(self) -> None:
+        self._posts = None
+
+
+class PostsIndexWriter:
+    """
+    Запись отфильтрованных постов в виде индекса по файлу всех постов дня.
+
+    Вместо второй копии постов сохраняется небольшой JSON документ со
+    списком id, ключом файла всех постов, счетчиками по сабреддитам и
+    правилами фильтрации. Интерфейс совпадает с NDJSONS3Writer.
+    """
+
+    def __init__(
+        self,
+        s3_key: str,
+        all_posts_s3_key: str,
+        header: dict[str, Any] = None,
+        filter_rules: dict[str, Any] = None,
+        bucket_name: str = None,
+    ):
+        self.s3_key = s3_key
+        self.all_posts_s3_key = all_posts_s3_key
+        self.bucket_name = bucket_name
+        self.records_written = 0
+        self._header = header or {}
+        self._filter_rules = filter_rules
+        self._post_ids = []
+        self._subreddit_counts = {}
+
+    def __enter__(self) -> "PostsIndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._post_ids.append(record["id"])
+        subreddit = record["subreddit"]
+        self._subreddit_counts[subreddit] = self._subreddit_counts.get(subreddit, 0) + 1
+        self.records_written += 1
+
+    def write_many(self, records: list[dict[str, Any]]) -> None:
+        for record in records:
+            self.write(record)
+
+    def close(self, footer: dict[str, Any] = None) -> None:
+        if self._post_ids is None:
+            return
+
+        document = {
+            FORMAT_VERSION_FIELD: FORMAT_VERSION,
+            **self._header,
+            **(footer or {}),
+            "all_posts_s3_key": self.all_posts_s3_key,
+            "subreddit_counts": self._subreddit_counts,
+            "filter_rules": self._filter_rules,
+            POST_IDS_FIELD: self._post_ids,
+        }
+        self._post_ids = None
+
+        if not upload_to_s3(document, self.s3_key, self.bucket_name):
+            raise Exception(f"Не удалось загрузить данные в S3: {self.s3_key}")
+
+    def abort(self) -> None:
+        self._post_ids = None
+
+
+def open_posts_sink(
+    s3_key: str, header: dict[str, Any] = None, bucket_name: str = None
+) -> NDJSONS3Writer | JSONPostsSink:
+    """
+    Открывает запись документа постов в формате, соответствующем ключу.
+
+    Args:
+        s3_key: Ключ в S3 (.json, .ndjson или .ndjson.gz)
+        header: Метаданные документа (date, start_time, end_time)
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        Объект с методами write, write_many, close(footer) и abort
+    """
+    if is_ndjson_key(s3_key):
+        return NDJSONS3Writer(s3_key, header, bucket_name)
+    return JSONPostsSink(s3_key, header, bucket_name)
+
+
+def iter_ndjson_records(s3_key: str, bucket_name: str = None) -> Iterator[dict[str, Any]]:
+    """
+    Построчно читает NDJSON объект из S3, включая заголовок и итоговую строку.
+
+    Объект читается частями, gzip распаковывается на лету.
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Yields:
+        dict: Записи объекта
+    """
+    with span("s3.stream", log=False):
+        metadata, chunks = get_storage(bucket_name).stream(s3_key)
+
+    gzipped = s3_key.endswith(".gz") or metadata["content_encoding"] == "gzip"
+    yield from iter_ndjson_lines(timed_chunks(chunks), gzipped)
+
+
+def timed_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Замеряет чтение частей объекта из хранилища (s3.read в отчете запуска).
+
+    Учитывается только ожидание очередной части, а не разбор строк и
+    обработка постов между частями.
+
+    Args:
+        chunks: Части объекта
+
+    Yields:
+        bytes: Те же части
+    """
+    chunks = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        record_span("s3.read", (time.perf_counter() - started) * 1000, bytes=len(chunk))
+        yield chunk
+
+
+def check_format_version(header: dict[str, Any]) -> None:
+    """
+    Проверяет, что версия формата объекта поддерживается.
+
+    Объекты без версии записаны до ее появления и читаются как версия 1.
+
+    Args:
+        header: Заголовок NDJSON объекта
+
+    Raises:
+        ValueError: Объект записан более новой версией формата
+    """
+    version = header.get(FORMAT_VERSION_FIELD, 1)
+    if version > FORMAT_VERSION:
+        raise ValueError(
+            f"Неподдерживаемая версия формата постов: {version} (поддерживается до {FORMAT_VERSION})"
+        )
+
+
+def iter_posts(s3_key: str, bucket_name: str = None) -> Iterator[dict[str, Any]]:
+    """
+    Потоково читает посты из NDJSON объекта, пропуская служебные строки.
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Yields:
+        dict: Посты
+    """
+    for record in iter_ndjson_records(s3_key, bucket_name):
+        if HEADER_FIELD not in record and FOOTER_FIELD not in record:
+            yield record
+
+
+def read_posts_document(s3_key: str, bucket_name: str = None) -> dict[str, Any]:
+    """
+    Читает NDJSON объект целиком в тот же вид, что и JSON документ постов.
+
+    Поля заголовка и итоговой строки переносятся на верхний уровень,
+    посты собираются в список "posts".
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        dict: Документ постов
+    """
+    document = {}
+    posts = []
+
+    for record in iter_ndjson_records(s3_key, bucket_name):
+        if HEADER_FIELD in record:
+            check_format_version(record[HEADER_FIELD])
+            document.update(record[HEADER_FIELD])
+        elif FOOTER_FIELD in record:
+            document.update(record[FOOTER_FIELD])
+        else:
+            posts.append(record)
+
+    document["posts"] = posts
+    return document
+
+
+def open_posts_document(
+    s3_key: str, bucket_name: str = None
+) -> tuple[dict[str, Any], Iterator[dict[str, Any]]]:
+    """
+    Открывает документ постов любого формата для потокового чтения.
+
+    Для NDJSON посты читаются из S3 по мере итерации; JSON документ
+    загружается целиком, как и раньше.
+
+    Args:
+        s3_key: Ключ в S3 (.json, .ndjson или .ndjson.gz)
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        tuple: (метаданные из заголовка документа, итератор постов)
+    """
+    if not is_ndjson_key(s3_key):
+        document = download_from_s3(s3_key, bucket_name)
+        posts = document.pop("posts")
+        return document, iter(posts)
+
+    records = iter_ndjson_records(s3_key, bucket_name)
+    first_record = next(records, None)
+
+    if first_record is None:
+        return {}, iter(())
+
+    if HEADER_FIELD in first_record:
+        header = first_record[HEADER_FIELD]
+        check_format_version(header)
+        leading = []
+    else:
+        header = {}
+        leading = [first_record]
+
+    def posts_iterator() -> Iterator[dict[str, Any]]:
+        for record in leading:
+            if FOOTER_FIELD not in record:
+                yield record
+        for record in records:
+            if HEADER_FIELD not in record and FOOTER_FIELD not in record:
+                yield record
+
+    return header, posts_iterator()
+
+
+def load_posts_document(s3_key: str, bucket_name: str = None) -> dict[str, Any]:
+    """
+    Загружает документ постов любого формата в виде словаря с ключом "posts".
+
+    Args:
+        s3_key: Ключ в S3 (.json, .ndjson или .ndjson.gz)
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        dict: Документ постов
+    """
+    if is_ndjson_key(s3_key):
+        return read_posts_document(s3_key, bucket_name)
+    return download_from_s3(s3_key, bucket_name)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Потокобезопасный ограничитель частоты запросов к Reddit API.
+
+    Один экземпляр разделяется между всеми воркерами сбора, поэтому
+    суммарное число запросов в минуту не превышает заданный лимит
+    независимо от количества потоков.
+    """
+
+    def __init__(self, requests_per_minute: int, burst: int = 1):
+        """
+        Args:
+            requests_per_minute: Максимальное количество запросов в минуту
+            burst: Сколько запросов можно выполнить подряд без ожидания
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute должен быть больше нуля")
+
+        self._interval = 60.0 / requests_per_minute
+        self._burst_window = self._interval * max(burst - 1, 0)
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Резервирует слот под один запрос и ждет, пока он наступит.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now - self._burst_window)
+            self._next_slot = slot + self._interval
+
+        wait_seconds = slot - now
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+from typing import TYPE_CHECKING, Union
+
+import requests
+
+from reddit_json import RedditJSONClient
+
+if TYPE_CHECKING:
+    import praw
+
+_thread_local = threading.local()
+
+# Клиент Reddit API: PRAW или легковесный JSON-клиент (REDDIT_FETCHER=json).
+# PRAW загружается только при создании его клиента
+RedditClient = Union["praw.Reddit", RedditJSONClient]
+
+
+def is_retryable_reddit_error(error: BaseException) -> bool:
+    """
+    Проверяет, что ошибка Reddit API временная и запрос имеет смысл повторить.
+
+    Args:
+        error: Исключение
+
+    Returns:
+        bool: True для сетевых ошибок, ошибок сервера и APIException PRAW
+    """
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+    # Ошибка PRAW возможна, только если PRAW уже загружен
+    if "praw" not in sys.modules:
+        return False
+
+    import praw
+    import prawcore
+
+    return isinstance(error, (
+        praw.exceptions.APIException,
+        prawcore.exceptions.RequestException,
+        prawcore.exceptions.ServerError,
+    ))
+
+
+def get_reddit_credentials() -> tuple[str, str, str]:
+    """
+    Читает учетные данные Reddit API из переменных окружения.
+
+    Returns:
+        tuple: (client_id, client_secret, user_agent)
+    """
+    client_id = os.environ.get("REDDIT_CLIENT_ID")
+    client_secret = os.environ.get("REDDIT_CLIENT_SECRET")
+    user_agent = os.environ.get("REDDIT_USER_AGENT", "digest-script/0.1")
+
+    if not client_id or not client_secret:
+        raise ValueError("REDDIT_CLIENT_ID или REDDIT_CLIENT_SECRET не найдены")
+
+    return client_id, client_secret, user_agent
+
+
+def create_reddit_client(client_id: str, client_secret: str, user_agent: str) -> RedditClient:
+    """
+    Создает read-only клиент Reddit API.
+
+    По умолчанию используется PRAW. При REDDIT_FETCHER=json создается
+    RedditJSONClient, который разбирает листинги без объектов PRAW.
+
+    Args:
+        client_id: Reddit client ID
+        client_secret: Reddit client secret
+        user_agent: User agent для запросов
+
+    Returns:
+        RedditClient: Клиент Reddit API
+    """
+    if os.environ.get("REDDIT_FETCHER", "praw").lower() == "json":
+        return RedditJSONClient(client_id, client_secret, user_agent)
+
+    import praw
+
+    reddit = praw.Reddit(
+        client_id=client_id, client_secret=client_secret, user_agent=user_agent
+    )
+    reddit.read_only = True
+    return reddit
+
+
+def get_thread_reddit_client(client_id: str, client_secret: str, user_agent: str) -> RedditClient:
+    """
+    Возвращает клиент Reddit API текущего потока.
+
+    PRAW не потокобезопасен, поэтому каждый воркер пула использует
+    собственный экземпляр, а общим остается только лимит запросов.
+    """
+    reddit = getattr(_thread_local, "reddit", None)
+    if reddit is None:
+        reddit = create_reddit_client(client_id, client_secret, user_agent)
+        _thread_local.reddit = reddit
+    return reddit
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REDDIT_TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+REDDIT_OAUTH_URL = "https://oauth.reddit.com"
+
+
+class RedditJSONError(Exception):
+    """Неповторяемая ошибка Reddit API (4xx, кроме 429)."""
+
+
+def listing_item_to_post(data: dict[str, Any], subreddit_name: str) -> dict[str, Any]:
+    """
+    Преобразует элемент листинга Reddit (поле data у t3) в словарь поста.
+
+    Формат совпадает с постами, которые собираются через PRAW.
+
+    Args:
+        data: Поле data элемента листинга
+        subreddit_name: Название сабреддита
+
+    Returns:
+        dict: Пост с необходимыми полями
+    """
+    return {
+        "id": data["id"],
+        "created_utc": int(data["created_utc"]),
+        "title": data["title"],
+        "selftext": data.get("selftext", ""),
+        "score": data["score"],
+        "num_comments": data["num_comments"],
+        "permalink": f"https://reddit.com{data['permalink']}",
+        "author": data.get("author") or "[deleted]",
+        "link_flair_text": data.get("link_flair_text"),
+        "subreddit": subreddit_name,
+        "url": data.get("url"),
+        "post_hint": data.get("post_hint"),
+    }
+
+
+class RedditJSONClient:
+    """
+    Легковесный клиент Reddit API без построения объектов PRAW.
+
+    Использует одну HTTP-сессию с пулом keep-alive соединений и OAuth
+    токен приложения (client credentials). Ответы листингов разбираются
+    напрямую в словари постов.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        user_agent: str,
+        base_url: str = None,
+        token_url: str = None,
+        pool_size: int = 10,
+        timeout: int = 30,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = (base_url or os.environ.get("REDDIT_API_BASE_URL", REDDIT_OAUTH_URL)).rstrip("/")
+        self.token_url = token_url or os.environ.get("REDDIT_TOKEN_URL", REDDIT_TOKEN_URL)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _authorize(self) -> None:
+        """
+        Получает OAuth токен приложения и добавляет его в заголовки сессии.
+        """
+        response = self.session.post(
+            self.token_url,
+            auth=(self.client_id, self.client_secret),
+            data={"grant_type": "client_credentials"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        token = response.json()
+
+        self.session.headers["Authorization"] = f"bearer {token['access_token']}"
+        # Обновляем токен заранее, за минуту до истечения
+        self._token_expires_at = time.monotonic() + token.get("expires_in", 3600) - 60
+
+    def _ensure_token(self, force: bool = False) -> None:
+        with self._token_lock:
+            if force or time.monotonic() >= self._token_expires_at:
+                self._authorize()
+
+    def get(self, path: str, params: dict[str, Any] = None) -> dict[str, Any]:
+        """
+        Выполняет GET запрос к Reddit API и возвращает разобранный JSON.
+
+        Args:
+            path: Путь API (например, /r/ChatGPT/new)
+            params: Параметры запроса
+
+        Returns:
+            dict: Ответ API
+
+        Raises:
+            requests.exceptions.RequestException: Временные ошибки (сеть, 429, 5xx)
+            RedditJSONError: Ошибки запроса, которые не имеет смысла повторять
+        """
+        self._ensure_token()
+        request_params = {"raw_json": 1, **(params or {})}
+
+        response = self.session.get(
+            f"{self.base_url}{path}", params=request_params, timeout=self.timeout
+        )
+        if response.status_code == 401:
+            # Токен мог быть отозван раньше срока - получаем новый один раз
+            self._ensure_token(force=True)
+            response = self.session.get(
+                f"{self.base_url}{path}", params=request_params, timeout=self.timeout
+            )
+
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise RedditJSONError(
+                f"Reddit API вернул {response.status_code} для {path}: {response.text[:200]}"
+            )
+        response.raise_for_status()
+
+        return response.json()
+
+    def fetch_new_page(
+        self, subreddit_name: str, after: str | None = None, limit: int = 100
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        Загружает одну страницу листинга /new.
+
+        Args:
+            subreddit_name: Название сабреддита
+            after: Курсор (fullname последнего поста предыдущей страницы)
+            limit: Размер страницы (максимум 100)
+
+        Returns:
+            tuple: (посты страницы, курсор следующей страницы или None)
+        """
+        params = {"limit": limit}
+        if after:
+            params["after"] = after
+
+        listing = self.get(f"/r/{subreddit_name}/new", params)["data"]
+        posts = [
+            listing_item_to_post(child["data"], subreddit_name)
+            for child in listing["children"]
+            if child.get("kind") == "t3"
+        ]
+        return posts, listing.get("after")
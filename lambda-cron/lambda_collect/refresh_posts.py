@@ -0,0 +1,177 @@
+import os
+from typing import Any
+
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from posts_storage import find_posts_s3_key, open_posts_document, open_posts_sink
+from rate_limit import RateLimiter
+from reddit_client import (
+    RedditClient,
+    create_reddit_client,
+    get_reddit_credentials,
+    is_retryable_reddit_error,
+)
+from reddit_json import RedditJSONClient
+from tracing import add_counters, record_retry, span, traced
+
+# /api/info принимает не более 100 fullname за один запрос
+INFO_BATCH_SIZE = 100
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=60),
+    retry=retry_if_exception(is_retryable_reddit_error),
+    before_sleep=record_retry,
+)
+def fetch_post_stats_batch(
+    reddit: RedditClient, fullnames: list[str], rate_limiter: RateLimiter | None = None
+) -> dict[str, dict[str, int]]:
+    """
+    Получает актуальные score и num_comments для пачки постов одним запросом /api/info.
+
+    Args:
+        reddit: Клиент Reddit API (PRAW или RedditJSONClient)
+        fullnames: До 100 fullname постов (t3_...)
+        rate_limiter: Общий ограничитель частоты запросов к Reddit API
+
+    Returns:
+        dict: Статистика по id поста ({id: {"score": int, "num_comments": int}})
+    """
+    if rate_limiter is not None:
+        with span("reddit.rate_limit_wait", log=False):
+            rate_limiter.acquire()
+
+    try:
+        with span("reddit.info", log=False) as info_span:
+            if isinstance(reddit, RedditJSONClient):
+                listing = reddit.get("/api/info", {"id": ",".join(fullnames)})["data"]
+                items = [child["data"] for child in listing["children"]]
+            else:
+                items = [
+                    {"id": submission.id, "score": submission.score, "num_comments": submission.num_comments}
+                    for submission in reddit.info(fullnames=fullnames)
+                ]
+            info_span.add(items=len(items))
+    except Exception as e:
+        if is_retryable_reddit_error(e):
+            print(f"Ошибка API при обновлении статистики постов: {e}. Повторная попытка...")
+        raise
+
+    return {
+        item["id"]: {"score": item["score"], "num_comments": item["num_comments"]}
+        for item in items
+    }
+
+
+@traced("refresh_stats", log=False)
+def refresh_post_stats(
+    reddit: RedditClient,
+    posts: list[dict[str, Any]],
+    rate_limiter: RateLimiter | None = None,
+) -> int:
+    """
+    Обновляет score и num_comments постов на месте пачками по 100 fullname.
+
+    Args:
+        reddit: Клиент Reddit API
+        posts: Посты в формате all_posts
+        rate_limiter: Общий ограничитель частоты запросов к Reddit API
+
+    Returns:
+        int: Количество постов, у которых изменилась статистика
+    """
+    changed_count = 0
+
+    for batch_start in range(0, len(posts), INFO_BATCH_SIZE):
+        batch = posts[batch_start:batch_start + INFO_BATCH_SIZE]
+        stats = fetch_post_stats_batch(
+            reddit, [f"t3_{post['id']}" for post in batch], rate_limiter
+        )
+
+        for post in batch:
+            post_stats = stats.get(post["id"])
+            if post_stats is None:
+                # Пост удален или недоступен - оставляем последний снимок
+                continue
+            if (
+                post_stats["score"] != post["score"]
+                or post_stats["num_comments"] != post["num_comments"]
+            ):
+                changed_count += 1
+            post.update(post_stats)
+
+    add_counters(items=len(posts))
+    return changed_count
+
+
+@traced("refresh")
+def refresh_collected_posts(date_str: str) -> dict[str, Any]:
+    """
+    Обновляет статистику сохраненных за день постов.
+
+    Посты читаются и перезаписываются потоково пачками по 100.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+
+    Returns:
+        dict: Результат выполнения обновления
+    """
+    client_id, client_secret, user_agent = get_reddit_credentials()
+
+    requests_per_minute = int(os.environ.get("REDDIT_REQUESTS_PER_MINUTE", "90"))
+    rate_limiter = RateLimiter(requests_per_minute)
+    reddit = create_reddit_client(client_id, client_secret, user_agent)
+
+    all_posts_key = find_posts_s3_key(date_str)
+
+    try:
+        metadata, posts = open_posts_document(all_posts_key)
+    except Exception as e:
+        raise Exception(f"Не удалось загрузить данные из S3: {e}")
+
+    header = {
+        "date": metadata.get("date", date_str),
+        "start_time": metadata["start_time"],
+        "end_time": metadata["end_time"],
+    }
+
+    changed_count = 0
+    requests_count = 0
+
+    # Новый объект записывается multipart upload и заменяет старый только
+    # при завершении загрузки, то есть после того, как старый прочитан целиком
+    with open_posts_sink(all_posts_key, header) as sink:
+        batch = []
+        for post in posts:
+            batch.append(post)
+            if len(batch) == INFO_BATCH_SIZE:
+                changed_count += refresh_post_stats(reddit, batch, rate_limiter)
+                requests_count += 1
+                sink.write_many(batch)
+                batch = []
+
+        if batch:
+            changed_count += refresh_post_stats(reddit, batch, rate_limiter)
+            requests_count += 1
+            sink.write_many(batch)
+
+        total_posts = sink.records_written
+        sink.close({"total_posts": total_posts})
+
+    add_counters(items=total_posts)
+    print(f"Обновлена статистика {changed_count} постов за {requests_count} запросов к /api/info")
+
+    return {
+        "status": "success",
+        "date": date_str,
+        "total_posts": total_posts,
+        "changed_posts": changed_count,
+        "info_requests": requests_count,
+    }
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from storage import get_storage
+from tracing import span
+
+STAGES_S3_PREFIX = "state/stages/"
+
+# Этапы обработки дня по порядку: каждый этап зависит от предыдущего
+STAGES = ("collect", "refresh", "filter", "summarize", "render")
+
+# Срок аренды этапа по умолчанию (секунды): максимальный таймаут Lambda
+DEFAULT_LEASE_SECONDS = 900
+
+
+def hash_inputs(inputs: dict[str, Any]) -> str:
+    """
+    Вычисляет хэш входных данных этапа.
+
+    Args:
+        inputs: Входные данные этапа (сериализуемые в JSON)
+
+    Returns:
+        str: SHA-256 в hex
+    """
+    return hashlib.sha256(
+        json.dumps(inputs, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class StageRunner:
+    """
+    Выполнение этапов обработки дня с отметками о завершении.
+
+    После успешного этапа в хранилище сохраняется отметка с хэшем его
+    входных данных: отметки предыдущего этапа и параметров этапа
+    (например, правил фильтрации). Повторный запуск пропускает этапы с
+    актуальной отметкой и выполняет только отсутствующие и устаревшие.
+    Повторное выполнение этапа меняет его отметку, поэтому все следующие
+    этапы тоже становятся устаревшими.
+
+    Отметки хранятся в state/stages/{date}/{stage}.json. Этапы одного дня
+    могут выполняться разными функциями Lambda: сбор и фильтрация в
+    lambda_collect, суммаризация и сборка дайджеста в lambda_summarize.
+
+    Этап, запущенный в другой функции, на время выполнения арендуется
+    (state/stages/{date}/{stage}.lease.json): пока аренда действует,
+    повторный запуск этапа пропускается. Срок аренды ограничивает
+    ожидание, если функция завершилась, не сняв аренду.
+    """
+
+    def __init__(self, date_str: str, bucket_name: str = None):
+        self.date_str = date_str
+        self.storage = get_storage(bucket_name)
+        self._markers: dict[str, dict[str, Any] | None] = {}
+
+    def marker_key(self, stage: str) -> str:
+        """Возвращает ключ отметки этапа в хранилище."""
+        return f"{STAGES_S3_PREFIX}{self.date_str}/{stage}.json"
+
+    def get_marker(self, stage: str) -> dict[str, Any] | None:
+        """
+        Возвращает отметку о завершении этапа.
+
+        Args:
+            stage: Название этапа
+
+        Returns:
+            dict | None: Отметка или None, если этап не выполнялся
+        """
+        if stage not in self._markers:
+            with span("s3.get", log=False) as s3_span:
+                content = self.storage.get(self.marker_key(stage))
+                s3_span.add(bytes=len(content or b""))
+            self._markers[stage] = json.loads(content) if content is not None else None
+        return self._markers[stage]
+
+    def get_inputs(self, stage: str, **config: Any) -> dict[str, Any]:
+        """
+        Формирует входные данные этапа.
+
+        Args:
+            stage: Название этапа
+            **config: Параметры этапа, изменение которых требует его повторения
+
+        Returns:
+            dict: Отметка предыдущего этапа (хэш и время завершения) и параметры
+        """
+        index = STAGES.index(stage)
+        previous = None
+        if index > 0:
+            marker = self.get_marker(STAGES[index - 1])
+            if marker is not None:
+                previous = {
+                    "stage": marker["stage"],
+                    "input_hash": marker["input_hash"],
+                    "completed_at": marker["completed_at"],
+                }
+        return {"previous": previous, "config": config}
+
+    def is_done(self, stage: str, **config: Any) -> bool:
+        """
+        Проверяет, выполнен ли этап с текущими входными данными.
+
+        Args:
+            stage: Название этапа
+            **config: Параметры этапа
+
+        Returns:
+            bool: True если отметка есть и хэш входных данных совпадает
+        """
+        marker = self.get_marker(stage)
+        return marker is not None and marker["input_hash"] == hash_inputs(self.get_inputs(stage, **config))
+
+    def is_upstream_done(self, stage: str) -> bool:
+        """
+        Проверяет, выполнен ли этап после последнего выполнения предыдущего этапа.
+
+        В отличие от is_done параметры этапа не сравниваются: так этап
+        другой функции Lambda проверяется без ее конфигурации.
+
+        Args:
+            stage: Название этапа
+
+        Returns:
+            bool: True если отметка есть и предыдущий этап с тех пор не повторялся
+        """
+        marker = self.get_marker(stage)
+        return marker is not None and marker.get("previous") == self.get_inputs(stage)["previous"]
+
+    def mark_done(self, stage: str, result: Any, **config: Any) -> dict[str, Any]:
+        """
+        Сохраняет отметку о завершении этапа.
+
+        Args:
+            stage: Название этапа
+            result: Результат этапа (сериализуемый в JSON)
+            **config: Параметры этапа
+
+        Returns:
+            dict: Отметка
+        """
+        inputs = self.get_inputs(stage, **config)
+        marker = {
+            "stage": stage,
+            "date": self.date_str,
+            "input_hash": hash_inputs(inputs),
+            "previous": inputs["previous"],
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+            "result": result,
+        }
+        body = json.dumps(marker, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+        with span("s3.put", log=False) as s3_span:
+            self.storage.put(self.marker_key(stage), body, "application/json")
+            s3_span.add(bytes=len(body))
+        self._markers[stage] = marker
+        print(f"🏁 Этап {stage} за {self.date_str} отмечен выполненным")
+        return marker
+
+    def lease_key(self, stage: str) -> str:
+        """Возвращает ключ аренды этапа в хранилище."""
+        return f"{STAGES_S3_PREFIX}{self.date_str}/{stage}.lease.json"
+
+    def get_lease(self, stage: str) -> dict[str, Any] | None:
+        """
+        Возвращает действующую аренду этапа.
+
+        Args:
+            stage: Название этапа
+
+        Returns:
+            dict | None: Аренда или None, если ее нет или срок истек
+        """
+        with span("s3.get", log=False) as s3_span:
+            content = self.storage.get(self.lease_key(stage))
+            s3_span.add(bytes=len(content or b""))
+        if content is None:
+            return None
+        lease = json.loads(content)
+        if datetime.fromisoformat(lease["expires_at"]) <= datetime.now(timezone.utc):
+            return None
+        return lease
+
+    def acquire_lease(self, stage: str, seconds: int = DEFAULT_LEASE_SECONDS) -> dict[str, Any] | None:
+        """
+        Арендует этап, если он сейчас не выполняется.
+
+        Проверка и запись не атомарны: аренда защищает от повторного
+        запуска этапа следующими вызовами по расписанию, а не от
+        одновременных вызовов.
+
+        Args:
+            stage: Название этапа
+            seconds: Срок аренды (не меньше таймаута функции этапа)
+
+        Returns:
+            dict | None: Новая аренда или None, если этап уже арендован
+        """
+        current = self.get_lease(stage)
+        if current is not None:
+            print(f"⏳ Этап {stage} за {self.date_str} уже выполняется (аренда до {current['expires_at']})")
+            return None
+
+        now = datetime.now(timezone.utc)
+        lease = {
+            "stage": stage,
+            "date": self.date_str,
+            "lease_id": uuid.uuid4().hex,
+            "acquired_at": now.isoformat(),
+            "expires_at": (now + timedelta(seconds=seconds)).isoformat(),
+        }
+        body = json.dumps(lease, ensure_ascii=False, indent=2).encode("utf-8")
+        with span("s3.put", log=False) as s3_span:
+            self.storage.put(self.lease_key(stage), body, "application/json")
+            s3_span.add(bytes=len(body))
+        return lease
+
+    def release_lease(self, stage: str, lease_id: str = None) -> None:
+        """
+        Снимает аренду этапа.
+
+        Args:
+            stage: Название этапа
+            lease_id: Снять только эту аренду (аренду, взятую после истечения
+                срока, оставить ее владельцу)
+        """
+        if lease_id is not None:
+            current = self.get_lease(stage)
+            if current is None or current["lease_id"] != lease_id:
+                return
+        self.storage.delete(self.lease_key(stage))
+
+    def run(self, stage: str, func: Callable[[], Any], force: bool = False, **config: Any) -> Any:
+        """
+        Выполняет этап, если он не выполнен или устарел.
+
+        Args:
+            stage: Название этапа
+            func: Функция этапа без аргументов
+            force: Выполнить этап независимо от отметки
+            **config: Параметры этапа
+
+        Returns:
+            Any: Результат этапа (из отметки, если этап пропущен)
+        """
+        if not force and self.is_done(stage, **config):
+            print(f"⏭️  Этап {stage} за {self.date_str} уже выполнен, пропускаем")
+            return self.get_marker(stage)["result"]
+
+        print(f"▶️  Этап {stage} за {self.date_str}")
+        result = func()
+        self.mark_done(stage, result, **config)
+        return result
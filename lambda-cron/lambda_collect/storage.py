@@ -0,0 +1,625 @@
+"""
+Общий слой доступа к хранилищу для всех Lambda функций.
+
+Хранилище выбирается переменной окружения STORAGE_BACKEND: "s3" (по
+умолчанию, бакет S3_BUCKET_NAME) или "local" (каталог LOCAL_STORAGE_DIR,
+для запуска и профилирования без AWS). Ключи в обоих случаях одинаковы.
+
+Код одинаков в lambda_collect, lambda_summarize и lambda-web/src (в копии
+веб-интерфейса документация на английском): функции упаковываются по
+отдельности, поэтому модуль копируется в каждый пакет.
+"""
+import json
+import mimetypes
+import os
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+# Размер пула соединений клиента и максимальное число параллельных запросов
+# пакетных операций: запросы сверх пула ждали бы свободного соединения
+MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+
+DEFAULT_LOCAL_STORAGE_DIR = "local_storage"
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+NOT_FOUND_CODES = {"404", "NoSuchKey", "NotFound"}
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Возвращает общий клиент S3 модуля.
+
+    Клиент создается один раз на процесс и переиспользуется между теплыми
+    вызовами Lambda, поэтому учетные данные, эндпоинты и TLS соединения из
+    пула не создаются заново на каждый запрос. Клиент потокобезопасен.
+    Повторы в режиме adaptive дополнительно ограничивают частоту запросов
+    при ответах SlowDown/Throttling.
+
+    boto3 импортируется при создании клиента: с локальным хранилищем
+    (STORAGE_BACKEND=local) функции и веб-интерфейс запускаются без его
+    загрузки.
+
+    Returns:
+        botocore.client.S3: Клиент S3
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+
+                config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": MAX_ATTEMPTS, "mode": "adaptive"},
+                    tcp_keepalive=True,
+                )
+                # Сессия по умолчанию boto3 не потокобезопасна при создании клиентов
+                _s3_client = boto3.session.Session().client(
+                    "s3", region_name=os.environ.get("AWS_DEFAULT_REGION"), config=config
+                )
+    return _s3_client
+
+
+def get_bucket_name(bucket_name: str = None) -> str:
+    """
+    Возвращает имя бакета.
+
+    Args:
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        str: Имя бакета
+
+    Raises:
+        ValueError: Имя бакета не задано
+    """
+    bucket_name = bucket_name or os.environ.get("S3_BUCKET_NAME")
+    if not bucket_name:
+        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    return bucket_name
+
+
+def is_not_found(error: Exception) -> bool:
+    """Проверяет, что ошибка S3 означает отсутствие ключа."""
+    # botocore.exceptions.ClientError без импорта botocore: у ошибок клиента есть словарь response
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in NOT_FOUND_CODES
+
+
+class StorageBackend:
+    """
+    Интерфейс хранилища объектов.
+
+    Метаданные объекта (head) - словарь с полями size, content_type,
+    content_encoding и last_modified. Отсутствие ключа при чтении
+    обозначается None, остальные ошибки пробрасываются.
+    """
+
+    name = ""
+
+    def is_available(self) -> bool:
+        """Проверяет доступность хранилища."""
+        raise NotImplementedError
+
+    def uri(self, key: str) -> str:
+        """Возвращает адрес объекта для сообщений в логах."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes | None:
+        """Возвращает содержимое объекта или None, если ключа нет."""
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        """Возвращает байты объекта с start по end включительно (до конца, если end не задан)."""
+        raise NotImplementedError
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        """
+        Открывает объект для потокового чтения.
+
+        Returns:
+            tuple: (метаданные объекта, итератор частей содержимого)
+        """
+        raise NotImplementedError
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        """Сохраняет объект целиком."""
+        raise NotImplementedError
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        """Возвращает метаданные объекта или None, если ключа нет."""
+        raise NotImplementedError
+
+    def list_keys(self, prefix: str) -> list[str]:
+        """Возвращает отсортированные ключи с заданным префиксом."""
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        """
+        Возвращает ключи с заданным префиксом вместе с размером и временем изменения.
+
+        Размер и время приходят в ответе листинга, поэтому head для каждого
+        ключа не нужен.
+
+        Returns:
+            dict: Ключ -> {"size", "last_modified"} в порядке ключей
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Удаляет объект (отсутствие ключа не является ошибкой)."""
+        raise NotImplementedError
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        """Начинает загрузку объекта частями и возвращает ее идентификатор."""
+        raise NotImplementedError
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        """Загружает очередную часть и возвращает ее описание для завершения загрузки."""
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        """Собирает объект из загруженных частей."""
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """Отменяет загрузку и удаляет загруженные части."""
+        raise NotImplementedError
+
+
+class S3Backend(StorageBackend):
+    """Хранилище в бакете S3 через общий клиент get_s3_client."""
+
+    name = "s3"
+
+    def __init__(self, bucket_name: str = None):
+        self.bucket_name = get_bucket_name(bucket_name)
+        self.client = get_s3_client()
+
+    def is_available(self) -> bool:
+        try:
+            self.client.head_bucket(Bucket=self.bucket_name)
+            return True
+        except Exception as e:
+            print(f"❌ Бакет {self.bucket_name} недоступен: {e}")
+            return False
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket_name}/{key}"
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key, Range=byte_range)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            # Начало диапазона за концом объекта
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+            raise
+        return response["Body"].read()
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        return self._metadata(response), response["Body"].iter_chunks(chunk_size=chunk_size)
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        self.client.put_object(
+            Bucket=self.bucket_name, Key=key, Body=body, **self._object_params(content_type, content_encoding)
+        )
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+        return self._metadata(response)
+
+    def list_keys(self, prefix: str) -> list[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        return [
+            item["Key"]
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        ]
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        return {
+            item["Key"]: {"size": item["Size"], "last_modified": item["LastModified"]}
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        }
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, **self._object_params(content_type, content_encoding)
+        )
+        return response["UploadId"]
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    @staticmethod
+    def _object_params(content_type: str, content_encoding: str = None) -> dict[str, str]:
+        params = {"ContentType": content_type}
+        if content_encoding:
+            params["ContentEncoding"] = content_encoding
+        return params
+
+    @staticmethod
+    def _metadata(response: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "size": response.get("ContentLength"),
+            "content_type": response.get("ContentType"),
+            "content_encoding": response.get("ContentEncoding"),
+            "last_modified": response.get("LastModified"),
+        }
+
+
+class LocalBackend(StorageBackend):
+    """
+    Хранилище в локальном каталоге: ключ - относительный путь файла.
+
+    Тип и кодировка содержимого не сохраняются, а определяются по
+    расширению ключа (.gz - gzip). Объекты записываются через временный
+    файл и переименование, поэтому читатели не видят частично записанных
+    файлов.
+    """
+
+    name = "local"
+
+    def __init__(self, root_dir: str = None):
+        self.root_dir = os.path.abspath(
+            root_dir or os.environ.get("LOCAL_STORAGE_DIR") or DEFAULT_LOCAL_STORAGE_DIR
+        )
+
+    def is_available(self) -> bool:
+        return os.path.isdir(self.root_dir)
+
+    def uri(self, key: str) -> str:
+        return self._path(key)
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as file:
+                file.seek(start)
+                return file.read() if end is None else file.read(max(end - start + 1, 0))
+        except FileNotFoundError:
+            return None
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        metadata = self.head(key)
+        if metadata is None:
+            raise FileNotFoundError(f"Объект не найден: {self.uri(key)}")
+        return metadata, self._iter_file(self._path(key), chunk_size)
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        path = self._path(key)
+        temp_path = self._temp_path(path)
+        with open(temp_path, "wb") as file:
+            file.write(body)
+        os.replace(temp_path, path)
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return {
+            "size": stat.st_size,
+            "content_type": mimetypes.guess_type(key.removesuffix(".gz"))[0] or "application/octet-stream",
+            "content_encoding": "gzip" if key.endswith(".gz") else None,
+            "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+    def list_keys(self, prefix: str) -> list[str]:
+        return sorted(key for key, _ in self._walk(prefix))
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        objects = {}
+        for key, path in sorted(self._walk(prefix)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            objects[key] = {
+                "size": stat.st_size,
+                "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            }
+        return objects
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        temp_path = self._temp_path(self._path(key))
+        open(temp_path, "wb").close()
+        return temp_path
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        # Части отправляются по порядку, поэтому дописываются в конец файла
+        with open(upload_id, "ab") as file:
+            file.write(body)
+        return {"PartNumber": part_number}
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        os.replace(upload_id, self._path(key))
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        try:
+            os.remove(upload_id)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, key))
+        if os.path.commonpath([path, self.root_dir]) != self.root_dir:
+            raise ValueError(f"Ключ выходит за пределы хранилища: {key}")
+        return path
+
+    def _walk(self, prefix: str) -> Iterator[tuple[str, str]]:
+        # Обходится только каталог префикса, а не все хранилище
+        prefix_dir = os.path.join(self.root_dir, os.path.dirname(prefix))
+        for dir_path, _, file_names in os.walk(prefix_dir):
+            for file_name in file_names:
+                if file_name.endswith(".part"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                key = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    yield key, path
+
+    @staticmethod
+    def _temp_path(path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.part"
+
+    @staticmethod
+    def _iter_file(path: str, chunk_size: int) -> Iterator[bytes]:
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+
+_backends: dict[tuple[str, str | None], StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage(bucket_name: str = None) -> StorageBackend:
+    """
+    Возвращает хранилище, выбранное переменной окружения STORAGE_BACKEND.
+
+    Экземпляры кэшируются на процесс. Имя бакета учитывается только для S3.
+
+    Args:
+        bucket_name: Имя бакета S3 (по умолчанию из переменной окружения)
+
+    Returns:
+        StorageBackend: Хранилище
+
+    Raises:
+        ValueError: Неизвестное значение STORAGE_BACKEND или не задан бакет
+    """
+    backend_name = os.environ.get("STORAGE_BACKEND", "s3").lower()
+    if backend_name == "local":
+        cache_key = (backend_name, os.environ.get("LOCAL_STORAGE_DIR"))
+    elif backend_name == "s3":
+        cache_key = (backend_name, get_bucket_name(bucket_name))
+    else:
+        raise ValueError(f"Неизвестное хранилище STORAGE_BACKEND: {backend_name}")
+
+    backend = _backends.get(cache_key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(cache_key)
+            if backend is None:
+                backend = LocalBackend() if backend_name == "local" else S3Backend(cache_key[1])
+                _backends[cache_key] = backend
+    return backend
+
+
+def get_object(key: str, bucket_name: str = None) -> bytes | None:
+    """
+    Скачивает объект целиком.
+
+    Args:
+        key: Ключ объекта
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        bytes | None: Содержимое объекта или None, если ключа нет
+    """
+    return get_storage(bucket_name).get(key)
+
+
+def put_object(key: str, body: bytes, content_type: str = "application/json", bucket_name: str = None) -> None:
+    """
+    Загружает объект.
+
+    Args:
+        key: Ключ объекта
+        body: Содержимое объекта
+        content_type: MIME тип контента
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+    """
+    get_storage(bucket_name).put(key, body, content_type)
+
+
+def head_object(key: str, bucket_name: str = None) -> dict[str, Any] | None:
+    """
+    Возвращает метаданные объекта.
+
+    Args:
+        key: Ключ объекта
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        dict | None: Метаданные или None, если ключа нет
+    """
+    return get_storage(bucket_name).head(key)
+
+
+def run_batch(func: Callable[[T], R], items: Iterable[T], max_workers: int = None) -> list[R]:
+    """
+    Выполняет функцию для каждого элемента параллельно в пуле потоков.
+
+    Запросы к S3 ограничены сетью, поэтому потоки выполняются параллельно,
+    а общий клиент переиспользует соединения из пула. Исключение первого
+    неуспешного вызова пробрасывается.
+
+    Args:
+        func: Функция одного запроса
+        items: Элементы
+        max_workers: Максимум параллельных запросов (по умолчанию MAX_POOL_CONNECTIONS)
+
+    Returns:
+        list: Результаты в порядке элементов
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+
+    max_workers = min(max_workers or MAX_POOL_CONNECTIONS, len(items))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def get_objects(keys: Iterable[str], bucket_name: str = None, max_workers: int = None) -> dict[str, bytes | None]:
+    """
+    Скачивает несколько объектов параллельно.
+
+    Args:
+        keys: Ключи объектов
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+        max_workers: Максимум параллельных запросов
+
+    Returns:
+        dict: Содержимое по ключам (None для отсутствующих ключей)
+    """
+    storage = get_storage(bucket_name)
+    keys = list(keys)
+    return dict(zip(keys, run_batch(storage.get, keys, max_workers)))
+
+
+def put_objects(
+    objects: dict[str, bytes],
+    content_type: str = "application/json",
+    bucket_name: str = None,
+    max_workers: int = None,
+) -> None:
+    """
+    Загружает несколько объектов параллельно.
+
+    Args:
+        objects: Содержимое по ключам
+        content_type: MIME тип контента
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+        max_workers: Максимум параллельных запросов
+    """
+    storage = get_storage(bucket_name)
+    run_batch(lambda item: storage.put(item[0], item[1], content_type), objects.items(), max_workers)
+
+
+def head_objects(
+    keys: Iterable[str], bucket_name: str = None, max_workers: int = None
+) -> dict[str, dict[str, Any] | None]:
+    """
+    Запрашивает метаданные нескольких объектов параллельно.
+
+    Args:
+        keys: Ключи объектов
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+        max_workers: Максимум параллельных запросов
+
+    Returns:
+        dict: Метаданные по ключам (None для отсутствующих ключей)
+    """
+    storage = get_storage(bucket_name)
+    keys = list(keys)
+    return dict(zip(keys, run_batch(storage.head, keys, max_workers)))
+
+
+def iter_ndjson_lines(chunks: Iterable[bytes], gzipped: bool = False) -> Iterator[dict[str, Any]]:
+    """
+    Разбирает NDJSON из последовательности частей байтов.
+
+    Единственный разборщик NDJSON: его используют posts_storage.py функций
+    и s3_storage.py веб-интерфейса.
+
+    Args:
+        chunks: Части объекта в порядке чтения
+        gzipped: Части сжаты gzip
+
+    Yields:
+        dict: Записи объекта
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+
+    pending = b""
+    for chunk in chunks:
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        # Строки части разбираются одним вызовом json.loads как массив:
+        # это в 1.5-2 раза быстрее, чем вызов на каждую строку
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            yield from json.loads(b"[" + b",".join(lines) + b"]")
+
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending.strip():
+        yield json.loads(pending)
@@ -0,0 +1,319 @@
+"""
+Замеры времени этапов обработки (spans) и итоговый отчет запуска.
+
+Этап оборачивается в span: длительность, количество элементов (items),
+переданные байты (bytes), повторы запросов (retries) и ошибки суммируются
+по названию span за весь запуск. Завершенные этапы (log=True) печатаются
+строками CloudWatch Embedded Metric Format, частые операции (страницы
+листинга, запросы к S3) только суммируются и попадают в итоговый отчет,
+который печатается таблицей и строками EMF в конце вызова функции.
+
+Стек текущих span хранится отдельно для каждого потока. Функции, которые
+выполняются в пуле потоков, оборачиваются в in_current_span: иначе
+повторы и счетчики из рабочих потоков не попадают ни в один этап.
+
+Файл одинаков в lambda_collect и lambda_summarize: функции упаковываются
+по отдельности, поэтому модуль копируется в каждый пакет.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator, TypeVar
+
+DEFAULT_NAMESPACE = "RedditDigest"
+
+R = TypeVar("R")
+
+
+def emit_emf(metrics: dict[str, tuple[float, str]], dimensions: dict[str, str], **properties: Any) -> None:
+    """
+    Печатает метрики в формате CloudWatch Embedded Metric Format.
+
+    CloudWatch Logs извлекает метрики из таких строк лога Lambda без
+    дополнительных запросов к API. Пространство имен задается
+    переменной окружения METRICS_NAMESPACE.
+
+    Args:
+        metrics: Название метрики -> (значение, единица измерения)
+        dimensions: Измерения метрик
+        **properties: Дополнительные поля строки лога
+    """
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE),
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+            }],
+        },
+        **dimensions,
+        **{name: value for name, (value, _) in metrics.items()},
+        **properties,
+    }
+    print(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class Span:
+    """
+    Выполняемый этап: название, атрибуты и счетчики.
+
+    Счетчики могут увеличиваться из рабочих потоков этапа (in_current_span),
+    поэтому изменяются под блокировкой.
+    """
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counters: int) -> None:
+        """Увеличивает счетчики этапа (items, bytes, retries)."""
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+
+class Trace:
+    """
+    Суммы по названиям span за один запуск функции.
+
+    Этапы выполняются в нескольких потоках, поэтому записи добавляются под
+    блокировкой.
+    """
+
+    def __init__(self, function: str):
+        self.function = function
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: dict[str, dict[str, Any]] = {}
+
+    def record(self, name: str, duration_ms: float, error: bool = False, **counters: int) -> None:
+        """
+        Добавляет выполнение этапа к суммам.
+
+        Args:
+            name: Название span
+            duration_ms: Длительность в миллисекундах
+            error: Этап завершился исключением
+            **counters: Счетчики этапа
+        """
+        with self._lock:
+            stats = self.spans.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["errors"] += int(error)
+            for counter, value in counters.items():
+                stats[counter] = stats.get(counter, 0) + value
+
+    def report(self) -> dict[str, Any]:
+        """
+        Возвращает итоги запуска.
+
+        Returns:
+            dict: Функция, общее время и суммы по span в порядке убывания времени
+        """
+        with self._lock:
+            spans = {name: dict(stats) for name, stats in self.spans.items()}
+        for stats in spans.values():
+            stats["total_ms"] = round(stats["total_ms"], 1)
+            stats["max_ms"] = round(stats["max_ms"], 1)
+        return {
+            "function": self.function,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": dict(sorted(spans.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+        }
+
+
+_local = threading.local()
+_trace = Trace(os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"))
+
+
+def _span_stack() -> list[Span]:
+    stack = getattr(_local, "spans", None)
+    if stack is None:
+        stack = _local.spans = []
+    return stack
+
+
+def start_trace(function: str = None) -> Trace:
+    """
+    Начинает сбор замеров нового запуска.
+
+    Контейнер Lambda переиспользуется между вызовами, поэтому суммы
+    предыдущего вызова сбрасываются.
+
+    Args:
+        function: Название функции для измерения Function (по умолчанию
+            AWS_LAMBDA_FUNCTION_NAME)
+
+    Returns:
+        Trace: Замеры запуска
+    """
+    global _trace
+    _trace = Trace(function or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"))
+    return _trace
+
+
+@contextmanager
+def span(name: str, log: bool = True, **attributes: Any) -> Iterator[Span]:
+    """
+    Замеряет этап.
+
+    Счетчики добавляются через span.add(...) или add_counters(...) из кода
+    внутри этапа, в том числе из вызываемых функций.
+
+    Args:
+        name: Название span (например, reddit.page или summarize.load)
+        log: Печатать строку EMF по завершении (False для частых операций)
+        **attributes: Атрибуты для строки лога (например, subreddit)
+
+    Yields:
+        Span: Выполняемый этап
+    """
+    current = Span(name, attributes)
+    stack = _span_stack()
+    stack.append(current)
+    started = time.perf_counter()
+    error = False
+    try:
+        yield current
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        stack.pop()
+        _trace.record(name, duration_ms, error, **current.counters)
+        if log:
+            emit_emf(
+                {
+                    "Duration": (round(duration_ms, 1), "Milliseconds"),
+                    **{
+                        counter.capitalize(): (value, "Bytes" if counter == "bytes" else "Count")
+                        for counter, value in current.counters.items()
+                    },
+                },
+                {"Function": _trace.function, "Span": name},
+                error=error,
+                **current.attributes,
+            )
+
+
+def traced(name: str, log: bool = True) -> Callable[[Callable], Callable]:
+    """
+    Декоратор: замеряет каждый вызов функции как span.
+
+    Args:
+        name: Название span
+        log: Печатать строку EMF по завершении
+
+    Returns:
+        Декоратор функции
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, log):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_current_span(func: Callable[..., R]) -> Callable[..., R]:
+    """
+    Привязывает функцию к текущему этапу вызывающего потока.
+
+    Обертка выполняет функцию в рабочем потоке (например, в
+    ThreadPoolExecutor.map) со стеком span вызывающего потока: повторы и
+    счетчики, добавленные без собственного span, попадают в этап, который
+    запустил пул, а вложенные span выполняются внутри него.
+
+    Args:
+        func: Функция рабочего потока
+
+    Returns:
+        Функция с тем же результатом
+    """
+    parent_stack = list(_span_stack())
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> R:
+        previous = getattr(_local, "spans", None)
+        _local.spans = list(parent_stack)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.spans = previous
+
+    return wrapper
+
+
+def add_counters(**counters: int) -> None:
+    """
+    Увеличивает счетчики текущего этапа потока (если он есть).
+
+    Args:
+        **counters: Счетчики (items, bytes, retries)
+    """
+    stack = _span_stack()
+    if stack:
+        stack[-1].add(**counters)
+
+
+def record(name: str, duration_ms: float, **counters: int) -> None:
+    """
+    Добавляет к суммам операцию, замеренную без span (например, чтение части потока).
+
+    Args:
+        name: Название span
+        duration_ms: Длительность в миллисекундах
+        **counters: Счетчики операции
+    """
+    _trace.record(name, duration_ms, **counters)
+
+
+def record_retry(retry_state: Any) -> None:
+    """Учитывает повтор tenacity в текущем этапе (для параметра before_sleep)."""
+    add_counters(retries=1)
+
+
+def finish_trace() -> dict[str, Any]:
+    """
+    Печатает итоговый отчет запуска таблицей и строками EMF.
+
+    Returns:
+        dict: Итоги запуска (см. Trace.report)
+    """
+    report = _trace.report()
+    print(f"⏱️  Время этапов ({report['function']}, всего {report['duration_ms'] / 1000:.1f} с):")
+    for name, stats in report["spans"].items():
+        counters = "".join(
+            f", {counter}={value}"
+            for counter, value in stats.items()
+            if counter not in ("count", "total_ms", "max_ms") and value
+        )
+        print(f"   {name:<28} {stats['total_ms'] / 1000:8.2f} с  x{stats['count']}"
+              f"  (макс. {stats['max_ms'] / 1000:.2f} с{counters})")
+
+    for name, stats in report["spans"].items():
+        emit_emf(
+            {
+                "TotalDuration": (stats["total_ms"], "Milliseconds"),
+                "MaxDuration": (stats["max_ms"], "Milliseconds"),
+                "Calls": (stats["count"], "Count"),
+                **{
+                    counter.capitalize(): (value, "Bytes" if counter == "bytes" else "Count")
+                    for counter, value in stats.items()
+                    if counter not in ("count", "total_ms", "max_ms")
+                },
+            },
+            {"Function": report["function"], "Span": name},
+            report="run",
+        )
+    return report
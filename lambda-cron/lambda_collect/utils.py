@@ -1,11 +1,15 @@
 import json
 import os
+import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any
 
-import boto3
 import pytz
 
+from storage import get_storage
+from tracing import span
+
 
 def get_yesterday_berlin() -> tuple[datetime, datetime]:
     """
@@ -42,84 +46,149 @@ def get_berlin_date_string() -> str:
     return yesterday_berlin.strftime("%Y-%m-%d")
 
 
-def is_meme_post(post: dict[str, Any]) -> bool:
+DEFAULT_MEME_KEYWORDS = (
+    "meme",
+    "joke",
+    "funny",
+    "lol",
+    "lmao",
+    "rofl",
+    "humor",
+    "humour",
+    "shitpost",
+    "shit post",
+    "memeing",
+    "jk",
+    "just kidding",
+    "trolling",
+)
+
+MEME_FLAIR_PATTERN = re.compile(r"meme|humor|funny", re.IGNORECASE)
+IMAGE_URL_PATTERN = re.compile(r"\.(?:gif|jpe?g|png)", re.IGNORECASE)
+
+
+def _keywords_trie_pattern(trie: dict[str, dict]) -> str:
     """
-    Определяет, является ли пост мемом или юмористическим контентом.
+    Преобразует префиксное дерево ключевых слов в регулярное выражение.
+
+    Общие префиксы выносятся за скобки, поэтому на каждой позиции текста
+    проверяется не весь список слов, а только подходящая ветка дерева.
+    """
+    alternatives = [
+        (r"\s+" if char == " " else re.escape(char)) + _keywords_trie_pattern(child)
+        for char, child in sorted(trie.items())
+        if char
+    ]
+    if not alternatives:
+        return ""
+
+    if len(alternatives) == 1 and "" not in trie:
+        return alternatives[0]
+
+    pattern = "(?:" + "|".join(alternatives) + ")"
+    if "" in trie:
+        pattern += "?"
+    return pattern
+
+
+@lru_cache(maxsize=8)
+def compile_meme_pattern(keywords: tuple[str, ...]) -> re.Pattern:
+    """
+    Компилирует ключевые слова мемов в одно регулярное выражение.
+
+    Все слова ищутся за один проход по тексту и только целиком: "lol" не
+    совпадает внутри "lollipop", а "trolling" - внутри "controlling".
+    Допускается окончание множественного числа (memes, jokes), пробел в
+    составных словах соответствует любому количеству пробельных символов.
+    Поиск выполняется функцией has_meme_keyword.
 
     Args:
-        post: Словарь с данными поста
+        keywords: Ключевые слова
 
     Returns:
-        bool: True если пост - мем/юмор
+        re.Pattern: Скомпилированное выражение
     """
-    title_lower = (post.get("title") or "").lower()
-    selftext_lower = (post.get("selftext") or "").lower()
-    link_flair_text = (post.get("link_flair_text") or "").lower()
-
-    meme_keywords = [
-        "meme",
-        "joke",
-        "funny",
-        "lol",
-        "lmao",
-        "rofl",
-        "humor",
-        "humour",
-        "shitpost",
-        "shit post",
-        "memeing",
-        "jk",
-        "just kidding",
-        "trolling",
-    ]
+    trie: dict[str, dict] = {}
+    for keyword in keywords:
+        keyword = " ".join(keyword.lower().split())
+        if not keyword:
+            continue
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    # Выражение начинается с символа перед словом: re быстро пропускает
+    # буквы и входит в дерево только после пробелов и знаков препинания.
+    # Класс ограничен ASCII, границу для остальных букв проверяет has_meme_keyword.
+    return re.compile(rf"[^a-z0-9_]{_keywords_trie_pattern(trie)}s?(?!\w)")
+
+
+def has_meme_keyword(text: str, meme_pattern: re.Pattern) -> bool:
+    """
+    Проверяет, содержит ли текст ключевое слово мемов целиком.
+
+    Args:
+        text: Текст в любом регистре
+        meme_pattern: Выражение из compile_meme_pattern
 
-    for keyword in meme_keywords:
-        if keyword in title_lower or keyword in selftext_lower:
+    Returns:
+        bool: True если найдено ключевое слово
+    """
+    # Пробел в начале позволяет найти слово в самом начале текста
+    for match in meme_pattern.finditer(f" {text.lower()}"):
+        if not match.group()[0].isalnum():
             return True
+    return False
 
-    if (
-        "meme" in link_flair_text
-        or "humor" in link_flair_text
-        or "funny" in link_flair_text
-    ):
-        return True
 
-    if post.get("post_hint") == "image":
-        if any(
-            ext in post.get("url", "").lower()
-            for ext in [".gif", ".jpg", ".jpeg", ".png"]
-        ):
-            if len(selftext_lower) < 100:
-                return True
+def get_meme_pattern() -> re.Pattern:
+    """
+    Возвращает выражение для ключевых слов мемов.
 
-    return False
+    Список задается переменной окружения MEME_KEYWORDS (через запятую),
+    по умолчанию используется DEFAULT_MEME_KEYWORDS.
+
+    Returns:
+        re.Pattern: Скомпилированное выражение
+    """
+    keywords_env = os.environ.get("MEME_KEYWORDS")
+    if keywords_env:
+        keywords = tuple(keyword.strip() for keyword in keywords_env.split(","))
+    else:
+        keywords = DEFAULT_MEME_KEYWORDS
+    return compile_meme_pattern(keywords)
 
 
-def filter_posts(
-    posts: list[dict[str, Any]], min_score: int = 30, min_comments: int = 30
-) -> list[dict[str, Any]]:
+def is_meme_post(post: dict[str, Any], meme_pattern: re.Pattern = None) -> bool:
     """
-    Фильтрует посты по критериям популярности и исключает мемы.
+    Определяет, является ли пост мемом или юмористическим контентом.
 
     Args:
-        posts: Список постов
-        min_score: Минимальный score
-        min_comments: Минимальное количество комментариев
+        post: Словарь с данными поста
+        meme_pattern: Выражение для ключевых слов (по умолчанию get_meme_pattern())
 
     Returns:
-        List: Отфильтрованные посты
+        bool: True если пост - мем/юмор
     """
-    filtered = []
+    if meme_pattern is None:
+        meme_pattern = get_meme_pattern()
 
-    for post in posts:
-        if (
-            post.get("score", 0) >= min_score
-            or post.get("num_comments", 0) >= min_comments
-        ):
-            if not is_meme_post(post):
-                filtered.append(post)
+    title = post.get("title") or ""
+    selftext = post.get("selftext") or ""
 
-    return filtered
+    if has_meme_keyword(f"{title}\n{selftext}", meme_pattern):
+        return True
+
+    link_flair_text = post.get("link_flair_text")
+    if link_flair_text and MEME_FLAIR_PATTERN.search(link_flair_text):
+        return True
+
+    if post.get("post_hint") == "image" and len(selftext) < 100:
+        if IMAGE_URL_PATTERN.search(post.get("url") or ""):
+            return True
+
+    return False
 
 
 def upload_to_s3(data: Any, s3_key: str, bucket_name: str = None) -> bool:
@@ -134,27 +203,17 @@ def upload_to_s3(data: Any, s3_key: str, bucket_name: str = None) -> bool:
     Returns:
         bool: True если успешно
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        
-        json_content = json.dumps(data, ensure_ascii=False, indent=2)
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
-        
-        print(f"✅ Данные успешно загружены в s3://{bucket_name}/{s3_key}")
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        with span("s3.put", log=False) as s3_span:
+            storage.put(s3_key, body, "application/json")
+            s3_span.add(bytes=len(body))
+
+        print(f"✅ Данные успешно загружены в {storage.uri(s3_key)}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Ошибка загрузки в S3: {e}")
         return False
@@ -171,20 +230,17 @@ def download_from_s3(s3_key: str, bucket_name: str = None) -> Any:
     Returns:
         Any: Загруженные данные
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        
-        response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-        content = response['Body'].read().decode('utf-8')
-        
-        return json.loads(content)
-        
+        with span("s3.get", log=False) as s3_span:
+            content = storage.get(s3_key)
+            s3_span.add(bytes=len(content or b""))
+        if content is None:
+            raise FileNotFoundError(f"Объект не найден: {storage.uri(s3_key)}")
+
+        return json.loads(content.decode("utf-8"))
+
     except Exception as e:
         print(f"❌ Ошибка скачивания из S3: {e}")
         raise
@@ -201,18 +257,11 @@ def check_s3_key_exists(s3_key: str, bucket_name: str = None) -> bool:
     Returns:
         bool: True если ключ существует
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        s3_client.head_object(Bucket=bucket_name, Key=s3_key)
-        return True
+        with span("s3.head", log=False):
+            return storage.head(s3_key) is not None
     except Exception as e:
-        if "NoSuchKey" in str(e) or "404" in str(e):
-            return False
         print(f"❌ Ошибка проверки ключа S3: {e}")
-        return False
\ No newline at end of file
+        return False
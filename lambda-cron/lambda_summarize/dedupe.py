@@ -0,0 +1,247 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+
+# Параметры MinHash LSH: 32 полосы по 4 значения дают кандидатов начиная
+# примерно с 0.42 сходства по Жаккару, точный порог проверяется отдельно
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+SELFTEXT_CHARS = 300
+# Более короткие тексты ("Help", "Question") считаются дубликатами только при
+# полном совпадении
+MIN_TEXT_CHARS = 20
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+# Порог для постов с одинаковой ссылкой: заголовки кросс-постов обычно
+# совпадают не полностью, но обсуждения одной ссылки бывают разными
+DEFAULT_URL_SIMILARITY_THRESHOLD = 0.3
+
+# Перестановки вида (a * h + b) mod 2^64 >> 32 (multiply-shift хэширование):
+# переполнение uint64 и есть взятие по модулю, дорогое деление не нужно
+_rng = np.random.default_rng(20240101)
+_MINHASH_A = (_rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+_MINHASH_B = _rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+
+_REDDIT_POST_PATH = re.compile(r"/(?:comments|gallery)/([a-z0-9]+)")
+_NON_WORD = re.compile(r"[\W_]+")
+_TRACKING_PARAMS = {"ref", "ref_src", "ref_url", "fbclid", "gclid", "si"}
+
+
+def normalize_url(url: str | None) -> str | None:
+    """
+    Приводит ссылку поста к ключу для поиска кросс-постов.
+
+    Ссылки на посты Reddit (в том числе кросс-посты, ссылающиеся на
+    оригинал) сводятся к id поста, у внешних ссылок отбрасываются схема,
+    www, завершающий слэш и параметры отслеживания.
+
+    Args:
+        url: Ссылка поста
+
+    Returns:
+        str | None: Нормализованная ссылка или None, если ссылки нет
+    """
+    if not url:
+        return None
+
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.").removeprefix("old.")
+    path = parts.path.rstrip("/")
+
+    # Кросс-посты ссылаются на оригинал, иногда относительной ссылкой
+    if host in ("", "reddit.com") or host.endswith(".reddit.com"):
+        reddit_match = _REDDIT_POST_PATH.search(path.lower())
+        if reddit_match:
+            return f"reddit:{reddit_match.group(1)}"
+    if host == "redd.it":
+        return f"reddit:{path.lstrip('/').lower()}"
+
+    query = urlencode([
+        (key, value)
+        for key, value in parse_qsl(parts.query)
+        if not key.startswith("utm_") and key not in _TRACKING_PARAMS
+    ])
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def _post_text(post: dict[str, Any]) -> str:
+    selftext = (post.get("selftext") or "")[:SELFTEXT_CHARS]
+    return _NON_WORD.sub(" ", f"{post.get('title') or ''} {selftext}".lower()).strip()
+
+
+@lru_cache(maxsize=65536)
+def _word_hash(word: str) -> int:
+    # Хэш не зависит от процесса (в отличие от hash()), поэтому группы
+    # дубликатов и промпты одинаковы при каждом запуске
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    Вычисляет MinHash сигнатуру текста по словам и парам соседних слов.
+
+    Все перестановки применяются к хэшам шинглов одной операцией над массивом.
+
+    Args:
+        text: Нормализованный текст
+
+    Returns:
+        np.ndarray: Сигнатура из NUM_PERMUTATIONS значений
+    """
+    words = np.fromiter(map(_word_hash, text.split()), dtype=np.uint64)
+    bigrams = words[:-1] * np.uint64(1_000_003) + words[1:]
+    shingles = np.unique(np.concatenate((words, bigrams)) >> np.uint64(32))
+
+    return ((_MINHASH_A * shingles + _MINHASH_B) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class _DisjointSet:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root != second_root:
+            self.parent[max(first_root, second_root)] = min(first_root, second_root)
+
+
+def _similarity(first: np.ndarray, second: np.ndarray) -> float:
+    return np.count_nonzero(first == second) / NUM_PERMUTATIONS
+
+
+def find_duplicate_clusters(
+    posts: list[dict[str, Any]],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    url_threshold: float = DEFAULT_URL_SIMILARITY_THRESHOLD,
+) -> list[list[int]]:
+    """
+    Находит группы почти одинаковых постов и кросс-постов.
+
+    Кандидаты - посты с одинаковой нормализованной ссылкой и посты из одной
+    корзины LSH по полосам сигнатуры. Пара объединяется, если оценка
+    сходства по Жаккару (MinHash по заголовку и началу текста) не ниже
+    порога: для постов с одной ссылкой порог ниже (url_threshold), но одной
+    ссылки недостаточно, иначе разные обсуждения одной новости слились бы.
+    Сравниваются все пары кандидатов, а группы собираются через
+    объединение множеств, поэтому цепочки A~B и B~C дают одну группу, и
+    результат не зависит от порядка постов.
+
+    Args:
+        posts: Посты
+        threshold: Порог сходства по Жаккару
+        url_threshold: Порог сходства для постов с одинаковой ссылкой
+
+    Returns:
+        list: Группы индексов постов (только группы из 2 и более постов)
+    """
+    clusters = _DisjointSet(len(posts))
+    by_url: dict[str, list[int]] = {}
+    by_band: dict[tuple[int, bytes], list[int]] = {}
+    texts = [_post_text(post) for post in posts]
+    signatures: list[np.ndarray | None] = []
+
+    for index, post in enumerate(posts):
+        url_key = normalize_url(post.get("url"))
+        if url_key:
+            by_url.setdefault(url_key, []).append(index)
+
+        if len(texts[index]) < MIN_TEXT_CHARS:
+            signatures.append(None)
+            continue
+
+        signature = minhash_signature(texts[index])
+        signatures.append(signature)
+
+        signature_bytes = signature.tobytes()
+        band_size = LSH_ROWS * signature.itemsize
+        for band in range(LSH_BANDS):
+            by_band.setdefault((band, signature_bytes[band * band_size:(band + 1) * band_size]), []).append(index)
+
+    def union_similar(candidates: list[int], min_similarity: float) -> None:
+        for position, first in enumerate(candidates):
+            for second in candidates[position + 1:]:
+                if clusters.find(first) == clusters.find(second):
+                    continue
+                if signatures[first] is None or signatures[second] is None:
+                    # Короткие тексты ("Help", "Question") должны совпадать целиком
+                    similar = texts[first] == texts[second] and bool(texts[first])
+                else:
+                    similar = _similarity(signatures[first], signatures[second]) >= min_similarity
+                if similar:
+                    clusters.union(first, second)
+
+    for candidates in by_url.values():
+        if len(candidates) > 1:
+            union_similar(candidates, url_threshold)
+    for candidates in by_band.values():
+        if len(candidates) > 1:
+            union_similar(candidates, threshold)
+
+    groups: dict[int, list[int]] = {}
+    for index in range(len(posts)):
+        groups.setdefault(clusters.find(index), []).append(index)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def dedupe_posts(
+    posts: list[dict[str, Any]], threshold: float = None
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Схлопывает почти одинаковые посты и кросс-посты в один.
+
+    Из группы остается пост с наибольшим score (затем по комментариям) на
+    своем месте в списке. Его score и num_comments не меняются, чтобы числа
+    совпадали с его ссылкой: суммы по группе записываются в group_score и
+    group_comments, а остальные посты со своими числами и ссылками
+    перечисляются в поле duplicates.
+
+    Args:
+        posts: Посты
+        threshold: Порог сходства (по умолчанию DEDUPE_THRESHOLD или 0.6)
+
+    Returns:
+        tuple: (посты без дубликатов, количество удаленных постов)
+    """
+    if threshold is None:
+        threshold = float(os.environ.get("DEDUPE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD))
+
+    removed = set()
+    representatives = {}
+    for group in find_duplicate_clusters(posts, threshold):
+        best = max(group, key=lambda index: (posts[index]["score"], posts[index]["num_comments"]))
+        duplicates = [posts[index] for index in group if index != best]
+
+        representatives[best] = {
+            **posts[best],
+            "group_score": sum(posts[index]["score"] for index in group),
+            "group_comments": sum(posts[index]["num_comments"] for index in group),
+            "duplicates": [
+                {
+                    "subreddit": duplicate["subreddit"],
+                    "permalink": duplicate["permalink"],
+                    "score": duplicate["score"],
+                    "num_comments": duplicate["num_comments"],
+                }
+                for duplicate in duplicates
+            ],
+        }
+        removed.update(index for index in group if index != best)
+
+    deduped = [
+        representatives.get(index, post)
+        for index, post in enumerate(posts)
+        if index not in removed
+    ]
+    return deduped, len(removed)
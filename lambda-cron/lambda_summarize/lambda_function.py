@@ -2,15 +2,35 @@ import json
 from typing import Any, Dict
 
 from summarize import generate_digest
+from tracing import finish_trace, start_trace
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda handler для генерации дайджеста Reddit постов.
-    
+
+    В конце вызова печатается отчет о времени этапов (tracing.py).
+
     Args:
         event: Событие Lambda (от другой Lambda или тест)
         context: Контекст Lambda
+
+    Returns:
+        Dict: Результат выполнения
+    """
+    start_trace()
+    try:
+        return process_event(event)
+    finally:
+        finish_trace()
+
+
+def process_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Генерирует дайджест за дату из события.
+    
+    Args:
+        event: Событие Lambda (от другой Lambda или тест)
         
     Returns:
         Dict: Результат выполнения
@@ -36,7 +56,15 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         print(f"📄 Все посты: {all_posts_s3_key}")
         
         # Генерируем дайджест
-        result = generate_digest(date_str, filtered_posts_s3_key, all_posts_s3_key)
+        # force - сгенерировать дайджест заново, даже если этапы уже выполнены;
+        # lease_id - аренда суммаризации, взятая функцией сбора
+        result = generate_digest(
+            date_str,
+            filtered_posts_s3_key,
+            all_posts_s3_key,
+            force=bool(event.get("force")),
+            lease_id=event.get("lease_id"),
+        )
         
         # Формируем успешный ответ
         response = {
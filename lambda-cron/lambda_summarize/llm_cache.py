@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from storage import get_storage
+
+LLM_CACHE_PREFIX = "cache/llm/"
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_MB = 50
+
+# Чтение кэша отключается при принудительной генерации (force): ответы
+# запрашиваются у модели заново и перезаписывают записи кэша
+_lookup_enabled = True
+
+
+def is_cache_enabled() -> bool:
+    """Проверяет, включен ли кэш ответов (переменная окружения LLM_CACHE_ENABLED)."""
+    return os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+
+def set_cache_lookup(enabled: bool) -> None:
+    """
+    Включает или отключает чтение кэша в текущем запуске.
+
+    Контейнер Lambda переиспользуется между вызовами, поэтому значение
+    задается в начале каждой генерации дайджеста.
+
+    Args:
+        enabled: Брать ответы из кэша
+    """
+    global _lookup_enabled
+    _lookup_enabled = enabled
+
+
+def get_cache_key(params: dict[str, Any]) -> str:
+    """
+    Возвращает ключ кэша для запроса к модели.
+
+    Ключ - хэш модели, параметров генерации и сообщений: любой измененный
+    параметр или символ промпта дает другой ключ.
+
+    Args:
+        params: Параметры chat.completions.create
+
+    Returns:
+        str: Ключ в хранилище
+    """
+    digest = hashlib.sha256(
+        json.dumps(params, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"{LLM_CACHE_PREFIX}{digest}.json"
+
+
+def get_cached_response(params: dict[str, Any]) -> str | None:
+    """
+    Возвращает сохраненный ответ модели на такой же запрос.
+
+    Args:
+        params: Параметры chat.completions.create
+
+    Returns:
+        str | None: Текст ответа или None, если ответа нет или он устарел
+    """
+    if not is_cache_enabled() or not _lookup_enabled:
+        return None
+
+    try:
+        content = get_storage().get(get_cache_key(params))
+        if content is None:
+            return None
+
+        entry = json.loads(content)
+        ttl = timedelta(days=float(os.environ.get("LLM_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)))
+        if datetime.fromisoformat(entry["created_at"]) + ttl < datetime.now(timezone.utc):
+            return None
+        return entry["content"]
+    except Exception as e:
+        # Кэш не должен мешать генерации дайджеста
+        print(f"⚠️  Ошибка чтения кэша ответов модели: {e}")
+        return None
+
+
+def save_response(params: dict[str, Any], content: str, finish_reason: str) -> None:
+    """
+    Сохраняет ответ модели в кэш.
+
+    Сохраняются только полные ответы (finish_reason == "stop"): обрезанный
+    по max_tokens или отфильтрованный ответ иначе возвращался бы из кэша
+    до истечения LLM_CACHE_TTL_DAYS. Ответ на запрос с response_format
+    json_object сохраняется, только если он разбирается как JSON.
+
+    Args:
+        params: Параметры chat.completions.create
+        content: Текст ответа
+        finish_reason: Причина завершения ответа модели
+    """
+    if not is_cache_enabled() or not content or finish_reason != "stop":
+        return
+
+    if (params.get("response_format") or {}).get("type") == "json_object":
+        try:
+            json.loads(content)
+        except json.JSONDecodeError:
+            return
+
+    entry = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model": params.get("model"),
+        "content": content,
+    }
+    try:
+        get_storage().put(get_cache_key(params), json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+    except Exception as e:
+        print(f"⚠️  Ошибка сохранения ответа модели в кэш: {e}")
+
+
+def evict_cache() -> int:
+    """
+    Удаляет устаревшие записи кэша и самые старые записи сверх лимита размера.
+
+    Срок хранения задается LLM_CACHE_TTL_DAYS, лимит - LLM_CACHE_MAX_MB.
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    if not is_cache_enabled():
+        return 0
+
+    storage = get_storage()
+    ttl = timedelta(days=float(os.environ.get("LLM_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)))
+    max_bytes = float(os.environ.get("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+    expire_before = datetime.now(timezone.utc) - ttl
+
+    try:
+        # Размер и время записей приходят в листинге, без head для каждой записи
+        entries = list(storage.list_objects(LLM_CACHE_PREFIX).items())
+        # Сначала самые новые: они остаются в пределах лимита
+        entries.sort(key=lambda entry: entry[1]["last_modified"], reverse=True)
+
+        total_bytes = 0
+        expired = []
+        for key, metadata in entries:
+            if metadata["last_modified"] < expire_before or total_bytes + metadata["size"] > max_bytes:
+                expired.append(key)
+            else:
+                total_bytes += metadata["size"]
+
+        for key in expired:
+            storage.delete(key)
+    except Exception as e:
+        print(f"⚠️  Ошибка очистки кэша ответов модели: {e}")
+        return 0
+
+    if expired:
+        print(f"🧹 Из кэша ответов модели удалено записей: {len(expired)}")
+    return len(expired)
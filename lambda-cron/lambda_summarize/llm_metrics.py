@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from tracing import emit_emf
+
+# Цены моделей в долларах за 1 млн токенов: (промпт, ответ).
+# Переопределяются через LLM_PRICING, например {"gpt-4.1-mini": [0.4, 1.6]}
+DEFAULT_PRICING = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+@dataclass
+class LLMCall:
+    """Сведения об одном запросе к модели."""
+
+    stage: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms: float
+    retries: int
+    cost_usd: float
+    cached: bool
+
+
+def get_pricing() -> dict[str, tuple[float, float]]:
+    """
+    Возвращает цены моделей с учетом переменной окружения LLM_PRICING.
+
+    Returns:
+        dict: Модель -> (цена 1 млн токенов промпта, цена 1 млн токенов ответа)
+    """
+    pricing = dict(DEFAULT_PRICING)
+    pricing_str = os.environ.get("LLM_PRICING", "").strip()
+    if pricing_str:
+        try:
+            pricing.update({model: tuple(prices) for model, prices in json.loads(pricing_str).items()})
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            print(f"⚠️  LLM_PRICING содержит некорректный JSON: {e}")
+    return pricing
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Оценивает стоимость запроса.
+
+    Модели с суффиксом даты (gpt-4.1-mini-2025-04-14) считаются по цене базовой модели.
+
+    Args:
+        model: Название модели
+        prompt_tokens: Токены промпта
+        completion_tokens: Токены ответа
+
+    Returns:
+        float: Стоимость в долларах (0, если цена модели неизвестна)
+    """
+    pricing = get_pricing()
+    prices = pricing.get(model)
+    if prices is None:
+        # Самое длинное совпадающее название, чтобы gpt-4.1-mini-... не считался как gpt-4.1
+        matches = [name for name in pricing if model.startswith(f"{name}-")]
+        if not matches:
+            return 0.0
+        prices = pricing[max(matches, key=len)]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class LLMMetrics:
+    """
+    Сборщик метрик запросов к модели за один запуск суммаризации.
+
+    Запросы выполняются из нескольких потоков, поэтому записи добавляются
+    под блокировкой. Повтором считается неудачная попытка запроса с теми
+    же параметрами перед успешной.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: list[LLMCall] = []
+        self._failures: dict[str, int] = {}
+        self.started_at = datetime.now(timezone.utc)
+
+    def record_failure(self, request_key: str) -> None:
+        """
+        Отмечает неудачную попытку запроса.
+
+        Args:
+            request_key: Ключ запроса (хэш параметров)
+        """
+        with self._lock:
+            self._failures[request_key] = self._failures.get(request_key, 0) + 1
+
+    def record_call(
+        self,
+        request_key: str,
+        stage: str,
+        model: str,
+        usage: Any,
+        latency_ms: float,
+        cached: bool = False,
+    ) -> LLMCall:
+        """
+        Сохраняет успешный запрос и печатает его метрики.
+
+        Args:
+            request_key: Ключ запроса (хэш параметров)
+            stage: Этап генерации дайджеста
+            model: Модель
+            usage: response.usage ответа (None для ответа из кэша)
+            latency_ms: Время запроса в миллисекундах
+            cached: Ответ взят из кэша
+
+        Returns:
+            LLMCall: Сведения о запросе
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        with self._lock:
+            retries = self._failures.pop(request_key, 0)
+            call = LLMCall(
+                stage=stage,
+                model=model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                latency_ms=round(latency_ms, 1),
+                retries=retries,
+                cost_usd=estimate_cost(model, prompt_tokens, completion_tokens),
+                cached=cached,
+            )
+            self.calls.append(call)
+
+        emit_emf(
+            {
+                "PromptTokens": (call.prompt_tokens, "Count"),
+                "CompletionTokens": (call.completion_tokens, "Count"),
+                "Latency": (call.latency_ms, "Milliseconds"),
+                "Retries": (call.retries, "Count"),
+                "CostUSD": (call.cost_usd, "None"),
+                "CacheHits": (int(call.cached), "Count"),
+            },
+            {"Stage": stage, "Model": model},
+        )
+        return call
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Возвращает итоги запуска: суммы по всем запросам, по этапам и список запросов.
+
+        Returns:
+            dict: Итоги запуска
+        """
+        with self._lock:
+            calls = list(self.calls)
+            failed_attempts = sum(self._failures.values())
+
+        def totals(stage_calls: list[LLMCall]) -> dict[str, Any]:
+            return {
+                "calls": len(stage_calls),
+                "cached_calls": sum(call.cached for call in stage_calls),
+                "prompt_tokens": sum(call.prompt_tokens for call in stage_calls),
+                "completion_tokens": sum(call.completion_tokens for call in stage_calls),
+                "retries": sum(call.retries for call in stage_calls),
+                "latency_ms": round(sum(call.latency_ms for call in stage_calls), 1),
+                "cost_usd": round(sum(call.cost_usd for call in stage_calls), 6),
+            }
+
+        stages: dict[str, list[LLMCall]] = {}
+        for call in calls:
+            stages.setdefault(call.stage, []).append(call)
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": round((datetime.now(timezone.utc) - self.started_at).total_seconds(), 3),
+            "totals": {**totals(calls), "failed_attempts": failed_attempts},
+            "stages": {stage: totals(stage_calls) for stage, stage_calls in stages.items()},
+            "calls": [asdict(call) for call in calls],
+        }
+
+    def emit_summary(self, **dimensions: str) -> dict[str, Any]:
+        """
+        Печатает итоговые метрики запуска в формате EMF.
+
+        Args:
+            **dimensions: Измерения метрик (например, режим топ-постов)
+
+        Returns:
+            dict: Итоги запуска (см. summary)
+        """
+        summary = self.summary()
+        totals = summary["totals"]
+        emit_emf(
+            {
+                "RunPromptTokens": (totals["prompt_tokens"], "Count"),
+                "RunCompletionTokens": (totals["completion_tokens"], "Count"),
+                "RunCostUSD": (totals["cost_usd"], "None"),
+                "RunLLMCalls": (totals["calls"], "Count"),
+                "RunRetries": (totals["retries"], "Count"),
+                "RunDuration": (summary["duration_seconds"], "Seconds"),
+            },
+            dimensions,
+        )
+        print(
+            f"💰 Запросов к модели: {totals['calls']} (из кэша: {totals['cached_calls']}), "
+            f"токенов: {totals['prompt_tokens']} + {totals['completion_tokens']}, "
+            f"стоимость: ${totals['cost_usd']:.4f}"
+        )
+        return summary
+
+
+_current_metrics = LLMMetrics()
+
+
+def start_run() -> LLMMetrics:
+    """
+    Начинает сбор метрик нового запуска.
+
+    Контейнер Lambda переиспользуется между вызовами, поэтому метрики
+    предыдущего запуска сбрасываются.
+
+    Returns:
+        LLMMetrics: Сборщик метрик запуска
+    """
+    global _current_metrics
+    _current_metrics = LLMMetrics()
+    return _current_metrics
+
+
+def get_metrics() -> LLMMetrics:
+    """Возвращает сборщик метрик текущего запуска."""
+    return _current_metrics
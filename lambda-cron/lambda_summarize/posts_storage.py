@@ -0,0 +1,236 @@
+import time
+from typing import Any, Iterable, Iterator
+
+from storage import get_storage, iter_ndjson_lines
+from tracing import record as record_span, span
+from utils import download_from_s3
+
+HEADER_FIELD = "_header"
+FOOTER_FIELD = "_footer"
+
+# Версия формата NDJSON в заголовке объекта. Увеличивается при несовместимых
+# изменениях, чтобы старый код не прочитал новый объект неправильно
+FORMAT_VERSION = 1
+FORMAT_VERSION_FIELD = "format_version"
+
+# Поле индекса отфильтрованных постов со списком id
+POST_IDS_FIELD = "post_ids"
+
+
+def is_ndjson_key(s3_key: str) -> bool:
+    """
+    Проверяет, хранится ли объект в формате NDJSON (по расширению ключа).
+
+    Args:
+        s3_key: Ключ в S3
+
+    Returns:
+        bool: True для .ndjson и .ndjson.gz
+    """
+    return s3_key.endswith(".ndjson") or s3_key.endswith(".ndjson.gz")
+
+
+def iter_ndjson_records(s3_key: str, bucket_name: str = None) -> Iterator[dict[str, Any]]:
+    """
+    Построчно читает NDJSON объект из S3, включая заголовок и итоговую строку.
+
+    Объект читается частями, gzip распаковывается на лету.
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Yields:
+        dict: Записи объекта
+    """
+    with span("s3.stream", log=False):
+        metadata, chunks = get_storage(bucket_name).stream(s3_key)
+
+    gzipped = s3_key.endswith(".gz") or metadata["content_encoding"] == "gzip"
+    yield from iter_ndjson_lines(timed_chunks(chunks), gzipped)
+
+
+def timed_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Замеряет чтение частей объекта из хранилища (s3.read в отчете запуска).
+
+    Учитывается только ожидание очередной части, а не разбор строк и
+    обработка постов между частями.
+
+    Args:
+        chunks: Части объекта
+
+    Yields:
+        bytes: Те же части
+    """
+    chunks = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        record_span("s3.read", (time.perf_counter() - started) * 1000, bytes=len(chunk))
+        yield chunk
+
+
+def check_format_version(header: dict[str, Any]) -> None:
+    """
+    Проверяет, что версия формата объекта поддерживается.
+
+    Объекты без версии записаны до ее появления и читаются как версия 1.
+
+    Args:
+        header: Заголовок NDJSON объекта
+
+    Raises:
+        ValueError: Объект записан более новой версией формата
+    """
+    version = header.get(FORMAT_VERSION_FIELD, 1)
+    if version > FORMAT_VERSION:
+        raise ValueError(
+            f"Неподдерживаемая версия формата постов: {version} (поддерживается до {FORMAT_VERSION})"
+        )
+
+
+def iter_posts(s3_key: str, bucket_name: str = None) -> Iterator[dict[str, Any]]:
+    """
+    Потоково читает посты из NDJSON объекта, пропуская служебные строки.
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Yields:
+        dict: Посты
+    """
+    for record in iter_ndjson_records(s3_key, bucket_name):
+        if HEADER_FIELD not in record and FOOTER_FIELD not in record:
+            yield record
+
+
+def read_posts_document(s3_key: str, bucket_name: str = None) -> dict[str, Any]:
+    """
+    Читает NDJSON объект целиком в тот же вид, что и JSON документ постов.
+
+    Поля заголовка и итоговой строки переносятся на верхний уровень,
+    посты собираются в список "posts".
+
+    Args:
+        s3_key: Ключ в S3
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        dict: Документ постов
+    """
+    document = {}
+    posts = []
+
+    for record in iter_ndjson_records(s3_key, bucket_name):
+        if HEADER_FIELD in record:
+            check_format_version(record[HEADER_FIELD])
+            document.update(record[HEADER_FIELD])
+        elif FOOTER_FIELD in record:
+            document.update(record[FOOTER_FIELD])
+        else:
+            posts.append(record)
+
+    document["posts"] = posts
+    return document
+
+
+def open_posts_document(
+    s3_key: str, bucket_name: str = None
+) -> tuple[dict[str, Any], Iterator[dict[str, Any]]]:
+    """
+    Открывает документ постов любого формата для потокового чтения.
+
+    Для NDJSON посты читаются из S3 по мере итерации; JSON документ
+    загружается целиком, как и раньше.
+
+    Args:
+        s3_key: Ключ в S3 (.json, .ndjson или .ndjson.gz)
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        tuple: (метаданные из заголовка документа, итератор постов)
+    """
+    if not is_ndjson_key(s3_key):
+        document = download_from_s3(s3_key, bucket_name)
+        posts = document.pop("posts")
+        return document, iter(posts)
+
+    records = iter_ndjson_records(s3_key, bucket_name)
+    first_record = next(records, None)
+
+    if first_record is None:
+        return {}, iter(())
+
+    if HEADER_FIELD in first_record:
+        header = first_record[HEADER_FIELD]
+        check_format_version(header)
+        leading = []
+    else:
+        header = {}
+        leading = [first_record]
+
+    def posts_iterator() -> Iterator[dict[str, Any]]:
+        for record in leading:
+            if FOOTER_FIELD not in record:
+                yield record
+        for record in records:
+            if HEADER_FIELD not in record and FOOTER_FIELD not in record:
+                yield record
+
+    return header, posts_iterator()
+
+
+def load_posts_document(s3_key: str, bucket_name: str = None) -> dict[str, Any]:
+    """
+    Загружает документ постов любого формата в виде словаря с ключом "posts".
+
+    Args:
+        s3_key: Ключ в S3 (.json, .ndjson или .ndjson.gz)
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        dict: Документ постов
+    """
+    if is_ndjson_key(s3_key):
+        return read_posts_document(s3_key, bucket_name)
+    return download_from_s3(s3_key, bucket_name)
+
+
+def load_day_posts(
+    filtered_posts_s3_key: str, all_posts_s3_key: str, bucket_name: str = None
+) -> tuple[dict[str, Any], list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Загружает посты дня и выделяет из них отфильтрованные.
+
+    Отфильтрованные посты хранятся как индекс id по файлу всех постов,
+    поэтому файл дня читается один раз, а оба списка содержат одни и те же
+    объекты постов. Прежний формат (полная копия отфильтрованных постов)
+    по-прежнему поддерживается.
+
+    Args:
+        filtered_posts_s3_key: Ключ S3 индекса (или документа) отфильтрованных постов
+        all_posts_s3_key: Ключ S3 со всеми постами
+        bucket_name: Имя бакета (по умолчанию из переменной окружения)
+
+    Returns:
+        tuple: (метаданные фильтрации, отфильтрованные посты, все посты)
+    """
+    filtered_data = load_posts_document(filtered_posts_s3_key, bucket_name)
+
+    if POST_IDS_FIELD not in filtered_data:
+        filtered_posts = filtered_data.pop("posts")
+        _, posts = open_posts_document(all_posts_s3_key, bucket_name)
+        return filtered_data, filtered_posts, list(posts)
+
+    check_format_version(filtered_data)
+    post_ids = set(filtered_data.pop(POST_IDS_FIELD))
+    _, posts = open_posts_document(
+        filtered_data.get("all_posts_s3_key", all_posts_s3_key), bucket_name
+    )
+    all_posts = list(posts)
+    filtered_posts = [post for post in all_posts if post["id"] in post_ids]
+    return filtered_data, filtered_posts, all_posts
@@ -0,0 +1,197 @@
+import json
+import math
+from functools import lru_cache
+from typing import Any
+
+try:
+    import tiktoken
+except ImportError:  # Необязательная зависимость: без нее размер оценивается по символам
+    tiktoken = None
+
+# Кодировка моделей gpt-4o/gpt-4.1
+TIKTOKEN_ENCODING = "o200k_base"
+# Оценка без tiktoken: в среднем около 4 символов на токен
+CHARS_PER_TOKEN = 4
+
+# Длины selftext, которые последовательно пробуются, пока промпт не уложится в бюджет
+SELFTEXT_LIMITS = (200, 100, 50)
+# Длина selftext при разбиении постов на части
+SPLIT_SELFTEXT_LIMIT = 100
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    except Exception as e:
+        # Файл кодировки скачивается при первом использовании и может быть недоступен
+        print(f"⚠️  tiktoken недоступен ({e}), размер промпта оценивается по символам")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Считает токены текста.
+
+    Используется tiktoken, если он установлен, иначе - оценка по количеству символов.
+
+    Args:
+        text: Текст
+
+    Returns:
+        int: Количество токенов
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def encode_posts(posts: list[dict[str, Any]]) -> str:
+    """
+    Сериализует посты для промпта компактным JSON без отступов.
+
+    Args:
+        posts: Посты
+
+    Returns:
+        str: JSON массив
+    """
+    return json.dumps(posts, ensure_ascii=False, separators=(",", ":"))
+
+
+def truncate_selftext(posts: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
+    """
+    Укорачивает selftext постов.
+
+    Args:
+        posts: Посты
+        limit: Максимальная длина selftext
+
+    Returns:
+        list: Копии постов с укороченным текстом
+    """
+    return [{**post, "selftext": (post.get("selftext") or "")[:limit]} for post in posts]
+
+
+def _post_tokens(posts: list[dict[str, Any]]) -> list[int]:
+    # Запятая между элементами массива - еще примерно один токен
+    return [count_tokens(encode_posts([post])) + 1 for post in posts]
+
+
+def pack_posts(
+    posts: list[dict[str, Any]],
+    budget_tokens: int,
+    selftext_limits: tuple[int, ...] = SELFTEXT_LIMITS,
+) -> tuple[str, int, int] | None:
+    """
+    Укладывает посты в бюджет токенов, укорачивая selftext.
+
+    Длины selftext пробуются по убыванию, выбирается первая, при которой
+    все посты помещаются в бюджет.
+
+    Args:
+        posts: Посты
+        budget_tokens: Бюджет токенов на данные постов
+        selftext_limits: Допустимые длины selftext по убыванию
+
+    Returns:
+        tuple | None: (данные для промпта, количество токенов, длина selftext)
+            или None, если посты не помещаются даже с самым коротким текстом
+    """
+    for limit in selftext_limits:
+        data = encode_posts(truncate_selftext(posts, limit))
+        tokens = count_tokens(data)
+        if tokens <= budget_tokens:
+            return data, tokens, limit
+    return None
+
+
+def split_posts(
+    posts: list[dict[str, Any]],
+    budget_tokens: int,
+    selftext_limit: int = SPLIT_SELFTEXT_LIMIT,
+) -> list[tuple[str, int]]:
+    """
+    Разбивает посты на части, каждая из которых помещается в бюджет токенов.
+
+    Посты идут в исходном порядке и добавляются в текущую часть, пока она
+    помещается в бюджет. Пост, который сам по себе больше бюджета,
+    образует отдельную часть.
+
+    Args:
+        posts: Посты
+        budget_tokens: Бюджет токенов на данные постов одной части
+        selftext_limit: Длина selftext
+
+    Returns:
+        list: Части в виде (данные для промпта, количество токенов)
+    """
+    posts = truncate_selftext(posts, selftext_limit)
+
+    chunks = []
+    chunk_start = 0
+    chunk_tokens = 0
+    for index, tokens in enumerate(_post_tokens(posts)):
+        if chunk_tokens + tokens > budget_tokens and index > chunk_start:
+            chunks.append((encode_posts(posts[chunk_start:index]), chunk_tokens))
+            chunk_start, chunk_tokens = index, 0
+        chunk_tokens += tokens
+
+    if chunk_start < len(posts):
+        chunks.append((encode_posts(posts[chunk_start:]), chunk_tokens))
+    return chunks
+
+
+def split_texts(texts: list[str], budget_tokens: int) -> list[list[str]]:
+    """
+    Разбивает тексты на группы по порядку так, чтобы группа помещалась в бюджет токенов.
+
+    В каждой группе, кроме, может быть, последней, не меньше двух текстов,
+    даже если пара не помещается в бюджет: так объединение групп всегда
+    уменьшает количество текстов.
+
+    Args:
+        texts: Тексты
+        budget_tokens: Бюджет токенов одной группы
+
+    Returns:
+        list: Группы текстов
+    """
+    groups = []
+    group: list[str] = []
+    group_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if len(group) >= 2 and group_tokens + tokens > budget_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def report_tokens(stage: str, prompt: str, budget_tokens: int = None, **details: Any) -> int:
+    """
+    Печатает размер промпта этапа в токенах.
+
+    Args:
+        stage: Название этапа
+        prompt: Промпт
+        budget_tokens: Бюджет этапа (если есть)
+        **details: Дополнительные сведения для лога
+
+    Returns:
+        int: Количество токенов промпта
+    """
+    tokens = count_tokens(prompt)
+    method = "tiktoken" if _get_encoding() is not None else f"~{CHARS_PER_TOKEN} символа/токен"
+    budget = f" из {budget_tokens}" if budget_tokens else ""
+    extra = "".join(f", {key}={value}" for key, value in details.items())
+    print(f"📏 {stage}: {tokens}{budget} токенов ({method}{extra})")
+    return tokens
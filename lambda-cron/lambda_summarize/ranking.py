@@ -0,0 +1,97 @@
+import os
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(frozen=True)
+class RankingConfig:
+    """
+    Параметры локального ранжирования постов.
+
+    Вес поста - score_weight * score + comments_weight * num_comments
+    (у схлопнутых дубликатов - суммы по группе group_score и group_comments),
+    умноженный на 0.5 в степени (возраст поста / half_life_hours), где
+    возраст считается от самого нового поста дня. half_life_hours = 0
+    отключает затухание.
+    """
+
+    top_n: int = 10
+    score_weight: float = 1.0
+    comments_weight: float = 1.0
+    half_life_hours: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RankingConfig":
+        """
+        Создает параметры из переменных окружения TOP_POSTS_LIMIT,
+        RANK_SCORE_WEIGHT, RANK_COMMENTS_WEIGHT и RANK_HALF_LIFE_HOURS.
+
+        Returns:
+            RankingConfig: Параметры ранжирования
+        """
+        return cls(
+            top_n=int(os.environ.get("TOP_POSTS_LIMIT", cls.top_n)),
+            score_weight=float(os.environ.get("RANK_SCORE_WEIGHT", cls.score_weight)),
+            comments_weight=float(os.environ.get("RANK_COMMENTS_WEIGHT", cls.comments_weight)),
+            half_life_hours=float(os.environ.get("RANK_HALF_LIFE_HOURS", cls.half_life_hours)),
+        )
+
+
+def rank_value(post: dict[str, Any], config: RankingConfig, reference_utc: float) -> float:
+    """
+    Вычисляет вес поста для ранжирования.
+
+    Args:
+        post: Пост
+        config: Параметры ранжирования
+        reference_utc: Момент, от которого считается возраст поста
+
+    Returns:
+        float: Вес поста
+    """
+    value = (
+        config.score_weight * post.get("group_score", post["score"])
+        + config.comments_weight * post.get("group_comments", post["num_comments"])
+    )
+    if config.half_life_hours > 0:
+        age_hours = max(reference_utc - post.get("created_utc", reference_utc), 0) / 3600
+        value *= 0.5 ** (age_hours / config.half_life_hours)
+    return value
+
+
+def rank_posts(
+    posts: list[dict[str, Any]], config: RankingConfig = None
+) -> dict[str, list[dict[str, Any]]]:
+    """
+    Выбирает лучшие посты каждого сабреддита.
+
+    Порядок полностью определяется данными: при равном весе посты
+    сравниваются по score, комментариям и id. Сабреддиты идут в порядке
+    первого появления в списке постов.
+
+    Args:
+        posts: Посты
+        config: Параметры ранжирования (по умолчанию из переменных окружения)
+
+    Returns:
+        dict: Сабреддит -> до top_n постов по убыванию веса
+    """
+    config = config or RankingConfig.from_env()
+    reference_utc = max((post.get("created_utc", 0) for post in posts), default=0)
+
+    posts_by_subreddit: dict[str, list[dict[str, Any]]] = {}
+    for post in posts:
+        posts_by_subreddit.setdefault(post["subreddit"], []).append(post)
+
+    return {
+        subreddit: sorted(
+            subreddit_posts,
+            key=lambda post: (
+                -rank_value(post, config, reference_utc),
+                -post["score"],
+                -post["num_comments"],
+                post.get("id", ""),
+            ),
+        )[:config.top_n]
+        for subreddit, subreddit_posts in posts_by_subreddit.items()
+    }
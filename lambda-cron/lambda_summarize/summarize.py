@@ -1,62 +1,166 @@
 import json
 import os
-from typing import Any
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
 
-import openai
-from openai import OpenAI
 from tenacity import (
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     stop_after_attempt,
     wait_exponential,
 )
 
-from utils import download_from_s3, format_date_for_digest, upload_to_s3
+from dedupe import dedupe_posts
+from llm_cache import evict_cache, get_cache_key, get_cached_response, save_response, set_cache_lookup
+from llm_metrics import get_metrics, start_run
+from posts_storage import load_day_posts
+from prompt_packer import count_tokens, pack_posts, report_tokens, split_posts, split_texts
+from ranking import RankingConfig, rank_posts
+from stages import StageRunner
+from tracing import add_counters, in_current_span, record_retry, span, traced
+from utils import format_date_for_digest, upload_to_s3
+
+TOP_POSTS_REVIEW_TEXT = (
+    "Сделай обзор полученного списка постов, исключи при этом юмористические посты, "
+    "мемы и картинки видеоролики. Сделай упор на технические публикации и описания "
+    "пользовательского опыта.\n\n"
+)
+TOP_POSTS_ITEM_FORMAT = "1. **[Заголовок]** — краткое описание (👍 [score] | 💬 [comments]) [🔗 Ссылка](permalink)"
+TOP_POSTS_LINKS_TEXT = (
+    "ВАЖНО: Для каждого поста используй точную ссылку из поля 'permalink' в формате [🔗 Ссылка](permalink_url). "
+)
+MINOR_SECTION_TITLE = "Прочие сабреддиты"
+SECTION_MAX_TOKENS = 3000
+
+DESCRIPTIONS_INSTRUCTIONS = (
+    "Для каждого поста из Reddit напиши краткое описание на русском языке в 1-2 предложения: "
+    "о чем пост и чем он интересен. Сделай упор на технические подробности и пользовательский опыт. "
+    "Не повторяй заголовок дословно, не добавляй ссылки, оценки и количество комментариев. "
+    "Ответь JSON объектом, где ключ - id поста, значение - описание."
+)
+DESCRIPTION_SELFTEXT_CHARS = 500
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]])")
+
+DEFAULT_TRENDS_PROMPT_TOKEN_BUDGET = 100_000
+TRENDS_MAP_MAX_COMPLETION_TOKENS = 2000
+
+TRENDS_SUBREDDITS_TEXT = "Reddit сабреддитов ChatGPT, OpenAI, ClaudeAI, Bard, GeminiAI, DeepSeek и grok"
+TRENDS_FOCUS_TEXT = (
+    "Исключи юмористические посты и мемы. "
+    "Сосредоточься на технических темах, пользовательском опыте и новых возможностях ИИ. "
+)
+TRENDS_RESPONSE_FORMAT = (
+    "Каждый тренд описывай не более чем в 3 предложения - кратко и емко. "
+    "Формат ответа:\n\n"
+    "#### Общие тренды\n"
+    "* **[Название тренда]** — краткое описание в 1-3 предложения. Примерное количество постов: [число]\n"
+    "* **[Название тренда]** — краткое описание в 1-3 предложения. Примерное количество постов: [число]\n"
+    "..."
+)
+TRENDS_INSTRUCTIONS = (
+    f"Проанализируй все представленные посты из {TRENDS_SUBREDDITS_TEXT}. "
+    "Найди 5 самых важных и популярных трендов в обсуждениях. "
+    + TRENDS_FOCUS_TEXT
+    + TRENDS_RESPONSE_FORMAT
+)
+TRENDS_THEMES_FORMAT = (
+    "Для каждой темы укажи название, описание в 1-2 предложения и количество постов по теме. "
+    "Формат ответа:\n"
+    "* **[Название темы]** — описание. Постов: [число]"
+)
+TRENDS_MAP_INSTRUCTIONS = (
+    f"Ниже часть постов за день из {TRENDS_SUBREDDITS_TEXT}. "
+    "Найди до 8 самых заметных тем в этой части. "
+    + TRENDS_FOCUS_TEXT
+    + TRENDS_THEMES_FORMAT
+)
+# Промежуточное объединение ответов map, если все вместе они не помещаются
+# в бюджет промпта reduce: ответ в том же формате, что и у map
+TRENDS_COMBINE_INSTRUCTIONS = (
+    f"Ниже темы, найденные в нескольких частях постов за день из {TRENDS_SUBREDDITS_TEXT}. "
+    "Объедини одинаковые и близкие темы из разных частей, сложи количество их постов "
+    "и оставь до 8 самых заметных тем. "
+    + TRENDS_FOCUS_TEXT
+    + TRENDS_THEMES_FORMAT
+)
+TRENDS_REDUCE_INSTRUCTIONS = (
+    f"Ниже темы, найденные в нескольких частях постов за день из {TRENDS_SUBREDDITS_TEXT}. "
+    "Объедини одинаковые и близкие темы из разных частей, сложи количество их постов "
+    "и выбери 5 самых важных и популярных трендов. "
+    + TRENDS_FOCUS_TEXT
+    + TRENDS_RESPONSE_FORMAT
+)
+
+
+def _prompt_post(post: dict[str, Any]) -> dict[str, Any]:
+    prompt_post = {
+        "title": post["title"],
+        "score": post["score"],
+        "num_comments": post["num_comments"],
+        "permalink": post["permalink"],
+        "selftext": post["selftext"][:500] if post["selftext"] else "",
+        "author": post["author"],
+    }
+    # Пост схлопнут с кросс-постами: score и комментарии - его собственные
+    if post.get("duplicates"):
+        prompt_post["also_posted_in"] = sorted(
+            {f"r/{duplicate['subreddit']}" for duplicate in post["duplicates"]}
+        )
+    return prompt_post
 
 
 def prepare_prompt_data(
-    posts: list[dict[str, Any]], formatted_date_for_digest: str
+    posts: list[dict[str, Any]],
+    formatted_date_for_digest: str,
+    top_posts_mode: str = "single",
+    ranking_config: RankingConfig = None,
 ) -> dict[str, Any]:
     """
     Подготавливает данные для отправки в API с логикой группировки.
 
+    В режиме ranked лучшие посты каждого сабреддита выбираются локально
+    (rank_posts), и в данные попадают только они в порядке ранжирования.
+    В режимах single и sections модель получает все посты в исходном порядке.
+
     Args:
         posts: Список отфильтрованных постов
         formatted_date_for_digest: Дата в формате DD-MM-YYYY для использования в заголовке
+        top_posts_mode: Режим генерации топ-постов
+        ranking_config: Параметры ранжирования (по умолчанию из переменных окружения)
 
     Returns:
         Dict: Данные для промпта
     """
     posts_by_subreddit = {}
+    post_counts = Counter(post["subreddit"] for post in posts)
 
-    for post in posts:
-        subreddit = post["subreddit"]
-        if subreddit not in posts_by_subreddit:
-            posts_by_subreddit[subreddit] = []
+    if top_posts_mode == "ranked":
+        grouped_posts = rank_posts(posts, ranking_config)
+    else:
+        grouped_posts = {}
+        for post in posts:
+            grouped_posts.setdefault(post["subreddit"], []).append(post)
 
-        posts_by_subreddit[subreddit].append(
-            {
-                "title": post["title"],
-                "score": post["score"],
-                "num_comments": post["num_comments"],
-                "permalink": post["permalink"],
-                "selftext": post["selftext"][:500] if post["selftext"] else "",
-                "author": post["author"],
-            }
-        )
+    for subreddit, subreddit_posts in grouped_posts.items():
+        posts_by_subreddit[subreddit] = [_prompt_post(post) for post in subreddit_posts]
 
     # Разделяем сабреддиты по количеству постов
-    major_subreddits = {k: v for k, v in posts_by_subreddit.items() if len(v) >= 5}
-    minor_subreddits = {k: v for k, v in posts_by_subreddit.items() if len(v) < 5}
+    major_subreddits = {k: v for k, v in posts_by_subreddit.items() if post_counts[k] >= 5}
+    minor_subreddits = {k: v for k, v in posts_by_subreddit.items() if post_counts[k] < 5}
 
     return {
         "major_subreddits": major_subreddits,
         "minor_subreddits": minor_subreddits,
+        "ranked_posts": grouped_posts,
+        "digest_header": f"# Дайджест Reddit • {formatted_date_for_digest}",
         "instructions": (
-            "Сделай обзор полученного списка постов, исключи при этом юмористические посты, "
-            "мемы и картинки видеоролики. Сделай упор на технические публикации и описания "
-            "пользовательского опыта.\n\n"
-            "ЛОГИКА ГРУППИРОВКИ:\n"
+            TOP_POSTS_REVIEW_TEXT
+            + "ЛОГИКА ГРУППИРОВКИ:\n"
             "1. Для сабреддитов с 5 и более постами: создай отдельные секции, выведи до 10 наиболее популярных постов\n"
             "2. Для сабреддитов с менее чем 5 постами: объедини их в общий раздел 'Прочие сабреддиты'\n\n"
             "ОБЯЗАТЕЛЬНО добавляй ссылки на посты. Используй формат:\n\n"
@@ -69,18 +173,387 @@ def prepare_prompt_data(
             "### r/[Subreddit]\n"
             "1. **[Заголовок]** — краткое описание (👍 [score] | 💬 [comments]) [🔗 Ссылка](permalink)\n"
             "...\n\n"
-            "ВАЖНО: Для каждого поста используй точную ссылку из поля 'permalink' в формате [🔗 Ссылка](permalink_url). "
-            "НЕ добавляй раздел с трендами - он будет добавлен отдельно."
+            + TOP_POSTS_LINKS_TEXT
+            + "НЕ добавляй раздел с трендами - он будет добавлен отдельно."
         ),
     }
 
 
+_openai_clients: dict[str, Any] = {}
+_openai_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key: str):
+    """
+    Возвращает общий клиент OpenAI для API ключа.
+
+    Клиент создается один раз на процесс и переиспользуется теплыми вызовами
+    Lambda и всеми потоками генерации вместе с пулом HTTP соединений. SDK
+    импортируется при первом запросе: если все ответы берутся из кэша или
+    этапы уже выполнены, он не загружается.
+
+    Args:
+        api_key: API ключ OpenAI
+
+    Returns:
+        openai.OpenAI: Клиент OpenAI
+    """
+    with _openai_clients_lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=api_key)
+            _openai_clients[api_key] = client
+        return client
+
+
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """
+    Проверяет, что ошибка OpenAI API временная и запрос имеет смысл повторить.
+
+    Args:
+        error: Исключение
+
+    Returns:
+        bool: True для ошибок API, таймаутов и превышения лимита запросов
+    """
+    # Ошибка OpenAI возможна, только если SDK уже загружен клиентом
+    if "openai" not in sys.modules:
+        return False
+
+    import openai
+
+    return isinstance(error, (openai.APIError, openai.APITimeoutError, openai.RateLimitError))
+
+
+def build_section_prompt(subreddit: str | None, data: dict[str, Any]) -> str:
+    """
+    Формирует промпт одной секции топ-постов.
+
+    Args:
+        subreddit: Крупный сабреддит или None для раздела "Прочие сабреддиты"
+        data: Данные из prepare_prompt_data
+
+    Returns:
+        str: Промпт секции
+    """
+    if subreddit is None:
+        instructions = (
+            "Для каждого сабреддита выведи его посты в общем разделе. Используй формат:\n\n"
+            f"## {MINOR_SECTION_TITLE}\n"
+            "### r/[Subreddit]\n"
+            f"{TOP_POSTS_ITEM_FORMAT}\n"
+            "...\n\n"
+        )
+        analysis_data = data["minor_subreddits"]
+    else:
+        instructions = (
+            f"Выведи до 10 наиболее популярных постов сабреддита r/{subreddit}. Используй формат:\n\n"
+            f"## r/{subreddit}\n"
+            "### ТОП-10\n"
+            f"{TOP_POSTS_ITEM_FORMAT}\n"
+            "...\n\n"
+        )
+        analysis_data = {subreddit: data["major_subreddits"][subreddit]}
+
+    return (
+        f"{TOP_POSTS_REVIEW_TEXT}ОБЯЗАТЕЛЬНО добавляй ссылки на посты. {instructions}"
+        f"{TOP_POSTS_LINKS_TEXT}Выведи только эту секцию: без заголовка дайджеста, других сабреддитов и трендов."
+        f"\n\nДанные для анализа:\n{json.dumps(analysis_data, ensure_ascii=False, indent=2)}"
+    )
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=60),
+    retry=retry_if_exception(is_retryable_openai_error),
+    before_sleep=record_retry,
+)
+def call_openai_api_for_section(prompt: str, api_key: str, section: str) -> str:
+    """
+    Генерирует одну секцию топ-постов.
+
+    Args:
+        prompt: Промпт секции
+        api_key: API ключ OpenAI
+        section: Название секции для логов
+
+    Returns:
+        str: Текст секции
+    """
+    try:
+        return create_chat_completion(
+            api_key,
+            "top_posts_section",
+            model="gpt-4.1-mini",
+            temperature=0.15,
+            top_p=1.0,
+            presence_penalty=0,
+            frequency_penalty=0.1,
+            seed=42,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=SECTION_MAX_TOKENS,
+        )
+
+    except Exception as e:
+        if is_retryable_openai_error(e):
+            print(f"Ошибка OpenAI API при генерации секции {section}: {e}. Повторная попытка...")
+        else:
+            print(f"Неизвестная ошибка при вызове OpenAI API для секции {section}: {e}")
+        raise
+
+
+def call_openai_api_for_top_posts_by_section(data: dict[str, Any], api_key: str) -> str:
+    """
+    Генерирует топ-посты отдельными запросами по секциям.
+
+    Каждый крупный сабреддит и раздел "Прочие сабреддиты" генерируются
+    параллельно (не более TOP_POSTS_MAX_WORKERS запросов одновременно) и
+    собираются под заголовком дайджеста в порядке сабреддитов в данных.
+    У каждой секции свои повторы, а готовые секции сохраняются в кэше
+    ответов модели, поэтому сбой одной секции не требует генерировать
+    остальные заново.
+
+    Args:
+        data: Данные из prepare_prompt_data
+        api_key: API ключ OpenAI
+
+    Returns:
+        str: Обзор топ-постов
+    """
+    sections = list(data["major_subreddits"])
+    if data["minor_subreddits"]:
+        sections.append(None)
+
+    prompts = [build_section_prompt(subreddit, data) for subreddit in sections]
+    for subreddit, prompt in zip(sections, prompts):
+        report_tokens(f"Секция {subreddit or MINOR_SECTION_TITLE}", prompt)
+
+    def generate_section(item: tuple[str | None, str]) -> str:
+        subreddit, prompt = item
+        with span("top_posts.section", log=False):
+            return call_openai_api_for_section(prompt, api_key, subreddit or MINOR_SECTION_TITLE)
+
+    # Повторы и время каждой секции записываются в span top_posts.section
+    max_workers = max(min(int(os.environ.get("TOP_POSTS_MAX_WORKERS", "4")), len(prompts)), 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        texts = list(executor.map(in_current_span(generate_section), zip(sections, prompts)))
+
+    return "\n\n".join([data["digest_header"], *(text.strip() for text in texts)])
+
+
+def escape_markdown(text: str) -> str:
+    """Экранирует символы разметки Markdown в заголовке поста."""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", " ".join(text.split()))
+
+
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type(openai.APIError)
-    | retry_if_exception_type(openai.APITimeoutError)
-    | retry_if_exception_type(openai.RateLimitError),
+    retry=retry_if_exception(is_retryable_openai_error),
+    before_sleep=record_retry,
+)
+def request_post_descriptions(posts: list[dict[str, Any]], api_key: str) -> dict[str, str]:
+    """
+    Запрашивает у модели краткие описания постов.
+
+    Args:
+        posts: Посты, выбранные локальным ранжированием
+        api_key: API ключ OpenAI
+
+    Returns:
+        dict: Описание по id поста (посты без описания отсутствуют)
+    """
+    posts_for_descriptions = [
+        {
+            "id": post["id"],
+            "subreddit": post["subreddit"],
+            "title": post["title"],
+            "selftext": (post["selftext"] or "")[:DESCRIPTION_SELFTEXT_CHARS],
+        }
+        for post in posts
+    ]
+    prompt = (
+        f"{DESCRIPTIONS_INSTRUCTIONS}\n\nПосты:\n"
+        f"{json.dumps(posts_for_descriptions, ensure_ascii=False, separators=(',', ':'))}"
+    )
+    report_tokens("Описания топ-постов", prompt, posts=len(posts))
+
+    try:
+        content = create_chat_completion(
+            api_key,
+            "top_posts_descriptions",
+            model="gpt-4.1-mini",
+            temperature=0.15,
+            top_p=1.0,
+            presence_penalty=0,
+            frequency_penalty=0.1,
+            seed=42,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            max_tokens=8000,
+        )
+    except Exception as e:
+        if is_retryable_openai_error(e):
+            print(f"Ошибка OpenAI API при генерации описаний постов: {e}. Повторная попытка...")
+        else:
+            print(f"Неизвестная ошибка при вызове OpenAI API для описаний постов: {e}")
+        raise
+
+    try:
+        descriptions = json.loads(content)
+    except json.JSONDecodeError as e:
+        # Посты выводятся и без описаний: заголовок, числа и ссылки формируются локально
+        print(f"⚠️  Ответ модели с описаниями не является JSON: {e}")
+        return {}
+    return {str(key): str(value).strip() for key, value in descriptions.items() if value}
+
+
+def render_post_line(position: int, post: dict[str, Any], description: str | None) -> str:
+    """
+    Формирует строку поста в дайджесте.
+
+    Args:
+        position: Номер поста в секции
+        post: Пост
+        description: Описание от модели
+
+    Returns:
+        str: Строка Markdown
+    """
+    line = f"{position}. **{escape_markdown(post['title'])}**"
+    if description:
+        line += f" — {description}"
+    line += f" (👍 {post['score']} | 💬 {post['num_comments']}) [🔗 Ссылка]({post['permalink']})"
+    # Числа рядом со ссылкой относятся к этому посту, дубликаты - со своими числами и ссылками
+    if post.get("duplicates"):
+        duplicates = sorted(post["duplicates"], key=lambda duplicate: (duplicate["subreddit"], duplicate["permalink"]))
+        line += " _(также: " + ", ".join(
+            f"[r/{duplicate['subreddit']}]({duplicate['permalink']}) "
+            f"👍 {duplicate['score']} | 💬 {duplicate['num_comments']}"
+            for duplicate in duplicates
+        ) + ")_"
+    return line
+
+
+def render_top_posts(data: dict[str, Any], descriptions: dict[str, str]) -> str:
+    """
+    Собирает обзор топ-постов из локально ранжированных постов.
+
+    Структура совпадает с обзором, который генерирует модель в режимах
+    single и sections: секция ТОП-10 для каждого крупного сабреддита и
+    общий раздел для мелких.
+
+    Args:
+        data: Данные из prepare_prompt_data
+        descriptions: Описания по id поста
+
+    Returns:
+        str: Обзор топ-постов в Markdown
+    """
+    ranked_posts = data["ranked_posts"]
+    blocks = [data["digest_header"]]
+
+    for subreddit in data["major_subreddits"]:
+        lines = [f"## r/{subreddit}", f"### ТОП-{len(ranked_posts[subreddit])}"]
+        lines.extend(
+            render_post_line(position, post, descriptions.get(post["id"]))
+            for position, post in enumerate(ranked_posts[subreddit], 1)
+        )
+        blocks.append("\n".join(lines))
+
+    if data["minor_subreddits"]:
+        lines = [f"## {MINOR_SECTION_TITLE}"]
+        for subreddit in data["minor_subreddits"]:
+            lines.append(f"### r/{subreddit}")
+            lines.extend(
+                render_post_line(position, post, descriptions.get(post["id"]))
+                for position, post in enumerate(ranked_posts[subreddit], 1)
+            )
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks)
+
+
+def call_openai_api_for_top_posts_ranked(data: dict[str, Any], api_key: str) -> str:
+    """
+    Генерирует топ-посты по локальному ранжированию.
+
+    Модель пишет только описания выбранных постов, а заголовки, score,
+    количество комментариев и ссылки подставляются из данных, поэтому
+    числа и ссылки в дайджесте всегда совпадают с исходными.
+
+    Args:
+        data: Данные из prepare_prompt_data
+        api_key: API ключ OpenAI
+
+    Returns:
+        str: Обзор топ-постов
+    """
+    posts = [post for subreddit_posts in data["ranked_posts"].values() for post in subreddit_posts]
+    descriptions = request_post_descriptions(posts, api_key)
+    missing = sum(1 for post in posts if post["id"] not in descriptions)
+    if missing:
+        print(f"⚠️  Нет описаний для {missing} из {len(posts)} постов")
+    return render_top_posts(data, descriptions)
+
+
+def create_chat_completion(api_key: str, stage: str, **params: Any) -> str:
+    """
+    Выполняет запрос к модели с проверкой кэша ответов.
+
+    Запросы выполняются с фиксированным seed и низкой температурой, поэтому
+    ответ на такой же запрос (модель, параметры и промпт) берется из кэша:
+    повторные запуски и пересчет прошлых дат не обращаются к API. В кэш
+    попадают только полные ответы (llm_cache.save_response).
+
+    Токены, время ответа, повторы и стоимость каждого запроса записываются
+    в метрики запуска (llm_metrics.py).
+
+    Args:
+        api_key: API ключ OpenAI
+        stage: Этап генерации дайджеста для метрик
+        **params: Параметры chat.completions.create
+
+    Returns:
+        str: Ответ модели
+    """
+    metrics = get_metrics()
+    request_key = get_cache_key(params)
+    started = time.perf_counter()
+
+    cached = get_cached_response(params)
+    if cached is not None:
+        print(f"💾 Ответ модели взят из кэша ({len(cached)} символов)")
+        metrics.record_call(
+            request_key, stage, params["model"], None, (time.perf_counter() - started) * 1000, cached=True
+        )
+        return cached
+
+    client = get_openai_client(api_key)
+    try:
+        with span("openai.request", log=False):
+            response = client.chat.completions.create(**params)
+    except Exception:
+        metrics.record_failure(request_key)
+        raise
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    choice = response.choices[0]
+    content = choice.message.content
+    metrics.record_call(request_key, stage, params["model"], response.usage, latency_ms)
+    if choice.finish_reason != "stop":
+        print(f"⚠️  Ответ модели не завершен ({stage}): finish_reason={choice.finish_reason}")
+    save_response(params, content, choice.finish_reason)
+    return content
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=60),
+    retry=retry_if_exception(is_retryable_openai_error),
+    before_sleep=record_retry,
 )
 def call_openai_api_for_top_posts(data: dict[str, Any], api_key: str) -> str:
     """
@@ -93,8 +566,6 @@ def call_openai_api_for_top_posts(data: dict[str, Any], api_key: str) -> str:
     Returns:
         str: Сгенерированный обзор топ-постов
     """
-    client = OpenAI(api_key=api_key)
-
     # Формируем данные для анализа
     analysis_data = {
         "major_subreddits": data["major_subreddits"],
@@ -102,9 +573,12 @@ def call_openai_api_for_top_posts(data: dict[str, Any], api_key: str) -> str:
     }
 
     prompt = f"{data['instructions']}\n\nДанные для анализа:\n{json.dumps(analysis_data, ensure_ascii=False, indent=2)}"
+    report_tokens("Топ-посты", prompt)
 
     try:
-        response = client.chat.completions.create(
+        return create_chat_completion(
+            api_key,
+            "top_posts",
             model="gpt-4.1-mini",
             temperature=0.15,
             top_p=1.0,
@@ -115,67 +589,64 @@ def call_openai_api_for_top_posts(data: dict[str, Any], api_key: str) -> str:
             max_tokens=8000,
         )
 
-        return response.choices[0].message.content
-
-    except (openai.APIError, openai.APITimeoutError, openai.RateLimitError) as e:
-        print(f"Ошибка OpenAI API при генерации топ-постов: {e}. Повторная попытка...")
-        raise
     except Exception as e:
-        print(f"Неизвестная ошибка при вызове OpenAI API для топ-постов: {e}")
+        if is_retryable_openai_error(e):
+            print(f"Ошибка OpenAI API при генерации топ-постов: {e}. Повторная попытка...")
+        else:
+            print(f"Неизвестная ошибка при вызове OpenAI API для топ-постов: {e}")
         raise
 
 
+def prepare_trends_data(all_posts: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Подготавливает данные для анализа трендов - только заголовки и основная информация.
+
+    Args:
+        all_posts: Все собранные посты
+
+    Returns:
+        list: Посты с укороченным текстом
+    """
+    return [
+        {
+            "title": post["title"],
+            "subreddit": post["subreddit"],
+            "score": post["score"],
+            "num_comments": post["num_comments"],
+            "selftext": post["selftext"][:200] if post["selftext"] else "",  # Укороченный текст
+        }
+        for post in all_posts
+    ]
+
+
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type(openai.APIError)
-    | retry_if_exception_type(openai.APITimeoutError)
-    | retry_if_exception_type(openai.RateLimitError),
+    retry=retry_if_exception(is_retryable_openai_error),
+    before_sleep=record_retry,
 )
-def call_openai_api_for_trends(all_posts: list[dict[str, Any]], api_key: str) -> str:
+def request_trends_completion(
+    prompt: str, api_key: str, stage: str, max_completion_tokens: int = 8000
+) -> str:
     """
-    Отправляет все посты в OpenAI API для анализа трендов.
+    Отправляет один запрос анализа трендов в OpenAI API.
+
+    Повторы выполняются для каждого запроса отдельно, поэтому сбой одной
+    части при map-reduce не повторяет уже выполненные запросы.
 
     Args:
-        all_posts: Все собранные посты
+        prompt: Промпт
         api_key: API ключ OpenAI
+        stage: Название этапа для логов
+        max_completion_tokens: Максимальная длина ответа
 
     Returns:
-        str: Анализ трендов
+        str: Ответ модели
     """
-    client = OpenAI(api_key=api_key)
-
-    # Подготавливаем данные для анализа трендов - только заголовки и основная информация
-    posts_for_trends = []
-    for post in all_posts:
-        posts_for_trends.append(
-            {
-                "title": post["title"],
-                "subreddit": post["subreddit"],
-                "score": post["score"],
-                "num_comments": post["num_comments"],
-                "selftext": post["selftext"][:200]
-                if post["selftext"]
-                else "",  # Укороченный текст
-            }
-        )
-
-    prompt = (
-        "Проанализируй все представленные посты из Reddit сабреддитов ChatGPT, OpenAI, ClaudeAI, Bard, GeminiAI, DeepSeek и grok. "
-        "Найди 5 самых важных и популярных трендов в обсуждениях. "
-        "Исключи юмористические посты и мемы. "
-        "Сосредоточься на технических темах, пользовательском опыте и новых возможностях ИИ. "
-        "Каждый тренд описывай не более чем в 3 предложения - кратко и емко. "
-        "Формат ответа:\n\n"
-        "#### Общие тренды\n"
-        "* **[Название тренда]** — краткое описание в 1-3 предложения. Примерное количество постов: [число]\n"
-        "* **[Название тренда]** — краткое описание в 1-3 предложения. Примерное количество постов: [число]\n"
-        "...\n\n"
-        f"Данные для анализа:\n{json.dumps(posts_for_trends, ensure_ascii=False, indent=2)}"
-    )
-
     try:
-        response = client.chat.completions.create(
+        return create_chat_completion(
+            api_key,
+            f"trends_{stage}",
             model="gpt-4.1-mini",
             temperature=0.15,
             top_p=1.0,
@@ -183,90 +654,358 @@ def call_openai_api_for_trends(all_posts: list[dict[str, Any]], api_key: str) ->
             frequency_penalty=0.1,
             seed=42,
             messages=[{"role": "user", "content": prompt}],
-            max_completion_tokens=8000,
+            max_completion_tokens=max_completion_tokens,
         )
 
-        return response.choices[0].message.content
-
-    except (openai.APIError, openai.APITimeoutError, openai.RateLimitError) as e:
-        print(f"Ошибка OpenAI API при анализе трендов: {e}. Повторная попытка...")
-        raise
     except Exception as e:
-        print(f"Неизвестная ошибка при вызове OpenAI API для трендов: {e}")
+        if is_retryable_openai_error(e):
+            print(f"Ошибка OpenAI API при анализе трендов ({stage}): {e}. Повторная попытка...")
+        else:
+            print(f"Неизвестная ошибка при вызове OpenAI API для трендов ({stage}): {e}")
         raise
 
 
-def generate_digest(date_str: str, filtered_posts_s3_key: str, all_posts_s3_key: str) -> dict[str, Any]:
+def format_partial_trends(instructions: str, partial_trends: list[str]) -> str:
     """
-    Генерирует дайджест из собранных постов.
-    
+    Формирует промпт объединения тем, найденных в частях постов.
+
+    Args:
+        instructions: Инструкции (TRENDS_COMBINE_INSTRUCTIONS или TRENDS_REDUCE_INSTRUCTIONS)
+        partial_trends: Ответы по частям
+
+    Returns:
+        str: Промпт
+    """
+    return instructions + "\n\nТемы по частям:\n\n" + "\n\n".join(
+        f"### Часть {index}\n{trends}" for index, trends in enumerate(partial_trends, 1)
+    )
+
+
+def request_partial_trends(prompts: list[str], api_key: str, stage: str) -> list[str]:
+    """
+    Выполняет запросы map или combine параллельно.
+
+    Не более TRENDS_MAP_MAX_WORKERS запросов одновременно; время и повторы
+    каждого запроса записываются в span trends.{stage}.
+
+    Args:
+        prompts: Промпты
+        api_key: API ключ OpenAI
+        stage: Этап (map или combine)
+
+    Returns:
+        list: Ответы в порядке промптов
+    """
+    def request(prompt: str) -> str:
+        with span(f"trends.{stage}", log=False):
+            return request_trends_completion(prompt, api_key, stage, TRENDS_MAP_MAX_COMPLETION_TOKENS)
+
+    max_workers = max(min(int(os.environ.get("TRENDS_MAP_MAX_WORKERS", "4")), len(prompts)), 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(in_current_span(request), prompts))
+
+
+def call_openai_api_for_trends(all_posts: list[dict[str, Any]], api_key: str) -> str:
+    """
+    Отправляет все посты в OpenAI API для анализа трендов.
+
+    Размер промпта измеряется до отправки. Если посты не помещаются в
+    бюджет TRENDS_PROMPT_TOKEN_BUDGET, сначала укорачивается selftext, а
+    если и этого мало - посты разбиваются на части: темы каждой части
+    выделяются параллельно (map), затем объединяются в 5 трендов (reduce).
+    Если ответы частей вместе не помещаются в бюджет, они сначала
+    объединяются группами (combine), пока промпт reduce не уложится в него.
+
+    Args:
+        all_posts: Все собранные посты
+        api_key: API ключ OpenAI
+
+    Returns:
+        str: Анализ трендов
+    """
+    posts_for_trends = prepare_trends_data(all_posts)
+    budget_tokens = int(os.environ.get("TRENDS_PROMPT_TOKEN_BUDGET", DEFAULT_TRENDS_PROMPT_TOKEN_BUDGET))
+
+    packed = pack_posts(posts_for_trends, budget_tokens - count_tokens(TRENDS_INSTRUCTIONS))
+    if packed is not None:
+        data, _, selftext_limit = packed
+        prompt = f"{TRENDS_INSTRUCTIONS}\n\nДанные для анализа:\n{data}"
+        report_tokens("Тренды", prompt, budget_tokens, posts=len(posts_for_trends), selftext=selftext_limit)
+        return request_trends_completion(prompt, api_key, "single")
+
+    chunks = split_posts(posts_for_trends, budget_tokens - count_tokens(TRENDS_MAP_INSTRUCTIONS))
+    map_prompts = []
+    for index, (data, _) in enumerate(chunks, 1):
+        prompt = f"{TRENDS_MAP_INSTRUCTIONS}\n\nЧасть {index} из {len(chunks)}:\n{data}"
+        report_tokens(f"Тренды, map {index}/{len(chunks)}", prompt, budget_tokens)
+        map_prompts.append(prompt)
+
+    partial_trends = request_partial_trends(map_prompts, api_key, "map")
+
+    # Группа из двух ответов не меньше промпта reduce, поэтому объединять
+    # имеет смысл только три и больше ответов
+    reduce_prompt = format_partial_trends(TRENDS_REDUCE_INSTRUCTIONS, partial_trends)
+    combine_budget = budget_tokens - count_tokens(TRENDS_COMBINE_INSTRUCTIONS)
+    while len(partial_trends) > 2 and count_tokens(reduce_prompt) > budget_tokens:
+        groups = split_texts(partial_trends, combine_budget)
+        combine_prompts = [
+            format_partial_trends(TRENDS_COMBINE_INSTRUCTIONS, group) for group in groups if len(group) > 1
+        ]
+        for index, prompt in enumerate(combine_prompts, 1):
+            report_tokens(f"Тренды, combine {index}/{len(combine_prompts)}", prompt, budget_tokens)
+        combined = iter(request_partial_trends(combine_prompts, api_key, "combine"))
+        partial_trends = [next(combined) if len(group) > 1 else group[0] for group in groups]
+        reduce_prompt = format_partial_trends(TRENDS_REDUCE_INSTRUCTIONS, partial_trends)
+
+    report_tokens("Тренды, reduce", reduce_prompt, budget_tokens, parts=len(partial_trends))
+    return request_trends_completion(reduce_prompt, api_key, "reduce")
+
+
+def generate_digest_parts(
+    parts: dict[str, tuple[Callable[[Any, str], str], Any]], api_key: str
+) -> dict[str, str]:
+    """
+    Генерирует независимые части дайджеста параллельно.
+
+    Каждая часть вызывает OpenAI API в своем потоке со своими повторами,
+    поэтому общая длительность равна самому долгому вызову, а не их сумме.
+    Ответ успешно сгенерированной части сохраняется в кэше ответов модели
+    и не теряется, если другая часть завершилась ошибкой: повторный запуск
+    (в том числе автоматический повтор асинхронного вызова Lambda) возьмет
+    его из кэша.
+
+    Args:
+        parts: Название части -> (функция вызова API, аргумент функции)
+        api_key: API ключ OpenAI
+
+    Returns:
+        dict: Текст по названиям частей
+
+    Raises:
+        Exception: Хотя бы одну часть не удалось сгенерировать
+    """
+    def generate_part(part_name: str, func: Callable[[Any, str], str], argument: Any) -> str:
+        with span(f"digest.{part_name}"):
+            return func(argument, api_key)
+
+    # Span частей выполняются внутри этапа generate_digest вызывающего потока
+    generate_part = in_current_span(generate_part)
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+        futures = {
+            part_name: executor.submit(generate_part, part_name, func, argument)
+            for part_name, (func, argument) in parts.items()
+        }
+        for part_name, future in futures.items():
+            try:
+                results[part_name] = future.result()
+            except Exception as e:
+                errors[part_name] = e
+
+    if errors:
+        raise Exception("; ".join(f"{part_name}: {error}" for part_name, error in errors.items()))
+    return results
+
+
+# single - весь обзор одним запросом (по умолчанию), sections - запрос на
+# каждую секцию, ranked - модель пишет только описания локально выбранных постов
+TOP_POSTS_MODES = {
+    "ranked": call_openai_api_for_top_posts_ranked,
+    "single": call_openai_api_for_top_posts,
+    "sections": call_openai_api_for_top_posts_by_section,
+}
+
+
+def get_top_posts_mode() -> str:
+    """
+    Возвращает режим генерации топ-постов из переменной окружения TOP_POSTS_MODE.
+
+    Returns:
+        str: ranked, single или sections
+
+    Raises:
+        ValueError: Неизвестный режим
+    """
+    top_posts_mode = os.environ.get("TOP_POSTS_MODE", "single").lower()
+    if top_posts_mode not in TOP_POSTS_MODES:
+        raise ValueError(f"Неизвестный режим TOP_POSTS_MODE: {top_posts_mode}")
+    return top_posts_mode
+
+
+def get_report_s3_key(date_str: str) -> str:
+    """Возвращает ключ дайджеста за дату."""
+    return f"reports/digest_{date_str}.md"
+
+
+@traced("summarize")
+def summarize_posts(
+    date_str: str, filtered_posts_s3_key: str, all_posts_s3_key: str, top_posts_mode: str
+) -> dict[str, Any]:
+    """
+    Генерирует части дайджеста (топ-посты и тренды) из собранных постов.
+
     Args:
         date_str: Дата в формате YYYY-MM-DD
         filtered_posts_s3_key: Ключ S3 с отфильтрованными постами
         all_posts_s3_key: Ключ S3 с всеми постами
-        
+        top_posts_mode: Режим генерации топ-постов
+
     Returns:
-        dict: Результат генерации дайджеста
+        dict: Части дайджеста и статистика генерации
     """
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY не найден в переменных окружения")
 
-    # Загружаем отфильтрованные посты для топ-10
+    # Загружаем все посты для анализа трендов и отфильтрованные для топ-10.
+    # Отфильтрованные посты - индекс по файлу дня, поэтому он читается один раз
     try:
-        filtered_data = download_from_s3(filtered_posts_s3_key)
-        filtered_posts = filtered_data["posts"]
+        with span("summarize.load") as load_span:
+            _, filtered_posts, all_posts = load_day_posts(filtered_posts_s3_key, all_posts_s3_key)
+            load_span.add(items=len(all_posts))
         print(f"Загружено {len(filtered_posts)} отфильтрованных постов из S3")
-    except Exception as e:
-        raise Exception(f"Не удалось загрузить отфильтрованные данные: {e}")
-
-    # Загружаем все посты для анализа трендов
-    try:
-        all_data = download_from_s3(all_posts_s3_key)
-        all_posts = all_data["posts"]
         print(f"Загружено {len(all_posts)} всех постов для анализа трендов")
     except Exception as e:
-        raise Exception(f"Не удалось загрузить все данные: {e}")
+        raise Exception(f"Не удалось загрузить данные из S3: {e}")
 
     if not filtered_posts:
         raise Exception("Нет отфильтрованных постов для обработки")
 
+    # Одна и та же новость часто публикуется сразу в нескольких сабреддитах:
+    # схлопываем кросс-посты и почти одинаковые посты перед отправкой в LLM
+    duplicates_removed = 0
+    if os.environ.get("DEDUPE_POSTS", "true").lower() == "true":
+        with span("summarize.dedupe") as dedupe_span:
+            filtered_posts, duplicates_removed = dedupe_posts(filtered_posts)
+            all_posts, all_duplicates_removed = dedupe_posts(all_posts)
+            dedupe_span.add(items=len(all_posts) + all_duplicates_removed)
+        print(f"Удалено дубликатов: {duplicates_removed} среди отфильтрованных, "
+              f"{all_duplicates_removed} среди всех постов")
+
     # Преобразуем дату в формат DD-MM-YYYY для дайджеста
     formatted_date = format_date_for_digest(date_str)
-    prompt_data = prepare_prompt_data(filtered_posts, formatted_date)
+    prompt_data = prepare_prompt_data(filtered_posts, formatted_date, top_posts_mode)
 
-    print("Генерация топ-постов...")
-    try:
-        top_posts_digest = call_openai_api_for_top_posts(prompt_data, api_key)
-        print("Топ-посты успешно сгенерированы")
-    except Exception as e:
-        raise Exception(f"Не удалось сгенерировать топ-посты: {e}")
+    top_posts_func = TOP_POSTS_MODES[top_posts_mode]
 
-    print("Анализ трендов...")
+    print("Генерация топ-постов и анализ трендов...")
+    metrics = start_run()
     try:
-        trends_analysis = call_openai_api_for_trends(all_posts, api_key)
-        print("Анализ трендов завершен")
+        digest_parts = generate_digest_parts(
+            {
+                "top_posts": (top_posts_func, prompt_data),
+                "trends": (call_openai_api_for_trends, all_posts),
+            },
+            api_key,
+        )
+        print("Топ-посты и тренды успешно сгенерированы")
     except Exception as e:
-        raise Exception(f"Не удалось проанализировать тренды: {e}")
+        raise Exception(f"Не удалось сгенерировать дайджест: {e}")
+
+    # Итоги запросов к модели сохраняются рядом с дайджестом. Имя без префикса
+    # digest_, чтобы файл не попадал в список дайджестов веб-интерфейса
+    run_summary = {
+        "date": date_str,
+        "top_posts_mode": top_posts_mode,
+        "digest_s3_key": get_report_s3_key(date_str),
+        **metrics.emit_summary(TopPostsMode=top_posts_mode),
+    }
+    run_summary_s3_key = f"reports/run_summary_{date_str}.json"
+    if not upload_to_s3(
+        json.dumps(run_summary, ensure_ascii=False, indent=2), run_summary_s3_key, content_type="application/json"
+    ):
+        print(f"⚠️  Не удалось сохранить итоги запуска: {run_summary_s3_key}")
+
+    add_counters(items=len(all_posts))
+    return {
+        **digest_parts,
+        "top_posts_mode": top_posts_mode,
+        "run_summary_s3_key": run_summary_s3_key,
+        "llm_cost_usd": run_summary["totals"]["cost_usd"],
+        "total_filtered_posts": len(filtered_posts),
+        "total_all_posts": len(all_posts),
+        "duplicates_removed": duplicates_removed
+    }
 
+
+@traced("render")
+def render_digest(date_str: str, summary: dict[str, Any]) -> dict[str, Any]:
+    """
+    Собирает дайджест из сгенерированных частей и сохраняет его в S3.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+        summary: Результат summarize_posts
+
+    Returns:
+        dict: Ключ и размер дайджеста
+    """
     # Объединяем результаты
-    digest = top_posts_digest + "\n\n---\n\n" + trends_analysis
+    digest = summary["top_posts"] + "\n\n---\n\n" + summary["trends"]
 
     # Сохраняем дайджест в S3
-    report_s3_key = f"reports/digest_{date_str}.md"
+    report_s3_key = get_report_s3_key(date_str)
     success = upload_to_s3(digest, report_s3_key)
     
     if not success:
         raise Exception(f"Не удалось загрузить дайджест в S3: {report_s3_key}")
 
     print(f"✅ Дайджест сохранен в S3: {report_s3_key}")
+    evict_cache()
     print(f"Размер дайджеста: {len(digest)} символов")
 
+    return {"digest_s3_key": report_s3_key, "digest_size": len(digest)}
+
+
+@traced("generate_digest")
+def generate_digest(
+    date_str: str,
+    filtered_posts_s3_key: str,
+    all_posts_s3_key: str,
+    force: bool = False,
+    lease_id: str = None,
+) -> dict[str, Any]:
+    """
+    Генерирует дайджест из собранных постов.
+
+    Генерация (summarize) и сборка дайджеста (render) - этапы обработки дня
+    с отметками о завершении (stages.py): повторный вызов за ту же дату
+    пропускает выполненные этапы, если посты и режим генерации не изменились.
+    Аренду суммаризации, взятую функцией сбора перед запуском, генерация
+    снимает по завершении, в том числе с ошибкой.
+
+    Args:
+        date_str: Дата в формате YYYY-MM-DD
+        filtered_posts_s3_key: Ключ S3 с отфильтрованными постами
+        all_posts_s3_key: Ключ S3 с всеми постами
+        force: Выполнить этапы независимо от отметок и без ответов из кэша модели
+        lease_id: Аренда этапа summarize из события функции сбора
+
+    Returns:
+        dict: Результат генерации дайджеста
+    """
+    set_cache_lookup(not force)
+    runner = StageRunner(date_str)
+    top_posts_mode = get_top_posts_mode()
+
+    try:
+        summary = runner.run(
+            "summarize",
+            lambda: summarize_posts(date_str, filtered_posts_s3_key, all_posts_s3_key, top_posts_mode),
+            force=force,
+            filtered_posts_s3_key=filtered_posts_s3_key,
+            all_posts_s3_key=all_posts_s3_key,
+            top_posts_mode=top_posts_mode,
+        )
+        render_result = runner.run("render", lambda: render_digest(date_str, summary), force=force)
+    finally:
+        if lease_id:
+            runner.release_lease("summarize", lease_id)
+
     return {
         "status": "success",
         "date": date_str,
-        "digest_s3_key": report_s3_key,
-        "digest_size": len(digest),
-        "total_filtered_posts": len(filtered_posts),
-        "total_all_posts": len(all_posts)
-    }
\ No newline at end of file
+        **render_result,
+        **{key: value for key, value in summary.items() if key not in ("top_posts", "trends")},
+    }
@@ -1,8 +1,8 @@
 import json
-import os
 from datetime import datetime
 
-import boto3
+from storage import get_storage
+from tracing import span
 
 
 def upload_to_s3(content: str, s3_key: str, bucket_name: str = None, content_type: str = "text/markdown") -> bool:
@@ -18,25 +18,17 @@ def upload_to_s3(content: str, s3_key: str, bucket_name: str = None, content_typ
     Returns:
         bool: True если успешно
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=content.encode('utf-8'),
-            ContentType=content_type
-        )
-        
-        print(f"✅ Контент успешно загружен в s3://{bucket_name}/{s3_key}")
+        body = content.encode("utf-8")
+        with span("s3.put", log=False) as s3_span:
+            storage.put(s3_key, body, content_type)
+            s3_span.add(bytes=len(body))
+
+        print(f"✅ Контент успешно загружен в {storage.uri(s3_key)}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Ошибка загрузки в S3: {e}")
         return False
@@ -53,20 +45,17 @@ def download_from_s3(s3_key: str, bucket_name: str = None) -> any:
     Returns:
         any: Загруженные данные
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        
-        response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-        content = response['Body'].read().decode('utf-8')
-        
-        return json.loads(content)
-        
+        with span("s3.get", log=False) as s3_span:
+            content = storage.get(s3_key)
+            s3_span.add(bytes=len(content or b""))
+        if content is None:
+            raise FileNotFoundError(f"Объект не найден: {storage.uri(s3_key)}")
+
+        return json.loads(content.decode("utf-8"))
+
     except Exception as e:
         print(f"❌ Ошибка скачивания из S3: {e}")
         raise
@@ -101,18 +90,11 @@ def check_s3_key_exists(s3_key: str, bucket_name: str = None) -> bool:
     Returns:
         bool: True если ключ существует
     """
-    if bucket_name is None:
-        bucket_name = os.environ.get("S3_BUCKET_NAME")
-    
-    if not bucket_name:
-        raise ValueError("S3_BUCKET_NAME не найден в переменных окружения")
+    storage = get_storage(bucket_name)
 
     try:
-        s3_client = boto3.client("s3")
-        s3_client.head_object(Bucket=bucket_name, Key=s3_key)
-        return True
+        with span("s3.head", log=False):
+            return storage.head(s3_key) is not None
     except Exception as e:
-        if "NoSuchKey" in str(e) or "404" in str(e):
-            return False
         print(f"❌ Ошибка проверки ключа S3: {e}")
-        return False
\ No newline at end of file
+        return False
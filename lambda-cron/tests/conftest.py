@@ -0,0 +1,43 @@
+"""
+Общие настройки тестов lambda-cron.
+
+Модули функций импортируются напрямую, как в пакете Lambda. Общие модули
+(storage.py, utils.py, stages.py и другие) одинаковы в обоих пакетах и
+берутся из lambda_collect, модули генерации дайджеста - из lambda_summarize.
+"""
+import os
+import sys
+
+import pytest
+
+LAMBDA_CRON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for package in ("lambda_summarize", "lambda_collect"):
+    sys.path.insert(0, os.path.join(LAMBDA_CRON_DIR, package))
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Локальное хранилище во временном каталоге вместо S3."""
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_STORAGE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def make_post():
+    """Фабрика постов в формате all_posts с заполненными обязательными полями."""
+    def factory(post_id: str, subreddit: str = "MachineLearning", **fields):
+        return {
+            "id": post_id,
+            "subreddit": subreddit,
+            "title": f"Post {post_id}",
+            "selftext": "",
+            "url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+            "permalink": f"/r/{subreddit}/comments/{post_id}/",
+            "score": 0,
+            "num_comments": 0,
+            "created_utc": 1_700_000_000,
+            **fields,
+        }
+
+    return factory
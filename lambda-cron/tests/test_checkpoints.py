@@ -0,0 +1,20 @@
+"""Контрольные точки инкрементального сбора (checkpoints.py)."""
+from checkpoints import is_known_post, load_checkpoints, make_checkpoint, save_checkpoints
+
+
+def test_checkpoints_round_trip(local_storage, make_post):
+    assert load_checkpoints() == {}
+
+    checkpoints = {"a": make_checkpoint(make_post("abc", created_utc=200))}
+    assert save_checkpoints(checkpoints)
+
+    assert load_checkpoints() == {"a": {"created_utc": 200, "fullname": "t3_abc"}}
+
+
+def test_listing_stops_at_checkpoint():
+    checkpoint = {"created_utc": 200, "fullname": "t3_abc"}
+
+    assert not is_known_post("t3_new", 300, checkpoint)
+    assert is_known_post("t3_abc", 300, checkpoint)
+    assert is_known_post("t3_older", 199, checkpoint)
+    assert not is_known_post("t3_any", 0, None)
@@ -0,0 +1,102 @@
+"""Схлопывание почти одинаковых постов и кросс-постов (dedupe.py)."""
+import os
+import random
+import subprocess
+import sys
+
+import dedupe
+from dedupe import dedupe_posts, find_duplicate_clusters, minhash_signature, normalize_url
+
+TITLE = "OpenAI releases new open weights model with long context and tool use"
+
+
+def test_normalize_url_reduces_crossposts_and_tracking():
+    assert normalize_url("https://old.reddit.com/r/a/comments/abc123/title/") == "reddit:abc123"
+    assert normalize_url("/r/b/comments/abc123/") == "reddit:abc123"
+    assert normalize_url("https://redd.it/abc123") == "reddit:abc123"
+    assert normalize_url("https://www.example.com/post/?utm_source=x&id=1") == "example.com/post?id=1"
+    assert normalize_url(None) is None
+
+
+def test_near_duplicates_collapse_into_best_post(make_post):
+    posts = [
+        make_post("a", "LocalLLaMA", title=TITLE, score=10, num_comments=5),
+        make_post("b", "OpenAI", title=TITLE + "!", score=50, num_comments=1),
+        make_post("c", "MachineLearning", title="Completely different research on protein folding models"),
+    ]
+
+    deduped, removed = dedupe_posts(posts, threshold=0.6)
+
+    assert removed == 1
+    assert [post["id"] for post in deduped] == ["b", "c"]
+    best = deduped[0]
+    # Числа представителя совпадают с его ссылкой, суммы группы - отдельно
+    assert (best["score"], best["num_comments"]) == (50, 1)
+    assert (best["group_score"], best["group_comments"]) == (60, 6)
+    assert best["duplicates"] == [
+        {"subreddit": "LocalLLaMA", "permalink": posts[0]["permalink"], "score": 10, "num_comments": 5}
+    ]
+
+
+def test_same_url_alone_is_not_a_duplicate(make_post):
+    url = "https://example.com/news"
+    posts = [
+        make_post("a", title="Discussion: what this announcement means for startups", url=url),
+        make_post("b", title="Benchmarks in the announcement look cherry picked to me", url=url),
+    ]
+
+    assert find_duplicate_clusters(posts) == []
+
+
+def test_same_url_with_similar_title_is_a_duplicate(make_post):
+    url = "https://example.com/news"
+    posts = [
+        make_post("a", title=TITLE, url=url),
+        make_post("b", title=f"[News] {TITLE} today", url=url + "?utm_source=reddit"),
+    ]
+
+    assert find_duplicate_clusters(posts) == [[0, 1]]
+
+
+def test_short_titles_with_same_url_need_exact_match(make_post):
+    url = "https://example.com/image.png"
+    posts = [
+        make_post("a", title="Help", url=url),
+        make_post("b", title="help!", url=url),
+        make_post("c", title="Question", url=url),
+    ]
+
+    assert find_duplicate_clusters(posts) == [[0, 1]]
+
+
+def test_clusters_do_not_depend_on_post_order(make_post):
+    posts = [make_post(str(index), title=f"{TITLE} part {index % 2}") for index in range(6)]
+    posts += [make_post(f"other{index}", title=f"Unrelated topic number {index} about graph databases")
+              for index in range(4)]
+    expected = sorted(sorted(posts[index]["id"] for index in group) for group in find_duplicate_clusters(posts))
+    assert expected
+
+    shuffled = posts[:]
+    random.Random(1).shuffle(shuffled)
+    actual = sorted(sorted(shuffled[index]["id"] for index in group) for group in find_duplicate_clusters(shuffled))
+
+    assert actual == expected
+
+
+def test_signature_does_not_depend_on_hash_seed():
+    text = "openai releases new open weights model with long context and tool use"
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import dedupe; "
+        "print(dedupe.minhash_signature(sys.argv[2]).tolist())"
+    )
+    package_dir = os.path.dirname(dedupe.__file__)
+
+    for seed in ("1", "2"):
+        output = subprocess.run(
+            [sys.executable, "-c", script, package_dir, text],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        assert output.strip() == str(minhash_signature(text).tolist())
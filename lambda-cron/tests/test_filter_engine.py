@@ -0,0 +1,80 @@
+"""Пороги фильтрации постов (filter_engine.py)."""
+import pytest
+
+from filter_engine import FilterEngine, FilterRule
+
+
+def test_post_passes_on_score_or_comments(make_post):
+    engine = FilterEngine()
+    posts = [
+        make_post("a", score=30, num_comments=0),
+        make_post("b", score=0, num_comments=30),
+        make_post("c", score=29, num_comments=29),
+    ]
+
+    assert [post["id"] for post in engine.filter(posts)] == ["a", "b"]
+
+
+def test_top_percent_raises_threshold_above_minimum(make_post):
+    rule = FilterRule(min_score=10, min_comments=None, top_score_percent=20)
+    engine = FilterEngine(default_rule=rule)
+    posts = [make_post(str(score), score=score) for score in range(10, 110, 10)]
+
+    # 20% лучших из 10 постов - два поста с наибольшим score
+    assert [post["id"] for post in engine.filter(posts)] == ["90", "100"]
+
+
+def test_top_percent_keeps_ties_at_threshold(make_post):
+    rule = FilterRule(min_score=None, min_comments=None, top_score_percent=10)
+    engine = FilterEngine(default_rule=rule)
+    posts = [make_post(str(index), score=50) for index in range(5)] + [make_post("low", score=1)]
+
+    assert len(engine.filter(posts)) == 5
+
+
+def test_percentiles_are_computed_per_subreddit(make_post):
+    rule = FilterRule(min_score=None, min_comments=None, top_score_percent=50)
+    engine = FilterEngine(default_rule=rule)
+    posts = [
+        make_post("big1", "big", score=1000),
+        make_post("big2", "big", score=500),
+        make_post("small1", "small", score=10),
+        make_post("small2", "small", score=5),
+    ]
+
+    assert [post["id"] for post in engine.filter(posts)] == ["big1", "small1"]
+
+
+def test_subreddit_rule_inherits_default_and_ignores_case(make_post, monkeypatch):
+    monkeypatch.setenv("FILTER_RULES", '{"default": {"min_score": 100}, "ChatGPT": {"min_comments": 5}}')
+    engine = FilterEngine.from_env()
+
+    rule = engine.get_rule("chatgpt")
+    assert (rule.min_score, rule.min_comments) == (100, 5)
+    assert engine.get_rule("other").min_comments == 30
+
+
+def test_no_thresholds_passes_everything_in_window(make_post):
+    engine = FilterEngine(default_rule=FilterRule(min_score=None, min_comments=None, exclude_memes=False))
+    posts = [make_post("old", created_utc=100), make_post("new", created_utc=200)]
+
+    assert [post["id"] for post in engine.filter(posts, start_utc=150, end_utc=250)] == ["new"]
+
+
+def test_memes_are_excluded_only_when_rule_says_so(make_post):
+    engine = FilterEngine(
+        {"funny": FilterRule(min_score=0, min_comments=None, exclude_memes=False)},
+        FilterRule(min_score=0, min_comments=None),
+    )
+    posts = [
+        make_post("a", "serious", title="A meme about transformers"),
+        make_post("b", "funny", title="A meme about transformers"),
+    ]
+
+    assert [post["id"] for post in engine.filter(posts)] == ["b"]
+
+
+@pytest.mark.parametrize("data", [{"top_score_percent": 0}, {"top_comments_percent": 150}, {"min_likes": 1}])
+def test_invalid_rule_is_rejected(data):
+    with pytest.raises(ValueError):
+        FilterRule.from_dict(data)
@@ -0,0 +1,44 @@
+"""Поиск ключевых слов мемов целыми словами (utils.py)."""
+import pytest
+
+from utils import DEFAULT_MEME_KEYWORDS, compile_meme_pattern, has_meme_keyword, is_meme_post
+
+PATTERN = compile_meme_pattern(DEFAULT_MEME_KEYWORDS)
+
+
+@pytest.mark.parametrize("text", [
+    "lol",
+    "This is a MEME",
+    "Best memes of the week",
+    "jokes aside, the paper is good",
+    "Just   kidding!",
+    "(lmao)",
+    "shit post incoming",
+])
+def test_keyword_is_found(text):
+    assert has_meme_keyword(text, PATTERN)
+
+
+@pytest.mark.parametrize("text", [
+    "lollipop benchmark",
+    "controlling the output",
+    "jkrowling",
+    "memes_dataset",
+    "Memento",
+    "fun results",
+    "lolх",
+    "ёjoke",
+])
+def test_keyword_inside_word_is_ignored(text):
+    assert not has_meme_keyword(text, PATTERN)
+
+
+def test_custom_keywords_from_env(monkeypatch, make_post):
+    monkeypatch.setenv("MEME_KEYWORDS", "satire, parody")
+
+    assert is_meme_post(make_post("a", title="A parody of benchmarks"))
+    assert not is_meme_post(make_post("b", title="A meme about benchmarks"))
+
+
+def test_flair_marks_meme(make_post):
+    assert is_meme_post(make_post("a", link_flair_text="Funny"), PATTERN)
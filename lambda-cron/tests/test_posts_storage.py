@@ -0,0 +1,80 @@
+"""Запись и чтение файлов постов в формате NDJSON (posts_storage.py, storage.py)."""
+import gzip
+import json
+
+import pytest
+
+from posts_storage import (
+    FORMAT_VERSION,
+    NDJSONS3Writer,
+    encode_ndjson_line,
+    find_posts_s3_key,
+    open_posts_document,
+    open_posts_sink,
+    read_posts_document,
+)
+from storage import get_storage
+
+HEADER = {"date": "2026-01-01", "start_time": 100, "end_time": 200}
+
+
+def posts(count):
+    return [{"id": str(index), "title": f"Пост {index} ✨", "score": index} for index in range(count)]
+
+
+@pytest.mark.parametrize("key", ["data/all_posts_2026-01-01.ndjson", "data/all_posts_2026-01-01.ndjson.gz"])
+def test_round_trip(local_storage, key):
+    with open_posts_sink(key, HEADER) as sink:
+        sink.write_many(posts(250))
+        sink.write({"id": "last", "title": "", "score": 0})
+        sink.close({"total_posts": sink.records_written})
+
+    document = read_posts_document(key)
+
+    assert document["posts"] == posts(250) + [{"id": "last", "title": "", "score": 0}]
+    assert document["total_posts"] == 251
+    assert document["format_version"] == FORMAT_VERSION
+    assert {name: document[name] for name in HEADER} == HEADER
+
+    metadata, streamed = open_posts_document(key)
+    assert metadata["date"] == HEADER["date"]
+    assert [post["id"] for post in streamed] == [post["id"] for post in document["posts"]]
+
+
+def test_gzip_key_is_compressed(local_storage):
+    key = "data/all_posts_2026-01-01.ndjson.gz"
+    with NDJSONS3Writer(key, HEADER) as writer:
+        writer.write_many(posts(10))
+        writer.close()
+
+    lines = gzip.decompress(get_storage().get(key)).decode("utf-8").splitlines()
+    assert len(lines) == 12
+    assert json.loads(lines[0])["_header"]["date"] == HEADER["date"]
+
+
+def test_newer_format_version_is_rejected(local_storage):
+    key = "data/all_posts_2026-01-01.ndjson"
+    get_storage().put(key, encode_ndjson_line({"_header": {"format_version": FORMAT_VERSION + 1}}))
+
+    with pytest.raises(ValueError):
+        read_posts_document(key)
+
+
+def test_abort_leaves_no_object(local_storage):
+    key = "data/all_posts_2026-01-01.ndjson"
+    with pytest.raises(RuntimeError):
+        with open_posts_sink(key, HEADER) as sink:
+            sink.write_many(posts(5))
+            raise RuntimeError("сбой сбора")
+
+    assert get_storage().head(key) is None
+
+
+def test_posts_key_comes_from_index(local_storage, monkeypatch):
+    monkeypatch.setenv("POSTS_GZIP", "false")
+    assert find_posts_s3_key("2026-01-01") == "data/all_posts_2026-01-01.ndjson"
+
+    # День, записанный со сжатием, читается по ключу из индекса
+    index = {"all_posts_s3_key": "data/all_posts_2026-01-01.ndjson.gz"}
+    get_storage().put("data/posts_2026-01-01.json", json.dumps(index).encode("utf-8"))
+    assert find_posts_s3_key("2026-01-01") == "data/all_posts_2026-01-01.ndjson.gz"
@@ -0,0 +1,25 @@
+"""Группировка текстов в бюджет токенов (prompt_packer.py)."""
+from prompt_packer import count_tokens, split_texts
+
+
+def test_groups_fit_budget_and_keep_order():
+    texts = [f"тема {index} " * 20 for index in range(10)]
+    budget = count_tokens(texts[0]) * 3
+
+    groups = split_texts(texts, budget)
+
+    assert [text for group in groups for text in group] == texts
+    assert all(sum(map(count_tokens, group)) <= budget for group in groups)
+    assert len(groups) == 4
+
+
+def test_every_group_but_last_has_two_texts_even_over_budget():
+    texts = ["x" * 400] * 5
+
+    groups = split_texts(texts, budget_tokens=10)
+
+    assert [len(group) for group in groups] == [2, 2, 1]
+
+
+def test_small_texts_form_one_group():
+    assert split_texts(["a", "b", "c"], budget_tokens=1000) == [["a", "b", "c"]]
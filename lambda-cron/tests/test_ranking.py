@@ -0,0 +1,60 @@
+"""Порядок локального ранжирования постов (ranking.py)."""
+from ranking import RankingConfig, rank_posts
+
+
+def ids(ranked):
+    return {subreddit: [post["id"] for post in posts] for subreddit, posts in ranked.items()}
+
+
+def test_posts_are_ranked_per_subreddit_by_weight(make_post):
+    posts = [
+        make_post("a1", "a", score=10, num_comments=10),
+        make_post("b1", "b", score=5, num_comments=0),
+        make_post("a2", "a", score=100, num_comments=0),
+        make_post("a3", "a", score=0, num_comments=50),
+    ]
+
+    assert ids(rank_posts(posts, RankingConfig())) == {"a": ["a2", "a3", "a1"], "b": ["b1"]}
+
+
+def test_ties_are_broken_by_score_comments_and_id(make_post):
+    posts = [
+        make_post("c", score=5, num_comments=5),
+        make_post("b", score=5, num_comments=5),
+        make_post("a", score=0, num_comments=10),
+    ]
+
+    assert ids(rank_posts(posts, RankingConfig())) == {"MachineLearning": ["b", "c", "a"]}
+
+
+def test_top_n_and_weights(make_post):
+    posts = [make_post(str(index), score=index, num_comments=10 - index) for index in range(10)]
+    config = RankingConfig(top_n=3, score_weight=0.0, comments_weight=1.0)
+
+    assert ids(rank_posts(posts, config)) == {"MachineLearning": ["0", "1", "2"]}
+
+
+def test_half_life_prefers_fresh_posts(make_post):
+    posts = [
+        make_post("old", score=100, created_utc=0),
+        make_post("new", score=60, created_utc=3600),
+    ]
+
+    assert ids(rank_posts(posts, RankingConfig()))["MachineLearning"] == ["old", "new"]
+    assert ids(rank_posts(posts, RankingConfig(half_life_hours=1)))["MachineLearning"] == ["new", "old"]
+
+
+def test_collapsed_duplicates_rank_by_group_totals(make_post):
+    posts = [
+        make_post("single", score=80),
+        make_post("group", score=50, group_score=120, group_comments=0),
+    ]
+
+    assert ids(rank_posts(posts, RankingConfig()))["MachineLearning"] == ["group", "single"]
+
+
+def test_ranking_config_from_env(monkeypatch):
+    monkeypatch.setenv("TOP_POSTS_LIMIT", "5")
+    monkeypatch.setenv("RANK_HALF_LIFE_HOURS", "12")
+
+    assert RankingConfig.from_env() == RankingConfig(top_n=5, half_life_hours=12.0)
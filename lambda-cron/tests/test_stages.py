@@ -0,0 +1,60 @@
+"""Отметки этапов обработки дня и аренда этапа (stages.py)."""
+from stages import StageRunner
+
+DATE = "2026-01-01"
+
+
+def test_completed_stage_is_skipped_on_rerun(local_storage):
+    calls = []
+    StageRunner(DATE).run("collect", lambda: calls.append(1) or {"posts": 1}, subreddits=["a"])
+
+    # Новый запуск (новый экземпляр) читает отметку из хранилища
+    result = StageRunner(DATE).run("collect", lambda: calls.append(2), subreddits=["a"])
+
+    assert calls == [1]
+    assert result == {"posts": 1}
+
+
+def test_changed_config_reruns_stage_and_invalidates_next(local_storage):
+    runner = StageRunner(DATE)
+    runner.run("collect", lambda: "collected")
+    runner.run("refresh", lambda: "refreshed")
+    runner.run("filter", lambda: "filtered", filter_rules={"min_score": 30})
+
+    runner = StageRunner(DATE)
+    assert runner.is_done("refresh")
+    assert not runner.is_done("filter", filter_rules={"min_score": 50})
+
+    runner.run("filter", lambda: "refiltered", filter_rules={"min_score": 50})
+    assert runner.get_marker("filter")["result"] == "refiltered"
+
+    runner.run("collect", lambda: "recollected", force=True)
+    assert not runner.is_done("refresh")
+
+
+def test_upstream_check_ignores_stage_config(local_storage):
+    runner = StageRunner(DATE)
+    runner.run("filter", lambda: "filtered")
+    assert not runner.is_upstream_done("summarize")
+
+    runner.run("summarize", lambda: "summary", top_posts_mode="single")
+    assert StageRunner(DATE).is_upstream_done("summarize")
+
+    runner.run("filter", lambda: "refiltered", force=True)
+    assert not runner.is_upstream_done("summarize")
+
+
+def test_lease_blocks_until_released_or_expired(local_storage):
+    runner = StageRunner(DATE)
+    lease = runner.acquire_lease("summarize")
+    assert lease is not None
+    assert StageRunner(DATE).acquire_lease("summarize") is None
+
+    # Чужая аренда не снимается
+    runner.release_lease("summarize", "other")
+    assert runner.get_lease("summarize") is not None
+    runner.release_lease("summarize", lease["lease_id"])
+    assert runner.get_lease("summarize") is None
+
+    assert runner.acquire_lease("summarize", seconds=0) is not None
+    assert runner.acquire_lease("summarize") is not None
@@ -0,0 +1,27 @@
+"""Разбор NDJSON из частей объекта (storage.py)."""
+import gzip
+
+import pytest
+
+from posts_storage import encode_ndjson_line
+from storage import iter_ndjson_lines
+
+
+def posts(count):
+    return [{"id": str(index), "title": f"Пост {index} ✨", "score": index} for index in range(count)]
+
+
+@pytest.mark.parametrize("gzipped", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_lines_split_across_chunks(gzipped, chunk_size):
+    records = posts(50)
+    data = b"".join(encode_ndjson_line(record) for record in records) + b"\n"
+    if gzipped:
+        data = gzip.compress(data)
+    chunks = [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+    assert list(iter_ndjson_lines(chunks, gzipped)) == records
+
+
+def test_last_line_without_newline():
+    assert list(iter_ndjson_lines([b'{"a":1}\n{"a"', b':2}'])) == [{"a": 1}, {"a": 2}]
@@ -1,84 +1,114 @@
-"""S3 storage module for fetching static files from AWS S3."""
+"""Storage module for fetching digests and posts from S3 or a local directory."""
 import json
 import os
-from typing import Optional
+from typing import Iterator, Optional
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from .storage import get_storage, iter_ndjson_lines, run_batch
+
+# Posts file extensions: the legacy JSON and the streaming NDJSON
+POSTS_FILE_EXTENSIONS = (".json", ".ndjson", ".ndjson.gz")
+# Highest supported NDJSON format version (the header's format_version field)
+POSTS_FORMAT_VERSION = 1
 
 
 class S3Storage:
-    """Handle S3 operations for the Reddit digest application."""
+    """Handle storage operations for the Reddit digest application.
+
+    The backend (S3 bucket or local directory) is selected by STORAGE_BACKEND.
+    """
     
     def __init__(self, bucket_name: str = None):
-        """Initialize S3 client with the specified bucket."""
+        """Initialize the configured storage backend."""
         # Get bucket name from environment or use default
         self.bucket_name = bucket_name or os.getenv("S3_BUCKET_NAME")
         
         try:
-            # Try to create S3 client with credentials and region
-            region = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
-            self.s3_client = boto3.client('s3', region_name=region)
+            self.storage = get_storage(self.bucket_name)
             # Test connection
-            self.s3_client.head_bucket(Bucket=self.bucket_name)
-            self.available = True
-            print(f"S3 connection successful to bucket: {self.bucket_name} in region: {region}")
-        except (NoCredentialsError, ClientError) as e:
-            print(f"Warning: S3 not available ({e}). Lambda application requires S3 connection.")
-            self.s3_client = None
+            self.available = self.storage.is_available()
+        except Exception as e:
+            print(f"Warning: storage not configured ({e})")
+            self.storage = None
             self.available = False
+
+        if self.available:
+            print(f"Storage connection successful: {self.storage.uri('')}")
+        else:
+            print("Warning: storage not available. Lambda application requires S3 connection.")
     
     def download_json(self, key: str) -> Optional[dict]:
-        """Download and parse JSON file from S3."""
+        """Download and parse JSON file from storage."""
         if not self.available:
             return None
             
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
-            content = response['Body'].read().decode('utf-8')
-            return json.loads(content)
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
+            content = self.storage.get(key)
+            if content is None:
                 return None
-            print(f"Error downloading {key} from S3: {e}")
-            return None
+            return json.loads(content.decode('utf-8'))
         except Exception as e:
             print(f"Unexpected error downloading {key}: {e}")
             return None
     
+    def iter_ndjson(self, key: str) -> Iterator[dict]:
+        """Stream records of an NDJSON (optionally gzip) file from storage."""
+        metadata, chunks = self.storage.stream(key)
+        gzipped = key.endswith(".gz") or metadata["content_encoding"] == "gzip"
+        return iter_ndjson_lines(chunks, gzipped)
+
+    def download_posts(self, key: str) -> Optional[dict]:
+        """Download a posts file in JSON or NDJSON format as a single dict."""
+        if not key.endswith((".ndjson", ".ndjson.gz")):
+            return self.download_json(key)
+
+        if not self.available:
+            return None
+
+        try:
+            document = {}
+            posts = []
+            for record in self.iter_ndjson(key):
+                if "_header" in record:
+                    version = record["_header"].get("format_version", 1)
+                    if version > POSTS_FORMAT_VERSION:
+                        print(f"Unsupported posts format version {version} in {key}")
+                        return None
+                    document.update(record["_header"])
+                elif "_footer" in record:
+                    document.update(record["_footer"])
+                else:
+                    posts.append(record)
+            document["posts"] = posts
+            return document
+        except Exception as e:
+            print(f"Unexpected error downloading {key}: {e}")
+            return None
+
+    def download_posts_many(self, keys: list[str]) -> dict[str, Optional[dict]]:
+        """Download several posts files in parallel over the shared connection pool."""
+        return dict(zip(keys, run_batch(self.download_posts, keys)))
+
     def download_markdown(self, key: str) -> Optional[str]:
-        """Download markdown file from S3."""
+        """Download markdown file from storage."""
         if not self.available:
             return None
             
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
-            content = response['Body'].read().decode('utf-8')
-            return content
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
+            content = self.storage.get(key)
+            if content is None:
                 return None
-            print(f"Error downloading {key} from S3: {e}")
-            return None
+            return content.decode('utf-8')
         except Exception as e:
             print(f"Unexpected error downloading {key}: {e}")
             return None
     
     def list_files(self, prefix: str) -> list[str]:
-        """List all files in S3 with given prefix."""
+        """List all files in storage with given prefix."""
         if not self.available:
             return []
             
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            
-            if 'Contents' not in response:
-                return []
-                
-            return [obj['Key'] for obj in response['Contents']]
+            return self.storage.list_keys(prefix)
         except Exception as e:
             print(f"Error listing files with prefix {prefix}: {e}")
             return []
@@ -0,0 +1,623 @@
+"""
+Shared storage access layer for all Lambda functions.
+
+The backend is selected by the STORAGE_BACKEND environment variable: "s3"
+(default, bucket S3_BUCKET_NAME) or "local" (directory LOCAL_STORAGE_DIR,
+for running and profiling without AWS). Keys are the same for both.
+
+The code is the same in lambda_collect, lambda_summarize and lambda-web/src
+(documented in English here): the functions are packaged separately, so
+the module is copied into each package.
+"""
+import json
+import mimetypes
+import os
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+# Client connection pool size and the maximum parallelism of batch operations:
+# requests beyond the pool size would wait for a free connection
+MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+
+DEFAULT_LOCAL_STORAGE_DIR = "local_storage"
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+NOT_FOUND_CODES = {"404", "NoSuchKey", "NotFound"}
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Return the module-wide S3 client.
+
+    The client is created once per process and reused across warm Lambda
+    invocations, so credentials, endpoints and pooled TLS connections are
+    not set up again for every request. The client is thread-safe. Retries
+    in adaptive mode also throttle requests on SlowDown/Throttling responses.
+
+    boto3 is imported when the client is created: with local storage
+    (STORAGE_BACKEND=local) the functions and the web app run without
+    loading it.
+
+    Returns:
+        botocore.client.S3: S3 client
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+
+                config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": MAX_ATTEMPTS, "mode": "adaptive"},
+                    tcp_keepalive=True,
+                )
+                # The default boto3 session is not thread-safe when creating clients
+                _s3_client = boto3.session.Session().client(
+                    "s3", region_name=os.environ.get("AWS_DEFAULT_REGION"), config=config
+                )
+    return _s3_client
+
+
+def get_bucket_name(bucket_name: str = None) -> str:
+    """
+    Return the bucket name.
+
+    Args:
+        bucket_name: Bucket name (defaults to the environment variable)
+
+    Returns:
+        str: Bucket name
+
+    Raises:
+        ValueError: The bucket name is not set
+    """
+    bucket_name = bucket_name or os.environ.get("S3_BUCKET_NAME")
+    if not bucket_name:
+        raise ValueError("S3_BUCKET_NAME is not set in the environment")
+    return bucket_name
+
+
+def is_not_found(error: Exception) -> bool:
+    """Check whether an S3 error means the key does not exist."""
+    # botocore.exceptions.ClientError without importing botocore: client errors carry a response dict
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in NOT_FOUND_CODES
+
+
+class StorageBackend:
+    """
+    Object storage interface.
+
+    Object metadata (head) is a dict with size, content_type,
+    content_encoding and last_modified. A missing key is reported as None
+    on reads; other errors are raised.
+    """
+
+    name = ""
+
+    def is_available(self) -> bool:
+        """Check that the storage is reachable."""
+        raise NotImplementedError
+
+    def uri(self, key: str) -> str:
+        """Return the object location for log messages."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes | None:
+        """Return the object body, or None if the key does not exist."""
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        """Return object bytes from start to end inclusive (to the end if end is not set)."""
+        raise NotImplementedError
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        """
+        Open an object for streaming reads.
+
+        Returns:
+            tuple: (object metadata, iterator over body chunks)
+        """
+        raise NotImplementedError
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        """Store a whole object."""
+        raise NotImplementedError
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        """Return object metadata, or None if the key does not exist."""
+        raise NotImplementedError
+
+    def list_keys(self, prefix: str) -> list[str]:
+        """Return the sorted keys with the given prefix."""
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        """
+        Return the keys with the given prefix along with their size and modification time.
+
+        Size and time come with the listing response, so no head request
+        per key is needed.
+
+        Returns:
+            dict: Key -> {"size", "last_modified"} in key order
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Delete an object (a missing key is not an error)."""
+        raise NotImplementedError
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        """Start a multipart upload and return its ID."""
+        raise NotImplementedError
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        """Upload the next part and return its descriptor for completing the upload."""
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        """Assemble the object from the uploaded parts."""
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """Abort the upload and delete the uploaded parts."""
+        raise NotImplementedError
+
+
+class S3Backend(StorageBackend):
+    """Storage in an S3 bucket through the shared get_s3_client client."""
+
+    name = "s3"
+
+    def __init__(self, bucket_name: str = None):
+        self.bucket_name = get_bucket_name(bucket_name)
+        self.client = get_s3_client()
+
+    def is_available(self) -> bool:
+        try:
+            self.client.head_bucket(Bucket=self.bucket_name)
+            return True
+        except Exception as e:
+            print(f"❌ Bucket {self.bucket_name} is not available: {e}")
+            return False
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket_name}/{key}"
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key, Range=byte_range)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            # Range starts past the end of the object
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+            raise
+        return response["Body"].read()
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        return self._metadata(response), response["Body"].iter_chunks(chunk_size=chunk_size)
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        self.client.put_object(
+            Bucket=self.bucket_name, Key=key, Body=body, **self._object_params(content_type, content_encoding)
+        )
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+        return self._metadata(response)
+
+    def list_keys(self, prefix: str) -> list[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        return [
+            item["Key"]
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        ]
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        return {
+            item["Key"]: {"size": item["Size"], "last_modified": item["LastModified"]}
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        }
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, **self._object_params(content_type, content_encoding)
+        )
+        return response["UploadId"]
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    @staticmethod
+    def _object_params(content_type: str, content_encoding: str = None) -> dict[str, str]:
+        params = {"ContentType": content_type}
+        if content_encoding:
+            params["ContentEncoding"] = content_encoding
+        return params
+
+    @staticmethod
+    def _metadata(response: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "size": response.get("ContentLength"),
+            "content_type": response.get("ContentType"),
+            "content_encoding": response.get("ContentEncoding"),
+            "last_modified": response.get("LastModified"),
+        }
+
+
+class LocalBackend(StorageBackend):
+    """
+    Storage in a local directory: the key is the relative file path.
+
+    Content type and encoding are not stored but derived from the key
+    extension (.gz means gzip). Objects are written to a temporary file and
+    renamed, so readers never see partially written files.
+    """
+
+    name = "local"
+
+    def __init__(self, root_dir: str = None):
+        self.root_dir = os.path.abspath(
+            root_dir or os.environ.get("LOCAL_STORAGE_DIR") or DEFAULT_LOCAL_STORAGE_DIR
+        )
+
+    def is_available(self) -> bool:
+        return os.path.isdir(self.root_dir)
+
+    def uri(self, key: str) -> str:
+        return self._path(key)
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key: str, start: int, end: int = None) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as file:
+                file.seek(start)
+                return file.read() if end is None else file.read(max(end - start + 1, 0))
+        except FileNotFoundError:
+            return None
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[dict[str, Any], Iterator[bytes]]:
+        metadata = self.head(key)
+        if metadata is None:
+            raise FileNotFoundError(f"Object not found: {self.uri(key)}")
+        return metadata, self._iter_file(self._path(key), chunk_size)
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json", content_encoding: str = None) -> None:
+        path = self._path(key)
+        temp_path = self._temp_path(path)
+        with open(temp_path, "wb") as file:
+            file.write(body)
+        os.replace(temp_path, path)
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return {
+            "size": stat.st_size,
+            "content_type": mimetypes.guess_type(key.removesuffix(".gz"))[0] or "application/octet-stream",
+            "content_encoding": "gzip" if key.endswith(".gz") else None,
+            "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+    def list_keys(self, prefix: str) -> list[str]:
+        return sorted(key for key, _ in self._walk(prefix))
+
+    def list_objects(self, prefix: str) -> dict[str, dict[str, Any]]:
+        objects = {}
+        for key, path in sorted(self._walk(prefix)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            objects[key] = {
+                "size": stat.st_size,
+                "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            }
+        return objects
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def create_multipart_upload(self, key: str, content_type: str, content_encoding: str = None) -> str:
+        temp_path = self._temp_path(self._path(key))
+        open(temp_path, "wb").close()
+        return temp_path
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict[str, Any]:
+        # Parts are sent in order, so they are appended to the file
+        with open(upload_id, "ab") as file:
+            file.write(body)
+        return {"PartNumber": part_number}
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict[str, Any]]) -> None:
+        os.replace(upload_id, self._path(key))
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        try:
+            os.remove(upload_id)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, key))
+        if os.path.commonpath([path, self.root_dir]) != self.root_dir:
+            raise ValueError(f"Key points outside the storage: {key}")
+        return path
+
+    def _walk(self, prefix: str) -> Iterator[tuple[str, str]]:
+        # Only the prefix directory is walked, not the whole storage
+        prefix_dir = os.path.join(self.root_dir, os.path.dirname(prefix))
+        for dir_path, _, file_names in os.walk(prefix_dir):
+            for file_name in file_names:
+                if file_name.endswith(".part"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                key = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    yield key, path
+
+    @staticmethod
+    def _temp_path(path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.part"
+
+    @staticmethod
+    def _iter_file(path: str, chunk_size: int) -> Iterator[bytes]:
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+
+_backends: dict[tuple[str, str | None], StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage(bucket_name: str = None) -> StorageBackend:
+    """
+    Return the storage selected by the STORAGE_BACKEND environment variable.
+
+    Instances are cached per process. The bucket name only applies to S3.
+
+    Args:
+        bucket_name: S3 bucket name (defaults to the environment variable)
+
+    Returns:
+        StorageBackend: Storage
+
+    Raises:
+        ValueError: Unknown STORAGE_BACKEND value or the bucket is not set
+    """
+    backend_name = os.environ.get("STORAGE_BACKEND", "s3").lower()
+    if backend_name == "local":
+        cache_key = (backend_name, os.environ.get("LOCAL_STORAGE_DIR"))
+    elif backend_name == "s3":
+        cache_key = (backend_name, get_bucket_name(bucket_name))
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend_name}")
+
+    backend = _backends.get(cache_key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(cache_key)
+            if backend is None:
+                backend = LocalBackend() if backend_name == "local" else S3Backend(cache_key[1])
+                _backends[cache_key] = backend
+    return backend
+
+
+def get_object(key: str, bucket_name: str = None) -> bytes | None:
+    """
+    Download a whole object.
+
+    Args:
+        key: Object key
+        bucket_name: Bucket name (defaults to the environment variable)
+
+    Returns:
+        bytes | None: Object body, or None if the key does not exist
+    """
+    return get_storage(bucket_name).get(key)
+
+
+def put_object(key: str, body: bytes, content_type: str = "application/json", bucket_name: str = None) -> None:
+    """
+    Upload an object.
+
+    Args:
+        key: Object key
+        body: Object body
+        content_type: Content MIME type
+        bucket_name: Bucket name (defaults to the environment variable)
+    """
+    get_storage(bucket_name).put(key, body, content_type)
+
+
+def head_object(key: str, bucket_name: str = None) -> dict[str, Any] | None:
+    """
+    Return object metadata.
+
+    Args:
+        key: Object key
+        bucket_name: Bucket name (defaults to the environment variable)
+
+    Returns:
+        dict | None: Metadata, or None if the key does not exist
+    """
+    return get_storage(bucket_name).head(key)
+
+
+def run_batch(func: Callable[[T], R], items: Iterable[T], max_workers: int = None) -> list[R]:
+    """
+    Run a function for every item in parallel in a thread pool.
+
+    S3 requests are network-bound, so threads run in parallel and the
+    shared client reuses pooled connections. The exception of the first
+    failed call is raised.
+
+    Args:
+        func: Single request function
+        items: Items
+        max_workers: Maximum parallel requests (defaults to MAX_POOL_CONNECTIONS)
+
+    Returns:
+        list: Results in item order
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+
+    max_workers = min(max_workers or MAX_POOL_CONNECTIONS, len(items))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def get_objects(keys: Iterable[str], bucket_name: str = None, max_workers: int = None) -> dict[str, bytes | None]:
+    """
+    Download several objects in parallel.
+
+    Args:
+        keys: Object keys
+        bucket_name: Bucket name (defaults to the environment variable)
+        max_workers: Maximum parallel requests
+
+    Returns:
+        dict: Bodies by key (None for missing keys)
+    """
+    storage = get_storage(bucket_name)
+    keys = list(keys)
+    return dict(zip(keys, run_batch(storage.get, keys, max_workers)))
+
+
+def put_objects(
+    objects: dict[str, bytes],
+    content_type: str = "application/json",
+    bucket_name: str = None,
+    max_workers: int = None,
+) -> None:
+    """
+    Upload several objects in parallel.
+
+    Args:
+        objects: Bodies by key
+        content_type: Content MIME type
+        bucket_name: Bucket name (defaults to the environment variable)
+        max_workers: Maximum parallel requests
+    """
+    storage = get_storage(bucket_name)
+    run_batch(lambda item: storage.put(item[0], item[1], content_type), objects.items(), max_workers)
+
+
+def head_objects(
+    keys: Iterable[str], bucket_name: str = None, max_workers: int = None
+) -> dict[str, dict[str, Any] | None]:
+    """
+    Request metadata of several objects in parallel.
+
+    Args:
+        keys: Object keys
+        bucket_name: Bucket name (defaults to the environment variable)
+        max_workers: Maximum parallel requests
+
+    Returns:
+        dict: Metadata by key (None for missing keys)
+    """
+    storage = get_storage(bucket_name)
+    keys = list(keys)
+    return dict(zip(keys, run_batch(storage.head, keys, max_workers)))
+
+
+def iter_ndjson_lines(chunks: Iterable[bytes], gzipped: bool = False) -> Iterator[dict[str, Any]]:
+    """
+    Parse NDJSON from a sequence of byte chunks.
+
+    The only NDJSON parser: the functions' posts_storage.py and the web
+    app's s3_storage.py both use it.
+
+    Args:
+        chunks: Object chunks in read order
+        gzipped: The chunks are gzip compressed
+
+    Yields:
+        dict: Object records
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+
+    pending = b""
+    for chunk in chunks:
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        # The chunk's lines are parsed by a single json.loads call as an array:
+        # this is 1.5-2x faster than one call per line
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            yield from json.loads(b"[" + b",".join(lines) + b"]")
+
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending.strip():
+        yield json.loads(pending)
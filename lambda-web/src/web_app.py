@@ -10,7 +10,7 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from starlette.requests import Request
 
-from .s3_storage import s3_storage
+from .s3_storage import POSTS_FILE_EXTENSIONS, s3_storage
 
 
 app = FastAPI(title="Reddit AI Digest")
@@ -39,7 +39,6 @@ def get_stats() -> dict[str, int]:
     """Get overall statistics for the site."""
     total_digests = 0
     total_posts = 0
-    subreddits = set()
 
     # Get configured subreddits from environment or default
     import os
@@ -62,27 +61,21 @@ def get_stats() -> dict[str, int]:
     total_digests = len([f for f in s3_digest_files if f.endswith('.md')])
 
     # Count posts from S3 data files
-    s3_data_files = s3_storage.list_files("data/posts_")
-    for file_key in s3_data_files:
-        if file_key.endswith('.json'):
-            try:
-                data = s3_storage.download_json(file_key)
-                if data:
-                    # Add total posts count
-                    if "total_posts_collected" in data:
-                        total_posts += data["total_posts_collected"]
-                    elif "total_posts" in data:
-                        total_posts += data["total_posts"]
-                    elif "posts" in data:
-                        total_posts += len(data["posts"])
-
-                    # Extract unique subreddits (only configured ones)
-                    if "posts" in data:
-                        for post in data["posts"]:
-                            if "subreddit" in post and post["subreddit"] in configured_list:
-                                subreddits.add(post["subreddit"])
-            except Exception:
-                continue
+    s3_data_files = [
+        file_key for file_key in s3_storage.list_files("data/posts_")
+        if file_key.endswith(POSTS_FILE_EXTENSIONS)
+    ]
+    for data in s3_storage.download_posts_many(s3_data_files).values():
+        if not data:
+            continue
+
+        # Add total posts count
+        if "total_posts_collected" in data:
+            total_posts += data["total_posts_collected"]
+        elif "total_posts" in data:
+            total_posts += data["total_posts"]
+        elif "posts" in data:
+            total_posts += len(data["posts"])
 
     return {
         "total_digests": total_digests,
@@ -132,10 +125,27 @@ def get_digest_list() -> list[dict[str, str]]:
     return digests
 
 
+def load_posts_data(date: str) -> dict | None:
+    """Load the filtered posts file for a date.
+
+    The filtered posts index is always stored as data/posts_{date}.json,
+    so it is read with a single GET. Objects are listed only for older
+    days whose filtered posts were written as NDJSON.
+    """
+    data = s3_storage.download_posts(f"data/posts_{date}.json")
+    if data is not None:
+        return data
+
+    for file_key in s3_storage.list_files(f"data/posts_{date}."):
+        if file_key.endswith(POSTS_FILE_EXTENSIONS):
+            return s3_storage.download_posts(file_key)
+    return None
+
+
 def get_digest_stats(date: str) -> dict:
     """Get statistics for a specific digest date."""
     # Get data from S3
-    data = s3_storage.download_json(f"data/posts_{date}.json")
+    data = load_posts_data(date)
 
     if data is None:
         return {}
@@ -153,7 +163,12 @@ def get_digest_stats(date: str) -> dict:
             "grok",
         ]
 
-        if "posts" in data:
+        if "subreddit_counts" in data:
+            # Index of filtered posts already has per-subreddit counts
+            for subreddit, count in data["subreddit_counts"].items():
+                if subreddit in configured_subreddits:
+                    subreddit_counts[subreddit] = count
+        elif "posts" in data:
             for post in data["posts"]:
                 subreddit = post.get("subreddit", "unknown")
                 if subreddit in configured_subreddits:
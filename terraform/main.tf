@@ -25,10 +25,16 @@ module "lambda" {
   # Переменные окружения для Lambda
   env_variables = {
     # Reddit API
-    REDDIT_CLIENT_ID     = var.reddit_client_id
-    REDDIT_CLIENT_SECRET = var.reddit_client_secret
-    REDDIT_USER_AGENT    = var.reddit_user_agent
-    REDDIT_SUBREDDITS    = local.reddit_subreddits_string
+    REDDIT_CLIENT_ID           = var.reddit_client_id
+    REDDIT_CLIENT_SECRET       = var.reddit_client_secret
+    REDDIT_USER_AGENT          = var.reddit_user_agent
+    REDDIT_SUBREDDITS          = local.reddit_subreddits_string
+    REDDIT_MAX_WORKERS         = tostring(var.reddit_max_workers)
+    REDDIT_REQUESTS_PER_MINUTE = tostring(var.reddit_requests_per_minute)
+    COLLECT_MODE               = var.collect_mode
+    FANOUT_SHARD_SIZE          = tostring(var.fanout_shard_size)
+    FANOUT_SHARD_TIMEOUT       = tostring(var.fanout_shard_timeout)
+    FILTER_RULES               = var.filter_rules
     
     # OpenAI API
     OPENAI_API_KEY = var.openai_api_key
@@ -118,6 +118,8 @@ resource "aws_lambda_function" "collect" {
   environment {
     variables = merge(var.env_variables, {
       LAMBDA_SUMMARIZE_FUNCTION_NAME = aws_lambda_function.summarize.function_name
+      # Аренда запущенной суммаризации действует не дольше таймаута функции
+      SUMMARIZE_LEASE_SECONDS        = tostring(var.lambda_timeout)
     })
   }
 
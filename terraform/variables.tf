@@ -42,6 +42,42 @@ variable "reddit_subreddits" {
   default     = ["ChatGPT", "OpenAI", "ClaudeAI", "Bard", "GeminiAI", "DeepSeek", "grok"]
 }
 
+variable "reddit_max_workers" {
+  description = "Количество сабреддитов, собираемых параллельно (1 - последовательный сбор)"
+  type        = number
+  default     = 1
+}
+
+variable "reddit_requests_per_minute" {
+  description = "Общий лимит запросов к Reddit API в минуту для всех воркеров сбора"
+  type        = number
+  default     = 90
+}
+
+variable "collect_mode" {
+  description = "Режим сбора: single - одной функцией, fanout - шардами сабреддитов в отдельных вызовах Lambda"
+  type        = string
+  default     = "single"
+}
+
+variable "fanout_shard_size" {
+  description = "Количество сабреддитов в шарде в режиме fanout"
+  type        = number
+  default     = 10
+}
+
+variable "fanout_shard_timeout" {
+  description = "Время ожидания отчета шарда в режиме fanout (секунды); вместе с повтором шарда должно помещаться в lambda_timeout"
+  type        = number
+  default     = 120
+}
+
+variable "filter_rules" {
+  description = "Правила фильтрации постов по сабреддитам (JSON, пустая строка - min_score и min_comments 30 для всех)"
+  type        = string
+  default     = ""
+}
+
 # OpenAI API конфигурация
 variable "openai_api_key" {
   description = "OpenAI API ключ для генерации дайджестов"